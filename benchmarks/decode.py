@@ -0,0 +1,137 @@
+"""Compare opcode decode throughput of the dispatch table against the
+if/elif chain it replaced.
+
+Run with ``python -m benchmarks.decode``."""
+import argparse
+import timeit
+
+from chip8.core import Chip8
+from chip8.dummy_display import DummyDisplay
+
+# Opcodes that leave PC, stack and memory alone so they can be decoded
+# repeatedly: loads, ALU ops, I arithmetic and timer reads.
+OPCODES = [
+    0x6012, 0x6134, 0x7001, 0x8010, 0x8011, 0x8012, 0x8013, 0x8014,
+    0x8015, 0x8016, 0x8017, 0x801e, 0xa300, 0xf01e, 0xf007, 0xf015,
+    0xf018, 0xf029, 0x3000, 0x4000, 0x5010, 0x9010,
+]
+
+
+class LegacyChip8(Chip8):
+    """Chip8 decoding through the original nested if/elif chain."""
+
+    def decode_instruction(self, instruction):
+        _1 = (instruction >> 12) & 0xf
+        _2 = (instruction >> 8) & 0xf
+        _3 = (instruction >> 4) & 0xf
+        _4 = instruction & 0xf
+
+        if _1 == 0:
+            if _3 == 0xe & _4 == 0xe:
+                self.ret()
+            elif _3 == 0xe:
+                self.cls()
+            else:
+                self.call_rca(instruction & 0x0fff)
+        elif _1 == 1:
+            self.jump(instruction & 0x0fff)
+        elif _1 == 2:
+            self.call(instruction & 0x0fff)
+        elif _1 == 3:
+            self.skipinst_vx_eq_nn(_2, instruction & 0x00ff)
+        elif _1 == 4:
+            self.skipinst_vx_neq_nn(_2, instruction & 0x00ff)
+        elif _1 == 5:
+            self.skipinst_vx_eq_vy(_2, _3)
+        elif _1 == 6:
+            self.set_vx_to_nn(_2, instruction & 0x00ff)
+        elif _1 == 7:
+            self.add_nn_to_vx(_2, instruction & 0x00ff)
+        elif _1 == 8:
+            if _4 == 0:
+                self.set_vx_to_vy(_2, _3)
+            elif _4 == 1:
+                self.set_vx_to_vx_or_vy(_2, _3)
+            elif _4 == 2:
+                self.set_vx_to_vx_and_vy(_2, _3)
+            elif _4 == 3:
+                self.set_vx_to_vx_xor_vy(_2, _3)
+            elif _4 == 4:
+                self.add_vy_to_vx(_2, _3)
+            elif _4 == 5:
+                self.sub_vy_from_vx(_2, _3)
+            elif _4 == 6:
+                self.shift_r_vy_to_vx(_2, _3)
+            elif _4 == 7:
+                self.set_vx_to_vy_min_vx(_2, _3)
+            elif _4 == 0xe:
+                self.shift_l_vy_to_vx(_2, _3)
+            else:
+                raise RuntimeError('Failed to decode instruction')
+        elif _1 == 9:
+            self.skip_inst_if_vx_neq_vy(_2, _3)
+        elif _1 == 0xa:
+            self.set_i_to_nnn(instruction & 0x0fff)
+        elif _1 == 0xb:
+            self.jump_to_v0_plus_nnn(instruction & 0xfff)
+        elif _1 == 0xc:
+            self.set_vx_rand_and_nn(_2, instruction & 0x00ff)
+        elif _1 == 0xd:
+            self.draw_sprite(_2, _3, _4)
+        elif _1 == 0xe and _3 == 0x9:
+            self.skip_inst_if_vx_pressed(_2)
+        elif _1 == 0xe and _3 == 0xa:
+            self.skip_inst_if_vx_not_pressed(_2)
+        elif _1 == 0xf:
+            if _4 == 7:
+                self.set_vx_to_delay_timer(_2)
+            elif _4 == 0xa:
+                self.wait_key_store_vx(_2)
+            elif _4 == 5 and _3 == 1:
+                self.set_delay_timer_to_vx(_2)
+            elif _4 == 8:
+                self.set_sound_timer_to_vx(_2)
+            elif _4 == 0xe:
+                self.add_vx_to_i(_2)
+            elif _4 == 9:
+                self.set_i_to_sprite_in_vx(_2)
+            elif _4 == 3:
+                self.set_i_to_bcd(_2)
+            elif _4 == 5 and _3 == 5:
+                self.reg_dump_to_mem(_2)
+            elif _4 == 5 and _3 == 6:
+                self.reg_load_from_mem(_2)
+            else:
+                raise RuntimeError('Failed to decode instruction')
+        else:
+            raise RuntimeError('Failed to decode instruction')
+
+
+def decode_rate(cls, rounds):
+    """Return decoded instructions per second for a Chip8 class."""
+    machine = cls(DummyDisplay())
+    decode = machine.decode_instruction
+    opcodes = OPCODES
+
+    def run():
+        for opcode in opcodes:
+            decode(opcode)
+
+    elapsed = min(timeit.repeat(run, number=rounds, repeat=5))
+    return rounds * len(opcodes) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+
+    legacy = decode_rate(LegacyChip8, args.rounds)
+    table = decode_rate(Chip8, args.rounds)
+    print(f'if/elif chain:  {legacy:12,.0f} instructions/s')
+    print(f'dispatch table: {table:12,.0f} instructions/s')
+    print(f'speedup:        {table / legacy:12.2f}x')
+
+
+if __name__ == '__main__':
+    main()
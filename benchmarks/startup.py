@@ -0,0 +1,90 @@
+"""Measure time to first instruction of a headless run in a fresh
+interpreter: importing chip8.core, creating a machine, loading a ROM and
+executing one instruction. Plain, seeded and SUPER-CHIP machines are each
+measured, as they dispatch through different tables.
+
+Fails if the best of several runs of any exceeds the budget, or if the
+headless path imported a display backend.
+
+Run with ``python -m benchmarks.startup``."""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# About 35ms was measured for each machine; the margin covers noisy hosts.
+DEFAULT_BUDGET = 0.05
+DEFAULT_RUNS = 5
+
+# Machines to measure, as the mode and seed they are created with.
+MACHINES = (
+    ('chip8', None),
+    ('chip8', 0),
+    ('schip', None),
+)
+
+# Modules the headless path must not load.
+FORBIDDEN_MODULES = ('pygame', 'curses', 'numpy')
+
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+from chip8.core import Chip8
+from chip8.headless_display import HeadlessDisplay
+mode, seed = json.loads(sys.argv[3])
+machine = Chip8(HeadlessDisplay(), seed=seed, mode=mode)
+machine.load_rom_file(sys.argv[1])
+machine.execute_cycle()
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'seconds': elapsed,
+    'modules': [name for name in json.loads(sys.argv[2]) if name in sys.modules],
+}))
+'''
+
+
+def measure(rom_path, mode='chip8', seed=None):
+    """Return the time to first instruction in a fresh interpreter and the
+    forbidden modules it loaded."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output(
+        [sys.executable, '-c', _PROBE, rom_path, json.dumps(FORBIDDEN_MODULES),
+         json.dumps([mode, seed])],
+        cwd=root)
+    result = json.loads(output)
+    return result['seconds'], result['modules']
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET,
+                        help='seconds allowed to the first instruction')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS)
+    options = parser.parse_args(args)
+
+    failed = False
+    with tempfile.NamedTemporaryFile(suffix='.ch8') as rom:
+        rom.write(b'\x12\x00')  # goto 0x200
+        rom.flush()
+        for mode, seed in MACHINES:
+            results = [measure(rom.name, mode, seed)
+                       for _ in range(options.runs)]
+            best = min(seconds for seconds, _ in results)
+            loaded = sorted(set(name for _, modules in results
+                                for name in modules))
+            label = mode if seed is None else f'seeded {mode}'
+            print(f'{label} time to first instruction: {best * 1e3:.1f}ms '
+                  f'(budget {options.budget * 1e3:.0f}ms)')
+            if loaded:
+                print(f'FAIL headless start imported {", ".join(loaded)}')
+                failed = True
+            if best > options.budget:
+                print('FAIL over budget')
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""Benchmark suite running synthetic ROMs that each stress one area of the
+emulator, plus the cost of decoding alone.
+
+Results are written as JSON. Each rate is compared against a baseline file
+and the run fails if any falls more than the tolerance below its baseline,
+or if there is no baseline to compare against. Baselines depend on the
+host, so none is shipped; save one on the machine that runs the suite.
+
+Run with ``python -m benchmarks.suite``; ``--save-baseline`` stores the
+results as the new baseline."""
+import argparse
+import json
+import os
+import sys
+import time
+
+from chip8.core import CHIP8, SCHIP, Chip8, decode
+from chip8.headless_display import HeadlessDisplay
+from chip8.translator import TranslationCache
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+DEFAULT_TOLERANCE = 0.15
+
+# Instructions run between timer ticks, as at the default 700 Hz speed.
+FRAME_CYCLES = 700 // 60
+
+
+def assemble(*opcodes):
+    return b''.join(opcode.to_bytes(2, 'big') for opcode in opcodes)
+
+
+# Each ROM loops forever over the instructions it stresses.
+ROMS = {
+    # 8XYN arithmetic and logic.
+    'alu': assemble(
+        0x6001,  # 200: V0 = 1
+        0x6103,  # 202: V1 = 3
+        0x8014,  # 204: V0 += V1
+        0x8011,  # 206: V0 |= V1
+        0x8012,  # 208: V0 &= V1
+        0x8013,  # 20A: V0 ^= V1
+        0x8015,  # 20C: V0 -= V1
+        0x8017,  # 20E: V0 = V1 - V0
+        0x8016,  # 210: V0 = V1 >> 1
+        0x801E,  # 212: V0 = V1 << 1
+        0x8010,  # 214: V0 = V1
+        0x7105,  # 216: V1 += 5
+        0x1204,  # 218: goto 204
+    ),
+    # Recursion eight calls deep, then unwinding.
+    'call': assemble(
+        0x6000,  # 200: V0 = 0
+        0x2206,  # 202: call 206
+        0x1200,  # 204: goto 200
+        0x7001,  # 206: V0 += 1
+        0x3008,  # 208: skip if V0 == 8
+        0x2206,  # 20A: call 206
+        0x00EE,  # 20C: return
+    ),
+    # Font sprites drawn all over the screen.
+    'sprites': assemble(
+        0x6000,  # 200: V0 = 0
+        0xF029,  # 202: I = sprite of V0
+        0xD125,  # 204: draw 5 rows at (V1, V2)
+        0x7105,  # 206: V1 += 5
+        0x7203,  # 208: V2 += 3
+        0x7001,  # 20A: V0 += 1
+        0x1202,  # 20C: goto 202
+    ),
+    # Register dumps and loads of all sixteen registers.
+    'memory': assemble(
+        0xA300,  # 200: I = 300
+        0xFF55,  # 202: dump V0-VF at I
+        0xA300,  # 204: I = 300
+        0xFF65,  # 206: load V0-VF from I
+        0x7001,  # 208: V0 += 1
+        0x1200,  # 20A: goto 200
+    ),
+    # Busy-waiting on the delay timer, interpreted.
+    'timers': assemble(
+        0x6002,  # 200: V0 = 2
+        0xF015,  # 202: DT = V0
+        0xF107,  # 204: V1 = DT
+        0x3100,  # 206: skip if V1 == 0
+        0x1204,  # 208: goto 204
+        0x1200,  # 20A: goto 200
+    ),
+    # Large and 16x16 sprites and scrolling in high resolution.
+    'hires': assemble(
+        0x00FF,  # 200: high resolution
+        0x6000,  # 202: V0 = 0
+        0xF030,  # 204: I = large sprite of V0
+        0xD12A,  # 206: draw 10 rows at (V1, V2)
+        0xD120,  # 208: draw 16x16 at (V1, V2)
+        0x7109,  # 20A: V1 += 9
+        0x7205,  # 20C: V2 += 5
+        0x7001,  # 20E: V0 += 1
+        0x00C1,  # 210: scroll down 1
+        0x1204,  # 212: goto 204
+    ),
+}
+
+# The same wait as ``timers``, fast-forwarded by skipping idle loops.
+ROMS['idle'] = ROMS['timers']
+
+# Modes of the ROMs that are not CHIP-8.
+ROM_MODES = {
+    'hires': SCHIP,
+}
+
+# ROMs measuring the interpreter on loops that would otherwise be skipped.
+NO_IDLE_SKIP = frozenset(['timers'])
+
+
+def run_rom(rom, cycles, translate=False, mode=CHIP8, skip_idle_loops=True):
+    """Run a ROM for ``cycles`` instructions, ticking the timers every
+    FRAME_CYCLES, and return the machine and the elapsed time."""
+    display = HeadlessDisplay()
+    machine = Chip8(display, mode=mode)
+    machine.skip_idle_loops = skip_idle_loops
+    machine.load_rom(rom)
+    engine = TranslationCache(machine) if translate else machine
+    run = engine.run
+    tick_timers = machine.tick_timers
+    frames, remainder = divmod(cycles, FRAME_CYCLES)
+    start = time.perf_counter()
+    for _ in range(frames):
+        run(FRAME_CYCLES)
+        tick_timers()
+    run(remainder)
+    return machine, time.perf_counter() - start
+
+
+def decode_rate(rounds):
+    """Return opcodes decoded per second across every opcode."""
+    opcodes = range(0x10000)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for opcode in opcodes:
+            decode(opcode)
+    return rounds * len(opcodes) / (time.perf_counter() - start)
+
+
+def run_suite(cycles=200000, repeat=3, translate=False, decode_rounds=20):
+    """Run every benchmark and return ``{name: rate}``.
+
+    Rates are per second, higher is better; each is the best of ``repeat``
+    runs."""
+    results = {}
+    for name, rom in sorted(ROMS.items()):
+        best = 0.0
+        for _ in range(repeat):
+            machine, elapsed = run_rom(rom, cycles, translate,
+                                       ROM_MODES.get(name, CHIP8),
+                                       name not in NO_IDLE_SKIP)
+            best = max(best, elapsed and cycles / elapsed)
+            if name == 'sprites':
+                draws = machine.display.draws / elapsed
+                results['sprites_draws_per_second'] = max(
+                    draws, results.get('sprites_draws_per_second', 0.0))
+        results[name + '_instructions_per_second'] = best
+    results['decodes_per_second'] = max(
+        decode_rate(decode_rounds) for _ in range(repeat))
+    return results
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Return ``(name, result, baseline)`` for every rate more than
+    ``tolerance`` below its baseline, with a result of None for those that
+    are missing."""
+    regressions = []
+    for name, expected in sorted(baseline.items()):
+        result = results.get(name)
+        if result is None or result < expected * (1 - tolerance):
+            regressions.append((name, result, expected))
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cycles', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--translate', action='store_true',
+                        help='run the ROMs through the translation cache')
+    parser.add_argument('--output', default='-',
+                        help='file to write the JSON results to')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--save-baseline', action='store_true')
+    options = parser.parse_args(args)
+
+    results = run_suite(options.cycles, options.repeat, options.translate)
+    for name, rate in sorted(results.items()):
+        print(f'{name:<36} {rate:14,.0f}', file=sys.stderr)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if options.output == '-':
+        print(output)
+    else:
+        with open(options.output, 'w') as output_file:
+            output_file.write(output + '\n')
+
+    if options.save_baseline:
+        with open(options.baseline, 'w') as baseline_file:
+            baseline_file.write(output + '\n')
+        return 0
+    if not os.path.exists(options.baseline):
+        print(f'FAIL no baseline at {options.baseline}, run with '
+              '--save-baseline first', file=sys.stderr)
+        return 1
+    with open(options.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare(results, baseline, options.tolerance)
+    for name, result, expected in regressions:
+        if result is None:
+            print(f'REGRESSION {name}: missing, baseline {expected:,.0f}',
+                  file=sys.stderr)
+        else:
+            print(f'REGRESSION {name}: {result:,.0f} < {expected:,.0f}',
+                  file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""Static analysis of Chip8 ROMs.
+
+``analyse`` disassembles a ROM by following its control flow from the entry
+point. It finds every reachable instruction, the jump and call targets and
+the basic blocks of the control-flow graph; bytes of the ROM that are never
+reached are taken to be data. ``load`` caches the result on disk under the
+SHA-256 of the ROM, so a ROM is only analysed the first time it is seen.
+
+A PredecodedEngine runs a machine from a table of decoded instructions by
+address, seeded from an analysis, instead of fetching and decoding every
+instruction from memory."""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from chip8.core import PC_START_ADDRESS, decode
+from chip8.translator import MEMORY_WRITES
+
+LOG = logging.getLogger(__name__)
+
+ANALYSIS_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'chip8')
+
+# Handlers after which execution does not carry on with the next instruction
+# and whose successors successors() cannot tell.
+_STOPS = frozenset(['ret', 'call_rca', 'jump_to_v0_plus_nnn'])
+_SKIPS = frozenset([
+    'skipinst_vx_eq_nn',
+    'skipinst_vx_neq_nn',
+    'skipinst_vx_eq_vy',
+    'skip_inst_if_vx_neq_vy',
+    'skip_inst_if_vx_pressed',
+    'skip_inst_if_vx_not_pressed',
+])
+
+
+def successors(address, name, args):
+    """Return the addresses execution may continue at after an instruction.
+
+    Returns are left out, as are BNNN jumps whose target depends on V0."""
+    following = address + 2
+    if name in _STOPS:
+        return []
+    elif name == 'jump':
+        return [args[0]]
+    elif name == 'call':
+        return [args[0], following]
+    elif name in _SKIPS:
+        return [following, following + 2]
+    return [following]
+
+
+class Analysis(object):
+    """The reachable code of a ROM.
+
+    ``instructions`` maps the address of every reachable instruction to its
+    ``(opcode, handler name, operands)``; ``blocks`` maps the start of every
+    basic block to its end address (exclusive) and successors."""
+
+    def __init__(self, sha256, length, instructions, blocks,
+                 start=PC_START_ADDRESS):
+        self.sha256 = sha256
+        self.length = length
+        self.instructions = instructions
+        self.blocks = blocks
+        self.start = start
+        self.jump_targets = set()
+        self.call_targets = set()
+        self.indirect_jumps = set()
+        for address, (_, name, args) in instructions.items():
+            if name == 'jump':
+                self.jump_targets.add(args[0])
+            elif name == 'call':
+                self.call_targets.add(args[0])
+            elif name == 'jump_to_v0_plus_nnn':
+                self.indirect_jumps.add(address)
+
+    def code_regions(self):
+        """Return the ``(start, end)`` address ranges holding code."""
+        regions = []
+        for address in sorted(self.instructions):
+            if regions and address <= regions[-1][1]:
+                regions[-1][1] = max(regions[-1][1], address + 2)
+            else:
+                regions.append([address, address + 2])
+        return [tuple(region) for region in regions]
+
+    def data_regions(self):
+        """Return the ``(start, end)`` address ranges of the ROM never
+        reached as code."""
+        regions = []
+        previous = self.start
+        for start, end in self.code_regions():
+            if start > previous:
+                regions.append((previous, start))
+            previous = max(previous, end)
+        if previous < self.start + self.length:
+            regions.append((previous, self.start + self.length))
+        return regions
+
+    def to_dict(self):
+        return {
+            'version': ANALYSIS_VERSION,
+            'sha256': self.sha256,
+            'length': self.length,
+            'start': self.start,
+            'instructions': [[address, opcode] for address, (opcode, _, _)
+                             in sorted(self.instructions.items())],
+            'blocks': [[start, end, successors] for start, (end, successors)
+                       in sorted(self.blocks.items())],
+        }
+
+    @classmethod
+    def from_dict(cls, fields):
+        if fields.get('version') != ANALYSIS_VERSION:
+            raise ValueError('Unsupported analysis version {}'.format(
+                fields.get('version')))
+        instructions = {address: (opcode,) + decode(opcode)
+                        for address, opcode in fields['instructions']}
+        blocks = {start: (end, successors)
+                  for start, end, successors in fields['blocks']}
+        return cls(fields['sha256'], fields['length'], instructions, blocks,
+                   fields['start'])
+
+
+def analyse(rom, start=PC_START_ADDRESS):
+    """Follow the control flow of a ROM loaded at ``start``."""
+    end = start + len(rom)
+    instructions = {}
+    pending = [start]
+    while pending:
+        address = pending.pop()
+        if address in instructions or not start <= address < end - 1:
+            continue
+        offset = address - start
+        opcode = rom[offset] << 8 | rom[offset + 1]
+        decoded = decode(opcode)
+        if decoded is None:
+            continue
+        instructions[address] = (opcode,) + decoded
+        pending.extend(successors(address, *decoded))
+
+    # A block starts at the entry point and wherever control arrives other
+    # than by falling through from the previous instruction.
+    leaders = {start}
+    for address, (_, name, args) in instructions.items():
+        following = successors(address, name, args)
+        if following != [address + 2]:
+            leaders.update(following)
+    blocks = {}
+    for leader in leaders:
+        address = leader
+        while address in instructions:
+            following = successors(address, *instructions[address][1:])
+            address += 2
+            if following != [address] or address in leaders:
+                break
+        if address != leader:
+            blocks[leader] = (address, following)
+    return Analysis(hashlib.sha256(rom).hexdigest(), len(rom), instructions,
+                    blocks, start)
+
+
+def load(rom, cache_dir=DEFAULT_CACHE_DIR):
+    """Return the analysis of a ROM from the cache, analysing and caching it
+    on a miss."""
+    sha256 = hashlib.sha256(rom).hexdigest()
+    path = os.path.join(cache_dir, sha256 + '.json')
+    try:
+        with open(path) as cache_file:
+            analysis = Analysis.from_dict(json.load(cache_file))
+        if analysis.sha256 == sha256:
+            return analysis
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        if not isinstance(e, FileNotFoundError):
+            LOG.warning('Ignoring unreadable analysis cache %s: %s', path, e)
+
+    analysis = analyse(rom)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file first, so concurrent launches never read
+        # a partial file.
+        descriptor, temporary = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(descriptor, 'w') as cache_file:
+            json.dump(analysis.to_dict(), cache_file)
+        os.replace(temporary, path)
+    except OSError as e:
+        LOG.warning('Could not cache analysis in %s: %s', cache_dir, e)
+    return analysis
+
+
+class PredecodedEngine(object):
+    """Execution engine dispatching from decoded instructions by address.
+
+    The table is seeded with the reachable instructions of an analysis and
+    filled in as execution reaches anything else. Entries overwritten by FX33
+    or FX55 are dropped, so self-modifying programs still run correctly; call
+    ``flush`` after loading a new ROM. While the machine is tracing it runs
+    itself, and the table is rebuilt afterwards."""
+
+    def __init__(self, machine, analysis=None):
+        self.machine = machine
+        self.analysis = analysis
+        self.misses = 0
+        self._dispatch = None
+        self._table = None
+
+    def flush(self):
+        """Drop every decoded instruction."""
+        self._dispatch = None
+
+    def _build(self):
+        machine = self.machine
+        self._dispatch = machine._dispatch
+        self._table = table = [None] * len(machine.memory)
+        if self.analysis is not None:
+            memory = machine.memory
+            for address, (opcode, _, _) in self.analysis.instructions.items():
+                # Skip instructions the program has rewritten since.
+                if memory[address] << 8 | memory[address + 1] == opcode:
+                    table[address] = self._entry(opcode)
+
+    def _entry(self, opcode):
+        handler, args = self._dispatch[opcode]
+        decoded = decode(opcode, self.machine.mode)
+        if decoded is None or decoded[0] not in MEMORY_WRITES:
+            return handler, args
+        length = MEMORY_WRITES[decoded[0]](*args)
+        table = self._table
+
+        def write(machine, *args):
+            address = machine.register_i
+            try:
+                handler(machine, *args)
+            finally:
+                # Also drop the instruction overlapping the first byte
+                # written.
+                start = max(address - 1, 0)
+                end = min(address + length, len(table))
+                table[start:end] = [None] * (end - start)
+        return write, args
+
+    def run(self, cycles):
+        """Execute ``cycles`` instructions and return the number executed."""
+        machine = self.machine
+        if machine.tracing:
+            # Writes made while tracing are not seen by the table.
+            self.flush()
+            return machine.run(cycles)
+        if machine._dispatch is not self._dispatch:
+            # Handler overrides changed, the entries are stale.
+            self._build()
+        table = self._table
+        memory = machine.memory
+        executed = 0
+        remaining = cycles - machine.skip_idle(cycles)
+        try:
+            for executed in range(remaining):
+                pc = machine.pc
+                entry = table[pc]
+                if entry is None:
+                    self.misses += 1
+                    entry = table[pc] = self._entry(
+                        memory[pc] << 8 | memory[pc + 1])
+                machine.pc = pc + 2
+                handler, args = entry
+                handler(machine, *args)
+            else:
+                executed = remaining
+        finally:
+            # Handlers do not read the cycle count, so it is only written
+            # out once.
+            machine.cycles += executed
+        return cycles
@@ -0,0 +1,124 @@
+"""Run many ROMs headless across a process pool.
+
+Each ROM runs for a number of instructions or until it halts, and one JSON
+line is written per ROM with the instructions executed, the wall time and a
+hash of the final framebuffer.
+
+Usage: python -m chip8.batch [options] ROM_OR_DIRECTORY..."""
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+
+from chip8.core import Chip8
+from chip8.headless_display import HeadlessDisplay
+from chip8.scheduler import DEFAULT_SPEED, TIMER_FREQUENCY
+from chip8.translator import TranslationCache
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_CYCLES = 100000
+# CXNN is seeded, so that ROMs drawing random numbers hash the same on
+# every run.
+DEFAULT_SEED = 0
+
+
+def is_halted(machine):
+    """Return whether the machine is stuck on a jump to itself."""
+    pc = machine.pc
+    memory = machine.memory
+    if pc + 1 >= len(memory):
+        return False
+    instruction = memory[pc] << 8 | memory[pc + 1]
+    return instruction == 0x1000 | pc
+
+
+def run_rom(path, cycles=DEFAULT_CYCLES, speed=DEFAULT_SPEED, translate=False,
+            seed=DEFAULT_SEED):
+    """Run a ROM headless and return a dict describing the outcome.
+
+    The timers tick once every ``speed / 60`` instructions, as they would
+    when running in real time."""
+    machine = Chip8(HeadlessDisplay(), seed=seed)
+    engine = TranslationCache(machine) if translate else machine
+    per_frame = max(1, speed // TIMER_FREQUENCY)
+
+    status = 'completed'
+    error = None
+    start = time.perf_counter()
+    try:
+        # Directories may hold files that are unreadable or not ROMs.
+        machine.load_rom_file(path)
+        while machine.cycles < cycles:
+            engine.run(min(per_frame, cycles - machine.cycles))
+            machine.tick_timers()
+            if is_halted(machine):
+                status = 'halted'
+                break
+    except Exception as e:  # ROMs are untrusted, report whatever they hit
+        status = 'error'
+        error = repr(e)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'rom': path,
+        'status': status,
+        'error': error,
+        'cycles': machine.cycles,
+        'wall_time': elapsed,
+        'pc': machine.pc,
+        'framebuffer_sha1': hashlib.sha1(machine.framebuffer_bytes()).hexdigest(),
+    }
+
+
+def find_roms(paths):
+    """Expand directories into the files below them."""
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, files in os.walk(path):
+                for name in sorted(files):
+                    yield os.path.join(directory, name)
+        else:
+            yield path
+
+
+def _run_rom(job):
+    return run_rom(*job)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Run ROMs headless across a process pool.')
+    parser.add_argument('roms', nargs='+', metavar='ROM',
+                        help='ROM files or directories of ROMs')
+    parser.add_argument('--cycles', type=int, default=DEFAULT_CYCLES,
+                        help='instructions to run per ROM')
+    parser.add_argument('--speed', type=int, default=DEFAULT_SPEED,
+                        help='instructions per emulated second')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='worker processes')
+    parser.add_argument('--translate', action='store_true',
+                        help='run on the translation cache')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED,
+                        help='seed the random number generator')
+    parser.add_argument('--output', '-o', type=argparse.FileType('w'),
+                        default=sys.stdout, help='file to write results to')
+    options = parser.parse_args(args)
+
+    jobs = [(path, options.cycles, options.speed, options.translate,
+             options.seed) for path in find_roms(options.roms)]
+    chunksize = max(1, len(jobs) // (options.jobs * 8))
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(options.jobs) as executor:
+        for result in executor.map(_run_rom, jobs, chunksize=chunksize):
+            options.output.write(json.dumps(result) + '\n')
+    LOG.info('Ran %d ROMs in %.2fs', len(jobs), time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -1,35 +1,99 @@
+import curses
+import locale
 import logging
 
-import curses
+from chip8.core import DISPLAY_HEIGHT, DISPLAY_WIDTH
 
 LOG = logging.getLogger(__name__)
 
+# Characters of a cell by its top and bottom pixel, as (top << 1 | bottom).
+HALF_BLOCKS = (' ', '▄', '▀', '█')
+
 
 class ConsoleDisplay(object):
-    def __init__(self, height, width, begin_y, begin_x):
-        self.stdscr = curses.initscr()
-        curses.noecho()
-        curses.cbreak()
-        self.win = curses.newwin(height, width, begin_y, begin_x)
-        self.stdscr.refresh()
+    """curses display.
+
+    Each character cell shows two pixel rows using half-block characters,
+    so the screen takes 64x16 cells, or 128x32 in high resolution. Draws
+    only mark rows as dirty; ``present`` compares them against a shadow of
+    the last frame presented, writes just the cells that changed and
+    refreshes the terminal once. Pixels set in any bitplane are shown."""
+
+    def __init__(self, window=None, begin_y=0, begin_x=0):
+        self._owns_terminal = window is None
+        if window is None:
+            locale.setlocale(locale.LC_ALL, '')
+            self.stdscr = curses.initscr()
+            curses.noecho()
+            curses.cbreak()
+            curses.curs_set(0)
+            # One column spare, as curses cannot write the bottom right cell.
+            window = curses.newwin(DISPLAY_HEIGHT // 2, DISPLAY_WIDTH + 1,
+                                   begin_y, begin_x)
+        self.win = window
+        self.width = DISPLAY_WIDTH
+        self.height = DISPLAY_HEIGHT
+        self.planes = 1
+        self._framebuffer = None
+        self._dirty = set()
+        self._shadow = [0] * DISPLAY_HEIGHT
         LOG.info('ConsoleDisplay ready')
 
+    def resize(self, width, height, planes):
+        self.width, self.height, self.planes = width, height, planes
+        self.win.resize(height // 2, width + 1)
+        self.clear()
+
     def clear(self):
-        LOG.info('ConsoleDisplay clear')
-        self.win.clear()
-        self.stdscr.refresh()
+        self.win.erase()
+        self._shadow = [0] * self.height
+        self._dirty.clear()
+        self.win.refresh()
 
-    def draw(self, x, y, char):
-        LOG.debug(f'ConsoleDisplay drawing at {x}:{y} - {char}')
-        self.stdscr.addch(x, y, char)
+    def draw(self, framebuffer, y_start, n):
+        """Mark rows y_start to y_start + n - 1 of the framebuffer as dirty."""
+        self._framebuffer = framebuffer
+        dirty = self._dirty
+        height = self.height
+        for y in range(y_start, y_start + n):
+            dirty.add(y % height // 2)
 
-    def update(self):
-        LOG.debug('ConsoleDisplay refresh')
-        self.stdscr.refresh()
+    def present(self):
+        """Write the cells changed since the last call and refresh."""
+        if not self._dirty:
+            return
+        framebuffer = self._framebuffer
+        shadow = self._shadow
+        addstr = self.win.addstr
+        width = self.width
+        height = self.height
+        for cell_y in self._dirty:
+            y = cell_y * 2
+            top, bottom = framebuffer[y], framebuffer[y + 1]
+            for base in range(height, height * self.planes, height):
+                top |= framebuffer[base + y]
+                bottom |= framebuffer[base + y + 1]
+            changed = (top ^ shadow[y]) | (bottom ^ shadow[y + 1])
+            shadow[y], shadow[y + 1] = top, bottom
+            while changed:
+                # Lowest changed pixel, counting x from the left.
+                bit = changed & -changed
+                changed ^= bit
+                shift = bit.bit_length() - 1
+                addstr(cell_y, width - 1 - shift,
+                       HALF_BLOCKS[(top >> shift & 1) << 1 | bottom >> shift & 1])
+        self._dirty.clear()
+        self.win.refresh()
 
-    def __del__(self):
+    def close(self):
+        if not self._owns_terminal:
+            return
+        self._owns_terminal = False
         LOG.info('ConsoleDisplay teardown')
+        curses.curs_set(1)
         curses.echo()
         curses.nocbreak()
         curses.endwin()
 
+    def __del__(self):
+        self.close()
@@ -1,114 +1,358 @@
-# -*- coding: future_fstrings -*-
-
 import logging
+import mmap
+import os
 import random
 
-import binascii
-
-from chip8.sprites import SPRITES
+from chip8.sprites import BIG_FONT, FONT
 
 
 LOG = logging.getLogger(__name__)
 
 PC_START_ADDRESS = 0x200
 
+DISPLAY_WIDTH = 64
+DISPLAY_HEIGHT = 32
+ROW_MASK = (1 << DISPLAY_WIDTH) - 1
+HIRES_WIDTH = 128
+HIRES_HEIGHT = 64
+
+# Instruction sets: CHIP-8, SUPER-CHIP 1.1 and XO-CHIP.
+CHIP8 = 'chip8'
+SCHIP = 'schip'
+XOCHIP = 'xochip'
+MODES = (CHIP8, SCHIP, XOCHIP)
+
+MEMORY_SIZES = {CHIP8: 4096, SCHIP: 4096, XOCHIP: 65536}
+# Number of bitplanes of the display.
+PLANES = {CHIP8: 1, SCHIP: 1, XOCHIP: 2}
+
+# The 8x10 sprites of FX30 follow the 4x5 ones in memory.
+BIG_FONT_ADDRESS = len(FONT)
+
+# Framebuffer offsets of the planes of a single plane display.
+_FIRST_PLANE = (0,)
+
 
 class Chip8(object):
-    def __init__(self, display, debug_stream=None):
+    # Whether run fast-forwards through idle loops, see skip_idle.
+    skip_idle_loops = True
+
+    def __init__(self, display, debug_stream=None, seed=None, mode=CHIP8,
+                 quirks=None):
+        if mode not in MODES:
+            raise ValueError('Unknown mode {}'.format(mode))
+        if quirks is None:
+            quirks = DEFAULT_QUIRKS[mode]
+        elif quirks not in QUIRK_PROFILES:
+            raise ValueError('Unknown quirk profile {}'.format(quirks))
+        self.mode = mode
+        self.quirks = quirks
         self.display = display
-        self.memory = bytearray(4096)
+        self.memory = bytearray(MEMORY_SIZES[mode])
         self.v = bytearray(16)
-        self.register_i = bytearray(2)
-        self.dt = bytearray(1)
+        self.register_i = 0
         self.dt = 0
-        self.st = bytearray(1)
+        self.st = 0
         self.pc = PC_START_ADDRESS
         self.stack_ptr = 0
         self.stack = [0] * 16
         self.key = False
+        # One integer per display row, the most significant of its bits
+        # being the leftmost pixel. The rows of each bitplane follow those
+        # of the previous one.
+        self.width = DISPLAY_WIDTH
+        self.height = DISPLAY_HEIGHT
+        self.row_mask = ROW_MASK
+        self.hires = False
+        self.planes = PLANES[mode]
+        # Bitmask of the planes drawn to, selected by FN01.
+        self.plane = 1
+        self.framebuffer = [0] * DISPLAY_HEIGHT * self.planes
+        # SUPER-CHIP user flags, FX75 and FX85.
+        self.flags = bytearray(16)
+        # XO-CHIP sound, F002 and FX3A.
+        self.audio_pattern = bytes(16)
+        self.pitch = 64
         self._init_sprites()
         self.debug_stream = debug_stream
         self.cycles = 0
-        random.seed()
+        # Instructions accounted for by skip_idle rather than executed.
+        self.idle_cycles = 0
+        self.tracing = False
+        # Set while a chip8.profiler.Profiler is running.
+        self.profiler = None
+        self._hooks = {event: [] for event in HOOK_EVENTS}
+        # Handler overrides in effect by name, see set_overrides.
+        self._overrides = {}
+        self._dispatch = dispatch_table(type(self), mode=mode)
+        # Installed first, so other override sets wrap the quirk handlers.
+        self.set_overrides('quirks', QUIRK_PROFILES[quirks])
+        if mode != CHIP8:
+            display.resize(self.width, self.height, self.planes)
+        if debug_stream:
+            self.add_hook('pre_instruction', _dump_status)
+        # With a seed CXNN draws from a xorshift generator private to the
+        # machine, so runs are reproducible.
+        self.seed = seed
+        if seed is None:
+            random.seed()
+        else:
+            self.rng_state = seed & 0xffffffff or XORSHIFT_SEED
+            self.set_overrides('seed', _SEEDED_HANDLERS)
 
     def _init_sprites(self):
         """Initialise memory with sprites.
 
-        0x000 to 0x1FF in the main memory contains 16 sprites."""
-        address = 0
-        for sprite in SPRITES:
-            for sprite_byte in sprite:
-                self.memory[address] = sprite_byte
-                address += 1
+        0x000 to 0x1FF in the main memory contains 16 sprites, followed by
+        their large versions outside CHIP-8 mode."""
+        self.memory[:len(FONT)] = FONT
+        if self.mode != CHIP8:
+            self.memory[BIG_FONT_ADDRESS:BIG_FONT_ADDRESS + len(BIG_FONT)] = BIG_FONT
 
     def load_rom(self, rom_buffer):
-        for index, val in enumerate(rom_buffer):
-            self.memory[0x200 + index] = val
-        self.pc = 0x200
+        if PC_START_ADDRESS + len(rom_buffer) > len(self.memory):
+            raise ValueError('ROM too large')
+        self.memory[PC_START_ADDRESS:PC_START_ADDRESS + len(rom_buffer)] = rom_buffer
+        self.pc = PC_START_ADDRESS
+
+    def load_rom_file(self, path):
+        """Load a ROM straight from an mmap of its file."""
+        with open(path, 'rb') as rom_file:
+            if not os.fstat(rom_file.fileno()).st_size:
+                # Empty files cannot be mapped.
+                self.load_rom(b'')
+                return
+            with mmap.mmap(rom_file.fileno(), 0, access=mmap.ACCESS_READ) as rom:
+                self.load_rom(rom)
 
     def execute_cycle(self):
-        # LOG.debug("PC:{}".format(hex(self.pc)))
+        instruction = self.memory[self.pc] << 8 | self.memory[self.pc + 1]
+        self.pc += 2
+        handler, args = self._dispatch[instruction]
+        handler(self, *args)
+        self.cycles += 1
 
-        i1 = self.memory[self.pc]
-        i2 = self.memory[self.pc + 1]
+    def _execute_cycle_traced(self):
+        """execute_cycle, calling the instruction hooks around it."""
+        pc = self.pc
+        instruction = self.memory[pc] << 8 | self.memory[pc + 1]
+        for hook in self._hooks['pre_instruction']:
+            hook(self, pc, instruction)
+        self.pc = pc + 2
+        handler, args = self._dispatch[instruction]
+        handler(self, *args)
+        self.cycles += 1
+        for hook in self._hooks['post_instruction']:
+            hook(self, pc, instruction)
 
-        if self.debug_stream:
-            self.dump_status(hex(i1 << 8 | i2))
+    def add_hook(self, event, hook):
+        """Call ``hook`` on an event.
 
-        self.pc += 2
+        Events and the arguments hooks are called with:
+
+            pre_instruction   machine, pc, instruction
+            post_instruction  machine, pc, instruction
+            memory_write      machine, address, length
+            draw              machine, x, y, n, collision
+            key               machine, key
+
+        The hot path only changes while some hook is registered, so events
+        nobody listens to cost nothing."""
+        hooks = self._hooks[event]
+        if not hooks and event in _HOOKED_HANDLERS:
+            self.set_overrides(event, _HOOKED_HANDLERS[event])
+        hooks.append(hook)
+        self._update_tracing()
+
+    def remove_hook(self, event, hook):
+        hooks = self._hooks[event]
+        hooks.remove(hook)
+        if not hooks and event in _HOOKED_HANDLERS:
+            self.set_overrides(event, None)
+        self._update_tracing()
+
+    def set_overrides(self, name, overrides):
+        """Install (or with None, remove) a named set of handler overrides.
+
+        ``overrides`` is a sequence of ``(handler name, wrap)`` pairs as taken
+        by dispatch_table. Sets apply in the order they were first installed,
+        each wrapping the handlers left by the previous ones."""
+        if overrides:
+            self._overrides[name] = tuple(overrides)
+        else:
+            self._overrides.pop(name, None)
+        self._dispatch = dispatch_table(type(self), tuple(
+            pair for pairs in self._overrides.values() for pair in pairs),
+            self.mode)
+
+    def _update_tracing(self):
+        self.tracing = bool(self._hooks['pre_instruction'] or
+                            self._hooks['post_instruction'])
+        if self.tracing:
+            self.execute_cycle = self._execute_cycle_traced
+        else:
+            self.__dict__.pop('execute_cycle', None)
+
+    def run(self, cycles):
+        """Execute ``cycles`` instructions and return the number executed."""
+        execute_cycle = self.execute_cycle
+        for _ in range(cycles - self.skip_idle(cycles)):
+            execute_cycle()
+        return cycles
+
+    def skip_idle(self, cycles):
+        """Fast-forward through an idle loop at PC.
+
+        Timers only tick and keys only change between batches of
+        instructions, so within a batch these loops cannot exit:
+
+            1NNN                jump to itself
+            FX07; 3X00; 1NNN    wait for the delay timer
+            EX9E; 1NNN          wait for a key press
+            EXA1; 1NNN          wait for a key release
+
+        If PC is in one, the machine is left as executing ``cycles``
+        instructions one by one would leave it and ``cycles`` is returned.
+        Otherwise returns the number of instructions executed looking for
+        one, which is 0 unless PC was in the middle of a loop that turned out
+        to exit."""
+        if self.tracing or not self.skip_idle_loops:
+            return 0
+        executed = 0
+        while executed < cycles:
+            loop = self._idle_loop()
+            if loop is None:
+                return executed
+            start, length = loop
+            if self.pc == start:
+                break
+            # Loops are only recognised as idle from their first instruction.
+            self.execute_cycle()
+            executed += 1
+        else:
+            return executed
+        remaining = cycles - executed
+        if length == 3:
+            self.v[self.memory[start] & 0xf] = self.dt
+        self.pc = start + 2 * (remaining % length)
+        self.cycles += remaining
+        self.idle_cycles += remaining
+        return cycles
+
+    def _idle_loop(self):
+        """Return the start and length of the idle loop PC is in, if any.
+
+        Loops are only idle if their handlers are the stock ones, and from
+        their first instruction only if they cannot exit."""
+        memory = self.memory
+        pc = self.pc
+        if pc + 1 >= len(memory):
+            return None
+        instruction = memory[pc] << 8 | memory[pc + 1]
+        if instruction >> 12 == 1:
+            target = instruction & 0xfff
+            if target == pc:
+                return self._stock_loop(pc, (instruction,))
+            elif target in (pc - 2, pc - 4):
+                loop = self._stock_loop_at(target)
+                if loop is not None and loop[0] + 2 * (loop[1] - 1) == pc:
+                    return loop
+            return None
+        elif instruction & 0xf0ff == 0x3000:
+            loop = self._stock_loop_at(pc - 2)
+            return loop if loop is not None and loop[1] == 3 else None
+        loop = self._stock_loop_at(pc)
+        if loop is None:
+            return None
+        x = memory[pc] & 0xf
+        if loop[1] == 3 and not self.dt:
+            return None
+        pressed = bool(self.key) and self.key == self.v[x]
+        if instruction & 0xf0ff == 0xe09e and pressed:
+            return None
+        if instruction & 0xf0ff == 0xe0a1 and not pressed:
+            return None
+        return loop
+
+    def _stock_loop_at(self, start):
+        """Return the idle loop shape starting at ``start``, ignoring the
+        state that decides whether it exits."""
+        memory = self.memory
+        # Jumps only reach the first 4K.
+        if start < 0 or start + 5 > 0xfff:
+            return None
+        first = memory[start] << 8 | memory[start + 1]
+        second = memory[start + 2] << 8 | memory[start + 3]
+        back = 0x1000 | start
+        x = first & 0x0f00
+        if first & 0xf0ff in (0xe09e, 0xe0a1) and second == back:
+            return self._stock_loop(start, (first, second))
+        third = memory[start + 4] << 8 | memory[start + 5]
+        if first & 0xf0ff == 0xf007 and second == 0x3000 | x and third == back:
+            return self._stock_loop(start, (first, second, third))
+        return None
+
+    def _stock_loop(self, start, instructions):
+        dispatch = self._dispatch
+        stock = dispatch_table(type(self), mode=self.mode)
+        if dispatch is not stock:
+            for instruction in instructions:
+                if dispatch[instruction][0] is not stock[instruction][0]:
+                    return None
+        return start, len(instructions)
+
+    def tick_timers(self):
+        """Count the delay and sound timers down, at 60 Hz."""
         if self.dt > 0:
             self.dt -= 1
-        self.decode_instruction(i1 << 8 | i2)
-        self.cycles += 1
+        if self.st > 0:
+            self.st -= 1
+
+    def framebuffer_bytes(self):
+        """Return the framebuffer packed row by row, 8 bytes per row in low
+        resolution and 16 in high resolution."""
+        row_bytes = self.width // 8
+        return b''.join([row.to_bytes(row_bytes, 'big') for row in self.framebuffer])
 
     def key_pressed(self, key):
         self.key = key
+        for hook in self._hooks['key']:
+            hook(self, key)
 
     def dump_status(self, opcode):
-        try:
-            reg_i = hex(self.register_i)
-        except TypeError:
-            reg_i = 0
-
-        stats = f'[{self.cycles}] Opcode: {opcode}\tI: {reg_i}\tPC: {hex(self.pc)}\n'
+        stats = f'[{self.cycles}] Opcode: {opcode}\tI: {hex(self.register_i)}\tPC: {hex(self.pc)}\n'
         stats += f'Stack: {self.stack}\tSP: {self.stack_ptr}\n'
         for i in range(16):
             stats += f"V{i}: {hex(self.v[i])} "
         stats += "\n\n"
-        self.debug_stream.write(unicode(stats))
+        self.debug_stream.write(stats)
 
     # INSTRUCTIONS
 
     def call_rca(self, _):
-        LOG.debug("call_rca")
         assert False, "call_rca - Not implemented"
 
     def cls(self):
-        LOG.debug("disp_clear")
+        self.framebuffer[:] = [0] * DISPLAY_HEIGHT
         self.display.clear()
 
     def ret(self):
-        LOG.debug("ret")
         self.pc = self.stack[self.stack_ptr]
         self.stack_ptr -= 1
 
     def jump(self, nnn):
-        LOG.debug("goto")
         self.pc = nnn
 
     def call(self, nnn):
-        LOG.debug("call nnn={}".format(hex(nnn)))
         self.stack_ptr += 1
         self.stack[self.stack_ptr] = self.pc
         self.pc = nnn
 
     def skipinst_vx_eq_nn(self, x, nn):
-        LOG.debug("skipinst_vx_eq_nn")
         if self.v[x] == nn:
             self.pc += 2
 
     def skipinst_vx_neq_nn(self, x, nn):
-        LOG.debug("skipinst_vx_neq_nn")
         if self.v[x] != nn:
             self.pc += 2
 
@@ -118,37 +362,30 @@ class Chip8(object):
 
     # 6XNN
     def set_vx_to_nn(self, x, nn):
-        LOG.debug("set_vx_to_nn")
         self.v[x] = nn
 
     # 7XNN
     def add_nn_to_vx(self, x, nn):
-        LOG.debug("add_nn_to_vx")
         self.v[x] = (self.v[x] + nn) & 0xff
 
     # 8XY0
     def set_vx_to_vy(self, x, y):
-        LOG.debug("set_vx_to_vy")
         self.v[x] = self.v[y]
 
     # 8XY1
     def set_vx_to_vx_or_vy(self, x, y):
-        LOG.debug("set_vx_to_vx_or_vy")
         self.v[x] = self.v[x] | self.v[y]
 
     # 8XY2
     def set_vx_to_vx_and_vy(self, x, y):
-        LOG.debug("set_vx_to_vx_and_vy")
         self.v[x] = self.v[x] & self.v[y]
 
     # 8XY3
     def set_vx_to_vx_xor_vy(self, x, y):
-        LOG.debug("set_vx_to_vx_xor_vy")
         self.v[x] = self.v[x] ^ self.v[y]
 
     # 8XY4
     def add_vy_to_vx(self, x, y):
-        LOG.debug("add_vy_to_vx")
         # TODO review this
         result = self.v[x] + self.v[y]
         if result > 0xff:
@@ -160,7 +397,6 @@ class Chip8(object):
     # 8XY5
     def sub_vy_from_vx(self, x, y):
         """Vx = Vx - Vy, set VF = NOT borrow."""
-        LOG.debug("sub_vy_from_vx")
         if self.v[x] < self.v[y]:
             self.v[0xf] = 0
             self.v[x] = self.v[x] + 0x100 - self.v[y]
@@ -171,14 +407,12 @@ class Chip8(object):
     # 8XY6
     def shift_r_vy_to_vx(self, x, y):
         """Set Vx = Vx SHR 1."""
-        LOG.debug("shift_r_vy_to_vx")
         self.v[0xf] = self.v[y] & 0x1
         self.v[x] = self.v[y] >> 1
 
     # 8XY7
     def set_vx_to_vy_min_vx(self, x, y):
         """Set Vx = Vy - Vx, set VF = NOT borrow."""
-        LOG.debug("set_vx_to_vy_min_vx")
         if self.v[y] < self.v[x]:
             self.v[0xf] = 0
             self.v[x] = 0x100 + self.v[y] - self.v[x]
@@ -189,7 +423,6 @@ class Chip8(object):
     # 8XYE
     def shift_l_vy_to_vx(self, x, y):
         """Set Vx = Vx SHL 1."""
-        LOG.debug("shift_l_vy_to_vx")
         self.v[0xf] = self.v[y] >> 7
         result = self.v[y] << 1
         self.v[x] = result & 0xff
@@ -197,78 +430,80 @@ class Chip8(object):
 
     # 9XY0
     def skip_inst_if_vx_neq_vy(self, x, y):
-        LOG.debug("skip_inst_if_vx_neq_vy")
         if self.v[x] != self.v[y]:
             self.pc += 2
 
     # ANNN
     def set_i_to_nnn(self, nnn):
-        LOG.debug("set_i_to_nnn")
         self.register_i = nnn
 
     # BNNN
     def jump_to_v0_plus_nnn(self, nnn):
-        LOG.debug("jump_to_v0_plus_nnn")
         self.pc = nnn + self.v[0]
 
     # CXNN
     def set_vx_rand_and_nn(self, x, nn):
-        LOG.debug("set_vx_rand_and_nn")
         rnd = random.randrange(0, 255)
         self.v[x] = rnd & nn
 
     # DXYN
     def draw_sprite(self, x, y, n):
-        LOG.debug("draw_sprite")
-        sprite_data = self.memory[self.register_i:self.register_i+n]
-        collision = self.display.draw(self.v[x], self.v[y], n, sprite_data)
+        """Draw n rows of sprite data at I at (Vx, Vy), set VF = collision.
+
+        Sprite rows are XORed into the framebuffer, wrapping around the
+        edges of the screen."""
+        x_start = self.v[x] % DISPLAY_WIDTH
+        y_start = self.v[y] % DISPLAY_HEIGHT
+        framebuffer = self.framebuffer
+        collision = 0
+        row = y_start
+        for sprite in self.memory[self.register_i:self.register_i+n]:
+            # Rotate the sprite right from the left edge so that pixels past
+            # the right edge wrap around to the left.
+            sprite <<= DISPLAY_WIDTH - 8
+            sprite = (sprite >> x_start | sprite << (DISPLAY_WIDTH - x_start)) & ROW_MASK
+            collision |= framebuffer[row] & sprite
+            framebuffer[row] ^= sprite
+            row = (row + 1) % DISPLAY_HEIGHT
         self.v[0xf] = 1 if collision else 0
+        self.display.draw(framebuffer, y_start, n)
 
     # EX9E
     def skip_inst_if_vx_pressed(self, x):
-        LOG.debug("skip_inst_if_vx_pressed")
         if self.key and self.key == self.v[x]:
             self.pc += 2
 
     # EXA1
     def skip_inst_if_vx_not_pressed(self, x):
-        LOG.debug("skip_inst_if_vx_not_pressed")
         if not self.key or (self.key and self.key != self.v[x]):
             self.pc += 2
 
     # FX07
     def set_vx_to_delay_timer(self, x):
-        LOG.debug("set_vx_to_delay_timer")
         self.v[x] = self.dt
 
     # FX0A
     def wait_key_store_vx(self, x):
-        LOG.debug("wait_key_store_vx")
-        # FIXME
+        pass  # FIXME
 
     # FX15
     def set_delay_timer_to_vx(self, x):
-        LOG.debug("set_delay_timer_to_vx")
         self.dt = self.v[x]
 
     # FX18
     def set_sound_timer_to_vx(self, x):
-        LOG.debug("set_sound_timer_to_vx")
         self.st = self.v[x]
 
     # FX1E
     def add_vx_to_i(self, x):
-        LOG.debug("add_vx_to_i")
         self.register_i = self.register_i + self.v[x]
 
     # FX29
     def set_i_to_sprite_in_vx(self, x):
-        LOG.debug("set_i_to_sprite_in_vx")
         self.register_i = self.v[x] * 5
 
     # FX33
     def set_i_to_bcd(self, x):
-        LOG.debug("set_i_to_bcd")
         value = str(self.v[x])
         self.memory[self.register_i] = int(value[2])
         self.memory[self.register_i + 1] = int(value[1])
@@ -276,7 +511,6 @@ class Chip8(object):
 
     # FX55
     def reg_dump_to_mem(self, x):
-        LOG.debug("reg_dump_to_mem")
         for i in range(x+1):
             self.memory[self.register_i + i] = self.v[i]
 
@@ -284,97 +518,695 @@ class Chip8(object):
 
     # FX65
     def reg_load_from_mem(self, x):
-        LOG.debug("reg_load_from_mem")
         for i in range(x+1):
             self.v[i] = self.memory[self.register_i + i]
         self.register_i += x + 1
 
+    # SUPER-CHIP AND XO-CHIP INSTRUCTIONS
+
+    def _plane_offsets(self):
+        """Return where the rows of each selected plane start in the
+        framebuffer."""
+        height = self.height
+        return [plane * height for plane in range(self.planes)
+                if self.plane >> plane & 1]
+
+    def _set_resolution(self, hires):
+        self.hires = hires
+        if hires:
+            self.width, self.height = HIRES_WIDTH, HIRES_HEIGHT
+        else:
+            self.width, self.height = DISPLAY_WIDTH, DISPLAY_HEIGHT
+        self.row_mask = (1 << self.width) - 1
+        self.framebuffer[:] = [0] * self.height * self.planes
+        self.display.resize(self.width, self.height, self.planes)
+
+    # 00CN
+    def scroll_down(self, n):
+        framebuffer = self.framebuffer
+        height = self.height
+        for base in self._plane_offsets():
+            framebuffer[base:base + height] = (
+                [0] * n + framebuffer[base:base + height - n])
+            self.display.draw(framebuffer, base, height)
+
+    # 00DN
+    def scroll_up(self, n):
+        framebuffer = self.framebuffer
+        height = self.height
+        for base in self._plane_offsets():
+            framebuffer[base:base + height] = (
+                framebuffer[base + n:base + height] + [0] * n)
+            self.display.draw(framebuffer, base, height)
+
+    # 00E0
+    def clear_planes(self):
+        """Clear the selected planes."""
+        framebuffer = self.framebuffer
+        height = self.height
+        offsets = self._plane_offsets()
+        for base in offsets:
+            framebuffer[base:base + height] = [0] * height
+        if len(offsets) == self.planes:
+            self.display.clear()
+        else:
+            for base in offsets:
+                self.display.draw(framebuffer, base, height)
+
+    # 00FB
+    def scroll_right(self):
+        """Scroll the selected planes 4 pixels right."""
+        framebuffer = self.framebuffer
+        height = self.height
+        for base in self._plane_offsets():
+            framebuffer[base:base + height] = [
+                row >> 4 for row in framebuffer[base:base + height]]
+            self.display.draw(framebuffer, base, height)
+
+    # 00FC
+    def scroll_left(self):
+        """Scroll the selected planes 4 pixels left."""
+        framebuffer = self.framebuffer
+        height = self.height
+        mask = self.row_mask
+        for base in self._plane_offsets():
+            framebuffer[base:base + height] = [
+                row << 4 & mask for row in framebuffer[base:base + height]]
+            self.display.draw(framebuffer, base, height)
+
+    # 00FD
+    def exit_interpreter(self):
+        """Stop, by jumping back to this instruction."""
+        self.pc -= 2
+
+    # 00FE
+    def set_lores(self):
+        self._set_resolution(False)
+
+    # 00FF
+    def set_hires(self):
+        self._set_resolution(True)
+
+    # DXYN
+    def draw_extended_sprite(self, x, y, n):
+        """Draw n rows of sprite data at I at (Vx, Vy) to each selected
+        plane, set VF = collision.
+
+        DXY0 draws a 16x16 sprite of two bytes per row. Sprites for the
+        second plane follow those for the first in memory."""
+        width = self.width
+        height = self.height
+        mask = self.row_mask
+        x_start = self.v[x] % width
+        y_start = self.v[y] % height
+        memory = self.memory
+        address = self.register_i
+        if n:
+            rows, sprite_width = n, 8
+        else:
+            rows, sprite_width = 16, 16
+        # Shift from the sprite at the right edge to the sprite at the left
+        # edge, from which rows are rotated right to x_start.
+        left = width - sprite_width
+        right = width - x_start
+        framebuffer = self.framebuffer
+        collision = 0
+        for base in self._plane_offsets() if self.planes > 1 else _FIRST_PLANE:
+            if n:
+                sprites = memory[address:address + n]
+                address += n
+            else:
+                data = memory[address:address + 32]
+                sprites = [high << 8 | low for high, low in zip(data[::2], data[1::2])]
+                address += 32
+            row = base + y_start
+            end = base + height
+            for sprite in sprites:
+                sprite <<= left
+                sprite = (sprite >> x_start | sprite << right) & mask
+                collision |= framebuffer[row] & sprite
+                framebuffer[row] ^= sprite
+                row += 1
+                if row == end:
+                    row = base
+            self.display.draw(framebuffer, base + y_start, rows)
+        self.v[0xf] = 1 if collision else 0
+
+    # 5XY2
+    def save_vx_to_vy(self, x, y):
+        """Store Vx to Vy, in either order, in memory starting at I."""
+        step = 1 if x <= y else -1
+        address = self.register_i
+        for offset, register in enumerate(range(x, y + step, step)):
+            self.memory[address + offset] = self.v[register]
+
+    # 5XY3
+    def load_vx_to_vy(self, x, y):
+        step = 1 if x <= y else -1
+        address = self.register_i
+        for offset, register in enumerate(range(x, y + step, step)):
+            self.v[register] = self.memory[address + offset]
+
+    # F000 NNNN
+    def load_i_long(self):
+        """Set I to the 16-bit word following the instruction."""
+        self.register_i = self.memory[self.pc] << 8 | self.memory[self.pc + 1]
+        self.pc += 2
+
+    # FN01
+    def select_planes(self, n):
+        self.plane = n & 3
+
+    # F002
+    def load_audio_pattern(self):
+        self.audio_pattern = bytes(
+            self.memory[self.register_i:self.register_i + 16])
+
+    # FX30
+    def set_i_to_big_sprite_in_vx(self, x):
+        self.register_i = BIG_FONT_ADDRESS + self.v[x] * 10
+
+    # FX3A
+    def set_pitch_to_vx(self, x):
+        self.pitch = self.v[x]
+
+    # FX75
+    def save_flags(self, x):
+        self.flags[:x + 1] = self.v[:x + 1]
+
+    # FX85
+    def load_flags(self, x):
+        self.v[:x + 1] = self.flags[:x + 1]
+
     def decode_instruction(self, instruction):
         """
         :type instruction:int
         """
-        _1 = (instruction >> 12) & 0xf
-        _2 = (instruction >> 8) & 0xf
-        _3 = (instruction >> 4) & 0xf
-        _4 = instruction & 0xf
-        # LOG.debug("opcode: {}".format(hex(instruction)))
-
-        if _1 == 0:
-            if _3 == 0xe & _4 == 0xe:
-                self.ret()
-            elif _3 == 0xe:
-                self.cls()
-            else:
-                self.call_rca(instruction & 0x0fff)
-        elif _1 == 1:
-            self.jump(instruction & 0x0fff)
-        elif _1 == 2:
-            self.call(instruction & 0x0fff)
-        elif _1 == 3:
-            self.skipinst_vx_eq_nn(_2, instruction & 0x00ff)
-        elif _1 == 4:
-            self.skipinst_vx_neq_nn(_2, instruction & 0x00ff)
-        elif _1 == 5:
-            self.skipinst_vx_eq_vy(_2, _3)
-        elif _1 == 6:
-            self.set_vx_to_nn(_2, instruction & 0x00ff)
-        elif _1 == 7:
-            self.add_nn_to_vx(_2, instruction & 0x00ff)
-        elif _1 == 8:
-            if _4 == 0:
-                self.set_vx_to_vy(_2, _3)
-            elif _4 == 1:
-                self.set_vx_to_vx_or_vy(_2, _3)
-            elif _4 == 2:
-                self.set_vx_to_vx_and_vy(_2, _3)
-            elif _4 == 3:
-                self.set_vx_to_vx_xor_vy(_2, _3)
-            elif _4 == 4:
-                self.add_vy_to_vx(_2, _3)
-            elif _4 == 5:
-                self.sub_vy_from_vx(_2, _3)
-            elif _4 == 6:
-                self.shift_r_vy_to_vx(_2, _3)
-            elif _4 == 7:
-                self.set_vx_to_vy_min_vx(_2, _3)
-            elif _4 == 0xe:
-                self.shift_l_vy_to_vx(_2, _3)
-            else:
-                raise RuntimeError('Failed to decode instruction')
-        elif _1 == 9:
-            self.skip_inst_if_vx_neq_vy(_2, _3)
-        elif _1 == 0xa:
-            self.set_i_to_nnn(instruction & 0x0fff)
-        elif _1 == 0xb:
-            self.jump_to_v0_plus_nnn(instruction & 0xfff)
-        elif _1 == 0xc:
-            self.set_vx_rand_and_nn(_2, instruction & 0x00ff)
-        elif _1 == 0xd:
-            self.draw_sprite(_2, _3, _4)
-        elif _1 == 0xe and _3 == 0x9:
-            self.skip_inst_if_vx_pressed(_2)
-        elif _1 == 0xe and _3 == 0xa:
-            self.skip_inst_if_vx_not_pressed(_2)
-        elif _1 == 0xf:
-            if _4 == 7:
-                self.set_vx_to_delay_timer(_2)
-            elif _4 == 0xa:
-                self.wait_key_store_vx(_2)
-            elif _4 == 5 and _3 == 1:
-                self.set_delay_timer_to_vx(_2)
-            elif _4 == 8:
-                self.set_sound_timer_to_vx(_2)
-            elif _4 == 0xe:
-                self.add_vx_to_i(_2)
-            elif _4 == 9:
-                self.set_i_to_sprite_in_vx(_2)
-            elif _4 == 3:
-                self.set_i_to_bcd(_2)
-            elif _4 == 5 and _3 == 5:
-                self.reg_dump_to_mem(_2)
-            elif _4 == 5 and _3 == 6:
-                self.reg_load_from_mem(_2)
-            else:
-                raise RuntimeError('Failed to decode instruction')
-        else:
-            raise RuntimeError('Failed to decode instruction')
+        handler, args = self._dispatch[instruction]
+        handler(self, *args)
+
+
+def _decode_0(_3, _4):
+    if _3 == 0xe & _4 == 0xe:
+        return 'ret', ''
+    elif _3 == 0xe:
+        return 'cls', ''
+    else:
+        return 'call_rca', 'nnn'
+
+
+def _decode_8(_3, _4):
+    if _4 == 0xe:
+        return 'shift_l_vy_to_vx', 'xy'
+    elif _4 < 8:
+        return _ALU_HANDLERS[_4], 'xy'
+
+
+def _decode_e(_3, _4):
+    if _3 == 0x9:
+        return 'skip_inst_if_vx_pressed', 'x'
+    elif _3 == 0xa:
+        return 'skip_inst_if_vx_not_pressed', 'x'
+
+
+def _decode_f(_3, _4):
+    if _4 == 7:
+        return 'set_vx_to_delay_timer', 'x'
+    elif _4 == 0xa:
+        return 'wait_key_store_vx', 'x'
+    elif _4 == 5 and _3 == 1:
+        return 'set_delay_timer_to_vx', 'x'
+    elif _4 == 8:
+        return 'set_sound_timer_to_vx', 'x'
+    elif _4 == 0xe:
+        return 'add_vx_to_i', 'x'
+    elif _4 == 9:
+        return 'set_i_to_sprite_in_vx', 'x'
+    elif _4 == 3:
+        return 'set_i_to_bcd', 'x'
+    elif _4 == 5 and _3 == 5:
+        return 'reg_dump_to_mem', 'x'
+    elif _4 == 5 and _3 == 6:
+        return 'reg_load_from_mem', 'x'
+
+
+def _decode_0_schip(_3, _4):
+    if _3 == 0xc:
+        return 'scroll_down', 'n'
+    elif _3 == 0xe and _4 != 0xe:
+        return 'clear_planes', ''
+    elif _3 == 0xf and _4 >= 0xb:
+        return _SCHIP_SYSTEM_HANDLERS[_4 - 0xb], ''
+    return _decode_0(_3, _4)
+
+
+def _decode_0_xochip(_3, _4):
+    if _3 == 0xd:
+        return 'scroll_up', 'n'
+    return _decode_0_schip(_3, _4)
+
+
+def _decode_5_xochip(_3, _4):
+    if _4 == 2:
+        return 'save_vx_to_vy', 'xy'
+    elif _4 == 3:
+        return 'load_vx_to_vy', 'xy'
+    return 'skipinst_vx_eq_vy', 'xy'
+
+
+def _decode_f_schip(_3, _4):
+    if _3 == 3 and _4 == 0:
+        return 'set_i_to_big_sprite_in_vx', 'x'
+    elif _3 == 7 and _4 == 5:
+        return 'save_flags', 'x'
+    elif _3 == 8 and _4 == 5:
+        return 'load_flags', 'x'
+    return _decode_f(_3, _4)
+
+
+def _decode_f_xochip(_3, _4):
+    if _3 == 0 and _4 == 0:
+        return 'load_i_long', ''
+    elif _3 == 0 and _4 == 1:
+        return 'select_planes', 'x'
+    elif _3 == 0 and _4 == 2:
+        return 'load_audio_pattern', ''
+    elif _3 == 3 and _4 == 0xa:
+        return 'set_pitch_to_vx', 'x'
+    return _decode_f_schip(_3, _4)
+
+
+# 00FB - 00FF
+_SCHIP_SYSTEM_HANDLERS = (
+    'scroll_right',
+    'scroll_left',
+    'exit_interpreter',
+    'set_lores',
+    'set_hires',
+)
+
+
+# Opcodes by their first nibble: the handler name and operand layout of the
+# whole family, or a function of the last two nibbles returning them (or
+# None if the opcode does not decode). Operand layouts name the fields taken
+# from the rest of the opcode, X being the second nibble, Y the third and N
+# the fourth.
+_FAMILIES = (
+    _decode_0,
+    ('jump', 'nnn'),
+    ('call', 'nnn'),
+    ('skipinst_vx_eq_nn', 'xnn'),
+    ('skipinst_vx_neq_nn', 'xnn'),
+    ('skipinst_vx_eq_vy', 'xy'),
+    ('set_vx_to_nn', 'xnn'),
+    ('add_nn_to_vx', 'xnn'),
+    _decode_8,
+    ('skip_inst_if_vx_neq_vy', 'xy'),
+    ('set_i_to_nnn', 'nnn'),
+    ('jump_to_v0_plus_nnn', 'nnn'),
+    ('set_vx_rand_and_nn', 'xnn'),
+    ('draw_sprite', 'xyn'),
+    _decode_e,
+    _decode_f,
+)
+
+
+def _extend_families(families, changes):
+    return tuple(changes.get(first, family)
+                 for first, family in enumerate(families))
+
+
+_SCHIP_FAMILIES = _extend_families(_FAMILIES, {
+    0x0: _decode_0_schip,
+    0xd: ('draw_extended_sprite', 'xyn'),
+    0xf: _decode_f_schip,
+})
+
+_MODE_FAMILIES = {
+    CHIP8: _FAMILIES,
+    SCHIP: _SCHIP_FAMILIES,
+    XOCHIP: _extend_families(_SCHIP_FAMILIES, {
+        0x0: _decode_0_xochip,
+        0x5: _decode_5_xochip,
+        0xf: _decode_f_xochip,
+    }),
+}
+
+
+def _operand_layouts():
+    """Return the operands of each layout for the last three nibbles of an
+    opcode, as lists of 4096 tuples shared by all families."""
+    xs = [(x,) for x in range(16)]
+    xys = [(x, y) for x in range(16) for y in range(16)]
+    return {
+        '': [()] * 0x1000,
+        'x': [xs[rest >> 8] for rest in range(0x1000)],
+        'n': [xs[rest & 0xf] for rest in range(0x1000)],
+        'xy': [xys[rest >> 4] for rest in range(0x1000)],
+        'xyn': [(rest >> 8, rest >> 4 & 0xf, rest & 0xf)
+                for rest in range(0x1000)],
+        'xnn': [(rest >> 8, rest & 0xff) for rest in range(0x1000)],
+        'nnn': [(rest,) for rest in range(0x1000)],
+    }
+
+
+# Operands by layout, see _operand_layouts.
+_LAYOUTS = _operand_layouts()
+
+
+def _decode_all(families=_FAMILIES):
+    """Map every 16-bit opcode to the name of its handler and its operands,
+    or to None if it does not decode to an instruction."""
+    layouts = _LAYOUTS
+    decoded = []
+    for family in families:
+        if isinstance(family, tuple):
+            name, layout = family
+            decoded.extend([(name, operands) for operands in layouts[layout]])
+            continue
+        # The decoding of the last two nibbles repeats for every X.
+        by_low_byte = [family(low >> 4, low & 0xf) for low in range(0x100)] * 16
+        decoded.extend([
+            shape and (shape[0], layouts[shape[1]][rest])
+            for rest, shape in enumerate(by_low_byte)])
+    return decoded
+
+
+# 8XY0 - 8XY7
+_ALU_HANDLERS = (
+    'set_vx_to_vy',
+    'set_vx_to_vx_or_vy',
+    'set_vx_to_vx_and_vy',
+    'set_vx_to_vx_xor_vy',
+    'add_vy_to_vx',
+    'sub_vy_from_vx',
+    'shift_r_vy_to_vx',
+    'set_vx_to_vy_min_vx',
+)
+
+
+def _decode_failure(_):
+    raise RuntimeError('Failed to decode instruction')
+
+
+_UNKNOWN = (_decode_failure, ())
+
+# Opcode names and operands for the whole 16-bit opcode space, shared by all
+# CHIP-8 dispatch tables. Those of the other modes are decoded when first
+# used.
+_DECODED = _decode_all()
+_DECODED_BY_MODE = {CHIP8: _DECODED}
+
+
+def _decoded(mode):
+    try:
+        return _DECODED_BY_MODE[mode]
+    except KeyError:
+        decoded = _DECODED_BY_MODE[mode] = _decode_all(_MODE_FAMILIES[mode])
+        return decoded
+
+
+def _handler_names():
+    names = set()
+    for families in _MODE_FAMILIES.values():
+        for family in families:
+            if isinstance(family, tuple):
+                names.add(family[0])
+                continue
+            for low in range(0x100):
+                shape = family(low >> 4, low & 0xf)
+                if shape:
+                    names.add(shape[0])
+    return tuple(sorted(names))
+
+
+# Names of all the instruction handlers, in every mode.
+HANDLER_NAMES = _handler_names()
+
+_DISPATCH_TABLES = {}
+# Dispatch entries of the 4096 opcodes of a family, by family and the
+# handlers it dispatches to.
+_FAMILY_TABLES = {}
+_FAMILY_NAMES = {}
+
+
+def _family_names(family):
+    """Return the names of the handlers of a family, in a fixed order."""
+    try:
+        return _FAMILY_NAMES[family]
+    except KeyError:
+        pass
+    if isinstance(family, tuple):
+        names = (family[0],)
+    else:
+        names = tuple(sorted(set(
+            shape[0] for shape in (family(low >> 4, low & 0xf)
+                                   for low in range(0x100)) if shape)))
+    _FAMILY_NAMES[family] = names
+    return names
+
+
+def _family_table(family, handlers):
+    """Return the dispatch entries of the opcodes of a family, built once
+    for each combination of handlers."""
+    key = (family, tuple(handlers[name] for name in _family_names(family)))
+    try:
+        return _FAMILY_TABLES[key]
+    except KeyError:
+        pass
+    layouts = _LAYOUTS
+    if isinstance(family, tuple):
+        name, layout = family
+        handler = handlers[name]
+        table = [(handler, operands) for operands in layouts[layout]]
+    else:
+        # The decoding of the last two nibbles repeats for every X.
+        by_low_byte = [family(low >> 4, low & 0xf)
+                       for low in range(0x100)] * 16
+        table = [(handlers[shape[0]], layouts[shape[1]][rest])
+                 if shape else _UNKNOWN
+                 for rest, shape in enumerate(by_low_byte)]
+    _FAMILY_TABLES[key] = table
+    return table
+
+HOOK_EVENTS = ('pre_instruction', 'post_instruction', 'memory_write', 'draw',
+               'key')
+
+# xorshift32 state used for a seed of 0, which would stick at 0.
+XORSHIFT_SEED = 0x9e3779b9
+
+
+def _dump_status(machine, pc, instruction):
+    machine.dump_status(hex(instruction))
+
+
+def _memory_write_hooked(length):
+    """Wrap a handler writing ``length(*args)`` bytes at I to call the
+    memory_write hooks."""
+    def wrap(handler):
+        def hooked(self, *args):
+            address = self.register_i
+            handler(self, *args)
+            for hook in self._hooks['memory_write']:
+                hook(self, address, length(*args))
+        return hooked
+    return wrap
+
+
+def _draw_hooked(handler):
+    def hooked(self, x, y, n):
+        x_start, y_start = self.v[x], self.v[y]
+        handler(self, x, y, n)
+        for hook in self._hooks['draw']:
+            hook(self, x_start, y_start, n, self.v[0xf])
+    return hooked
+
+
+def _bcd_length(x):
+    return 3
+
+
+def _dump_length(x):
+    return x + 1
+
+
+def _range_length(x, y):
+    return abs(x - y) + 1
+
+
+# Handler overrides that call the hooks of each event.
+_HOOKED_HANDLERS = {
+    'memory_write': (
+        ('set_i_to_bcd', _memory_write_hooked(_bcd_length)),
+        ('reg_dump_to_mem', _memory_write_hooked(_dump_length)),
+        ('save_vx_to_vy', _memory_write_hooked(_range_length)),
+    ),
+    'draw': (
+        ('draw_sprite', _draw_hooked),
+        ('draw_extended_sprite', _draw_hooked),
+    ),
+}
+
+
+def _skip_long(handler):
+    """Wrap a skip so that it skips all of an F000 NNNN instruction."""
+    def skip(self, *args):
+        pc = self.pc
+        handler(self, *args)
+        if (self.pc != pc and
+                self.memory[pc] << 8 | self.memory[pc + 1] == 0xf000):
+            self.pc += 2
+    return skip
+
+
+# Handler overrides built into the dispatch tables of each mode.
+_MODE_HANDLERS = {
+    XOCHIP: tuple((name, _skip_long) for name in (
+        'skipinst_vx_eq_nn',
+        'skipinst_vx_neq_nn',
+        'skipinst_vx_eq_vy',
+        'skip_inst_if_vx_neq_vy',
+        'skip_inst_if_vx_pressed',
+        'skip_inst_if_vx_not_pressed',
+    )),
+}
+
+
+def _xorshift_rand(handler):
+    def set_vx_rand_and_nn(self, x, nn):
+        state = self.rng_state
+        state ^= state << 13 & 0xffffffff
+        state ^= state >> 17
+        state ^= state << 5 & 0xffffffff
+        self.rng_state = state
+        self.v[x] = state >> 24 & nn
+    return set_vx_rand_and_nn
+
+
+# Handler overrides of a seeded machine.
+_SEEDED_HANDLERS = (
+    ('set_vx_rand_and_nn', _xorshift_rand),
+)
+
+
+def _shift_r_vx(handler):
+    def shift_r_vy_to_vx(self, x, y):
+        """Set Vx = Vx SHR 1."""
+        value = self.v[x]
+        self.v[0xf] = value & 0x1
+        self.v[x] = value >> 1
+    return shift_r_vy_to_vx
+
+
+def _shift_l_vx(handler):
+    def shift_l_vy_to_vx(self, x, y):
+        """Set Vx = Vx SHL 1."""
+        value = self.v[x]
+        self.v[0xf] = value >> 7
+        self.v[x] = value << 1 & 0xff
+    return shift_l_vy_to_vx
+
+
+def _reg_dump(increment):
+    """Return an FX55 override adding ``x + increment`` to I, or leaving I
+    alone if ``increment`` is None."""
+    def wrap(handler):
+        def reg_dump_to_mem(self, x):
+            address = self.register_i
+            for i in range(x + 1):
+                self.memory[address + i] = self.v[i]
+            if increment is not None:
+                self.register_i = address + x + increment
+        return reg_dump_to_mem
+    return wrap
+
+
+def _reg_load(increment):
+    """Return an FX65 override adding ``x + increment`` to I, or leaving I
+    alone if ``increment`` is None."""
+    def wrap(handler):
+        def reg_load_from_mem(self, x):
+            address = self.register_i
+            for i in range(x + 1):
+                self.v[i] = self.memory[address + i]
+            if increment is not None:
+                self.register_i = address + x + increment
+        return reg_load_from_mem
+    return wrap
+
+
+def _jump_to_vx_plus_nnn(handler):
+    def jump_to_v0_plus_nnn(self, nnn):
+        """BXNN: jump to XNN + VX."""
+        self.pc = nnn + self.v[nnn >> 8]
+    return jump_to_v0_plus_nnn
+
+
+_SHIFT_VX = (
+    ('shift_r_vy_to_vx', _shift_r_vx),
+    ('shift_l_vy_to_vx', _shift_l_vx),
+)
+
+_JUMP_VX = (
+    ('jump_to_v0_plus_nnn', _jump_to_vx_plus_nnn),
+)
+
+
+def _load_store(increment):
+    return (
+        ('reg_dump_to_mem', _reg_dump(increment)),
+        ('reg_load_from_mem', _reg_load(increment)),
+    )
+
+
+# Handler overrides of each quirk profile, bound into the dispatch table
+# when a machine is created. The stock handlers behave as on the COSMAC
+# VIP: 8XY6 and 8XYE shift VY into VX, FX55 and FX65 add X + 1 to I and BNNN
+# jumps to NNN + V0.
+QUIRK_PROFILES = {
+    'vip': (),
+    'chip48': _SHIFT_VX + _load_store(0) + _JUMP_VX,
+    'schip': _SHIFT_VX + _load_store(None) + _JUMP_VX,
+    'modern': _SHIFT_VX + _load_store(None),
+}
+
+# Quirk profile of each mode unless another is chosen.
+DEFAULT_QUIRKS = {CHIP8: 'vip', SCHIP: 'schip', XOCHIP: 'vip'}
+
+
+def decode(instruction, mode=CHIP8):
+    """Return the ``(handler name, operands)`` pair for an opcode, or None if
+    it does not decode to an instruction."""
+    if mode == CHIP8:
+        return _DECODED[instruction]
+    return _decoded(mode)[instruction]
+
+
+def dispatch_table(cls, overrides=(), mode=CHIP8):
+    """Return the dispatch table for a Chip8 class.
+
+    The table has one entry per 16-bit opcode, each a ``(handler, args)``
+    pair where ``handler`` is the unbound method and ``args`` the operands
+    already extracted from the opcode, as decoded in ``mode``.
+
+    ``overrides`` is a sequence of ``(handler name, wrap)`` pairs. ``wrap``
+    takes the handler and returns the function to dispatch to instead; pairs
+    for the same handler apply in order. Tables are built once per class and
+    sequence of overrides in each mode.
+
+    Tables are put together from the entries of each first nibble family,
+    which are shared by the tables whose handlers for that family are the
+    same, so a set of overrides only rebuilds the families it touches."""
+    key = (cls, mode, tuple(overrides))
+    try:
+        return _DISPATCH_TABLES[key]
+    except KeyError:
+        pass
+    handlers = {name: getattr(cls, name) for name in HANDLER_NAMES}
+    for name, wrap in _MODE_HANDLERS.get(mode, ()) + tuple(overrides):
+        handlers[name] = wrap(handlers[name])
+    table = []
+    for family in _MODE_FAMILIES[mode]:
+        table += _family_table(family, handlers)
+    _DISPATCH_TABLES[key] = table
+    return table
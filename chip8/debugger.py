@@ -0,0 +1,154 @@
+"""PC breakpoints and memory watchpoints.
+
+A Debugger only registers hooks on a machine while it has breakpoints or
+watchpoints armed, so an idle debugger leaves the machine on its plain
+dispatch table and costs nothing. Hitting a breakpoint or a watchpoint
+raises an exception out of whatever is running the machine:
+
+- BreakpointHit before the instruction at the breakpoint executes
+- WatchpointHit after the instruction that wrote to a watched address
+
+Breakpoint conditions are Python expressions over the machine state, using
+the names v, i, pc, sp, stack, dt, st, key, cycles and memory, and are
+compiled once when the breakpoint is set."""
+
+PAGE_SHIFT = 8
+
+
+class BreakpointHit(Exception):
+
+    def __init__(self, pc):
+        super(BreakpointHit, self).__init__('Breakpoint at {}'.format(hex(pc)))
+        self.pc = pc
+
+
+class WatchpointHit(Exception):
+
+    def __init__(self, address, pc):
+        super(WatchpointHit, self).__init__(
+            'Write to {} by instruction at {}'.format(hex(address), hex(pc)))
+        self.address = address
+        self.pc = pc
+
+
+def compile_condition(condition):
+    """Compile a breakpoint condition into a predicate taking the machine."""
+    source = '\n'.join([
+        'def predicate(m):',
+        '    v = m.v',
+        '    i = m.register_i',
+        '    pc = m.pc',
+        '    sp = m.stack_ptr',
+        '    stack = m.stack',
+        '    dt = m.dt',
+        '    st = m.st',
+        '    key = m.key',
+        '    cycles = m.cycles',
+        '    memory = m.memory',
+        '    return bool({})'.format(condition),
+    ])
+    namespace = {}
+    exec(compile(source, '<condition {!r}>'.format(condition), 'exec'),
+         namespace)
+    return namespace['predicate']
+
+
+class Debugger(object):
+    """Breakpoints and watchpoints on a machine.
+
+    Breakpoints are held in a bitmap by address. Watched addresses are
+    counted per 256 byte page, so writes to pages without watchpoints are
+    dismissed with a single lookup."""
+
+    def __init__(self, machine):
+        self.machine = machine
+        size = len(machine.memory)
+        self.breakpoints = bytearray(size)
+        self.conditions = {}
+        self.watched = bytearray(size)
+        self._pages = [0] * (size >> PAGE_SHIFT)
+        # Breakpoint to step over once when resuming from it.
+        self._resume_pc = None
+        self._breaking = False
+        self._watching = False
+
+    def add_breakpoint(self, pc, condition=None):
+        """Break before the instruction at ``pc`` executes, if ``condition``
+        holds."""
+        if condition is None:
+            self.conditions.pop(pc, None)
+        else:
+            self.conditions[pc] = compile_condition(condition)
+        self.breakpoints[pc] = 1
+        self._update()
+
+    def remove_breakpoint(self, pc):
+        self.breakpoints[pc] = 0
+        self.conditions.pop(pc, None)
+        self._update()
+
+    def watch(self, address, length=1):
+        """Break after any instruction writes to ``length`` bytes at
+        ``address``."""
+        for addr in range(address, address + length):
+            if not self.watched[addr]:
+                self.watched[addr] = 1
+                self._pages[addr >> PAGE_SHIFT] += 1
+        self._update()
+
+    def unwatch(self, address, length=1):
+        for addr in range(address, address + length):
+            if self.watched[addr]:
+                self.watched[addr] = 0
+                self._pages[addr >> PAGE_SHIFT] -= 1
+        self._update()
+
+    def clear(self):
+        """Remove every breakpoint and watchpoint."""
+        self.breakpoints[:] = bytes(len(self.breakpoints))
+        self.conditions.clear()
+        self.unwatch(0, len(self.watched))
+
+    def resume(self):
+        """Let execution continue past the breakpoint it stopped at."""
+        self._resume_pc = self.machine.pc
+
+    def _update(self):
+        machine = self.machine
+        breaking = any(self.breakpoints)
+        if breaking != self._breaking:
+            if breaking:
+                machine.add_hook('pre_instruction', self._check_pc)
+            else:
+                machine.remove_hook('pre_instruction', self._check_pc)
+            self._breaking = breaking
+        watching = any(self._pages)
+        if watching != self._watching:
+            if watching:
+                machine.add_hook('memory_write', self._check_write)
+            else:
+                machine.remove_hook('memory_write', self._check_write)
+            self._watching = watching
+
+    def _check_pc(self, machine, pc, instruction):
+        if not self.breakpoints[pc]:
+            return
+        if pc == self._resume_pc:
+            self._resume_pc = None
+            return
+        condition = self.conditions.get(pc)
+        if condition is None or condition(machine):
+            raise BreakpointHit(pc)
+
+    def _check_write(self, machine, address, length):
+        pages = self._pages
+        end = min(address + length, len(self.watched))
+        last_page = (end - 1) >> PAGE_SHIFT
+        for page in range(address >> PAGE_SHIFT, last_page + 1):
+            if pages[page]:
+                break
+        else:
+            return
+        for addr in range(address, end):
+            if self.watched[addr]:
+                raise WatchpointHit(addr, machine.pc - 2)
@@ -1,5 +1,3 @@
-# -*- coding: future_fstrings -*-
-
 import logging
 
 import pygame
@@ -7,55 +5,136 @@ import pygame
 SCALE_FACTOR = 10
 COLOUR_BLACK = pygame.Color(0, 0, 0, 255)
 COLOUR_WHITE = pygame.Color(255, 255, 255, 255)
+COLOUR_ORANGE = pygame.Color(255, 102, 0, 255)
+COLOUR_BROWN = pygame.Color(102, 34, 0, 255)
+# Colours by the bits of a pixel in each plane, the first plane's lowest.
+PALETTE = [COLOUR_BLACK, COLOUR_WHITE, COLOUR_ORANGE, COLOUR_BROWN]
+
+WIDTH = 64
+HEIGHT = 32
 
-COLOURS = {
-    0: COLOUR_BLACK,
-    1: COLOUR_WHITE
-}
+# Palette indices of the 8 pixels in each possible framebuffer byte.
+BYTE_PIXELS = [bytes((byte >> (7 - bit)) & 1 for bit in range(8))
+               for byte in range(256)]
 
 LOG = logging.getLogger(__name__)
 
 
 class GraphicsDisplay:
-    def __init__(self):
+    """pygame display.
+
+    Draws only mark framebuffer rows as dirty. ``present`` copies the dirty
+    rows into a native surface of the display resolution and scales it to
+    the window in one go, so it should be called once per frame. With
+    ``batched=False`` every draw is presented immediately.
+
+    With several bitplanes, the rows of each plane are spread into pixel
+    rows and combined with integer operations into palette indices.
+
+    Spreading rows into pixels is plain Python, so ``prepare`` can do it
+    ahead of ``present`` from another thread; everything touching pygame
+    has to stay on the main thread."""
+
+    def __init__(self, batched=True):
         LOG.info("Creating display")
         pygame.init()
         pygame.display.init()
         self.surface = pygame.display.set_mode(
-            (64 * SCALE_FACTOR, 32 * SCALE_FACTOR),
+            (WIDTH * SCALE_FACTOR, HEIGHT * SCALE_FACTOR),
             pygame.HWSURFACE | pygame.DOUBLEBUF, 8)
         pygame.display.set_caption('CHIP8')
+        self.batched = batched
+        self.width = WIDTH
+        self.height = HEIGHT
+        self.planes = 1
+        self._native = self._indexed_surface((WIDTH, HEIGHT))
+        # The window is scaled into directly if it uses indexed colours too,
+        # otherwise through a surface of the same size that is then blitted.
+        if self.surface.get_bitsize() == 8:
+            self.surface.set_palette(PALETTE)
+            self._scaled = self.surface
+        else:
+            self._scaled = self._indexed_surface(self.surface.get_size())
+        self._framebuffer = None
+        self._dirty = set()
+        # Pixel rows by y, spread by prepare from the framebuffer given.
+        self._prepared_framebuffer = None
+        self._prepared = {}
         self.clear()
 
-    def draw(self, x_start, y_start, n, source):
-        collision = False
-        for y in range(n):
-            sprite = source[y]
-            for x in range(8):
-                pixel = (sprite >> (7 - x)) & 1
-                new_x = x_start + x
-                new_x = new_x % 64
-                new_y = y_start + y
-                new_y = new_y % 32
-                new_pixel = pixel ^ self._is_pixel_set(new_x, new_y)
-                if new_pixel != pixel:
-                    collision = True
-                self._draw(new_x, new_y, COLOURS[new_pixel])
-        pygame.display.flip()
-        return collision
+    def draw(self, framebuffer, y_start, n):
+        """Mark rows y_start to y_start + n - 1 of the framebuffer as dirty."""
+        self._framebuffer = framebuffer
+        dirty = self._dirty
+        height = self.height
+        for y in range(y_start, y_start + n):
+            dirty.add(y % height)
+        if not self.batched:
+            self.present()
 
-    def _draw(self, x, y, colour):
-        LOG.debug(f"Drawing pixel at x:{x * SCALE_FACTOR} y:{y * SCALE_FACTOR} colour:{colour}")
-        self.surface.fill(colour,
-                          (x * SCALE_FACTOR,
-                           y * SCALE_FACTOR,
-                           SCALE_FACTOR,
-                           SCALE_FACTOR))
+    def resize(self, width, height, planes):
+        """Switch to a ``width`` by ``height`` display of ``planes`` planes."""
+        self.width, self.height, self.planes = width, height, planes
+        self._native = self._indexed_surface((width, height))
+        self.clear()
 
-    def _is_pixel_set(self, x, y):
-        colour = self.surface.get_at((x * SCALE_FACTOR, y * SCALE_FACTOR))
-        return colour == COLOUR_WHITE
+    def prepare(self, framebuffer, ys):
+        """Spread rows ``ys`` of the framebuffer into pixels for the next
+        ``present``. Does not touch pygame."""
+        height = self.height
+        self._prepared = {y % height: self._pixels(framebuffer, y % height)
+                          for y in ys}
+        self._prepared_framebuffer = framebuffer
 
-    def clear(self):
-        self.surface.fill(COLOUR_BLACK)
+    def _pixels(self, framebuffer, y):
+        """Return the palette indices of row ``y``, one byte per pixel."""
+        row_bytes = self.width // 8
+        pixels = b''.join([BYTE_PIXELS[byte]
+                           for byte in framebuffer[y].to_bytes(row_bytes, 'big')])
+        if self.planes > 1:
+            height = self.height
+            indices = int.from_bytes(pixels, 'big')
+            for plane in range(1, self.planes):
+                indices |= int.from_bytes(b''.join([
+                    BYTE_PIXELS[byte] for byte in
+                    framebuffer[plane * height + y].to_bytes(row_bytes, 'big')
+                ]), 'big') << plane
+            pixels = indices.to_bytes(self.width, 'big')
+        return pixels
+
+    def present(self):
+        """Show the rows changed since the last call, if any."""
+        if not self._dirty:
+            return
+        if self._framebuffer is not None:
+            buffer = self._native.get_buffer()
+            pitch = self._native.get_pitch()
+            framebuffer = self._framebuffer
+            prepared = {}
+            if self._prepared_framebuffer is framebuffer:
+                prepared = self._prepared
+            for y in self._dirty:
+                pixels = prepared.get(y)
+                if pixels is None:
+                    pixels = self._pixels(framebuffer, y)
+                buffer.write(pixels, y * pitch)
+            del buffer
+        self._dirty.clear()
+        self._prepared_framebuffer = None
+        self._prepared = {}
+        pygame.transform.scale(self._native, self._scaled.get_size(), self._scaled)
+        if self._scaled is not self.surface:
+            self.surface.blit(self._scaled, (0, 0))
         pygame.display.flip()
+
+    @staticmethod
+    def _indexed_surface(size):
+        surface = pygame.Surface(size, 0, 8)
+        surface.set_palette(PALETTE)
+        return surface
+
+    def clear(self):
+        self._native.fill(0)
+        self._dirty.update(range(self.height))
+        if not self.batched:
+            self.present()
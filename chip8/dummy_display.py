@@ -6,5 +6,11 @@ LOG = logging.getLogger(__name__)
 class DummyDisplay(object):
     """Dummy display"""
 
+    def resize(self, width, height, planes):
+        LOG.debug("Resizing display to %dx%d, %d planes", width, height, planes)
+
     def clear(self):
         LOG.debug("Clearing display")
+
+    def draw(self, framebuffer, y, n):
+        LOG.debug("Drawing rows %d-%d", y, y + n - 1)
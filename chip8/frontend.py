@@ -0,0 +1,241 @@
+"""asyncio frontend running input, emulation and presentation as separate
+tasks.
+
+Emulation advances in 60 Hz frames through a Scheduler and publishes each
+finished frame as an immutable snapshot of the framebuffer. Presentation
+picks up the latest snapshot at the display refresh rate. It works out the
+rows that changed, and has the display prepare them, in a worker thread,
+then draws and presents them from the event loop thread, as windowing
+systems such as SDL only support drawing from the main thread. Input is
+polled several times a frame and the key state handed to the emulation at
+the start of the next frame.
+
+When threaded, emulation runs in a thread of its own rather than on the
+event loop, so a slow draw or present never holds up emulation frames.
+
+When rendering would make emulation miss the deadline of its next frame,
+presentation skips it, up to ``max_frameskip`` refreshes in a row, to
+leave the host to emulation. The Scheduler makes that call, from how long
+the last render took.
+
+The tasks never share mutable state: each handoff is a single attribute
+holding a value that is replaced, never modified, which is atomic and needs
+no locks."""
+import asyncio
+import concurrent.futures
+import logging
+import time
+
+from chip8.core import CHIP8, DISPLAY_WIDTH, HIRES_HEIGHT, HIRES_WIDTH
+from chip8.scheduler import (DEFAULT_SPEED, MAX_FRAMESKIP, MAX_LAG,
+                             TIMER_FREQUENCY, Scheduler)
+
+LOG = logging.getLogger(__name__)
+
+REFRESH_RATE = 60
+INPUT_RATE = 240
+
+
+class Frontend(object):
+    """Run a machine and show it on ``display``.
+
+    The machine should have a display of its own that is cheap to draw to,
+    such as a HeadlessDisplay, as ``display`` is only drawn to from the
+    presentation task. If it has a ``prepare(framebuffer, ys)`` method, it
+    is called from the worker thread with the rows about to be drawn, and
+    must not call into the windowing system. ``poll_input`` is called from
+    the input task and returns ``(key, pressed)`` pairs for the keys that
+    changed.
+
+    Without ``realtime`` emulation runs as fast as it can, while input and
+    presentation keep to their rates. Without ``threaded`` emulation and
+    preparing rows run on the event loop too, so a slow render delays
+    emulation until frames are skipped to catch up.
+
+    ``lag`` is how far behind its deadline the last frame finished,
+    ``render_time`` how long the last render took and ``dropped_frames``
+    how many emulated frames were never rendered."""
+
+    def __init__(self, machine, display, speed=DEFAULT_SPEED, engine=None,
+                 poll_input=None, refresh_rate=REFRESH_RATE,
+                 input_rate=INPUT_RATE, realtime=True, threaded=True,
+                 clock=time.perf_counter, max_frameskip=MAX_FRAMESKIP):
+        self.machine = machine
+        self.display = display
+        self.poll_input = poll_input
+        self.refresh_rate = refresh_rate
+        self.input_rate = input_rate
+        self.realtime = realtime
+        self.threaded = threaded
+        self.clock = clock
+        # Frames are paced and presented here, the scheduler only decides
+        # which renders to skip.
+        self.scheduler = Scheduler(machine, speed, realtime=False,
+                                   engine=engine, poll=self._apply_input,
+                                   clock=clock, max_frameskip=max_frameskip)
+        self.running = False
+        self.presented = 0
+        self.dropped_frames = 0
+        self.lag = 0.0
+        self.render_time = 0.0
+        # Handoffs: the key held, from input to emulation, and the latest
+        # framebuffer snapshot, from emulation to presentation.
+        self.key = False
+        self.frame = None
+        # The snapshot last rendered, only replaced by presentation.
+        self._rendered = None
+        # When the next frame is due to finish emulating, None when not
+        # running in real time.
+        self._deadline = None
+
+    def stop(self):
+        self.running = False
+
+    def run(self, frames=None):
+        """Run until ``stop`` is called or ``frames`` frames have run."""
+        asyncio.run(self.run_async(frames))
+
+    async def run_async(self, frames=None):
+        self.running = True
+        executor = emulator = None
+        if self.threaded:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            emulator = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            emulation = asyncio.get_running_loop().run_in_executor(
+                emulator, self._emulate_thread, frames)
+        else:
+            emulation = self._emulate(frames)
+        try:
+            await asyncio.gather(self._input(), emulation,
+                                 self._present(executor))
+        finally:
+            self.running = False
+            if executor is not None:
+                executor.shutdown()
+                emulator.shutdown()
+
+    def _next_deadline(self, deadline, period, realtime=True):
+        """Return ``deadline + period`` as the next deadline and how long
+        to sleep until it, resynchronising when too far behind.
+
+        Without ``realtime`` there is no sleeping."""
+        deadline += period
+        delay = deadline - self.clock() if realtime else 0
+        if delay < -MAX_LAG:
+            LOG.info('Running %.3fs behind, resynchronising', -delay)
+            deadline = self.clock()
+        return deadline, max(delay, 0)
+
+    async def _pace(self, deadline, period, realtime=True):
+        """Sleep until the next deadline and return it.
+
+        Without ``realtime`` only yields to the other tasks."""
+        deadline, delay = self._next_deadline(deadline, period, realtime)
+        await asyncio.sleep(delay)
+        return deadline
+
+    async def _input(self):
+        period = 1.0 / self.input_rate
+        deadline = self.clock()
+        while self.running:
+            if self.poll_input is not None:
+                for key, pressed in self.poll_input():
+                    if pressed:
+                        self.key = key
+                    elif self.key == key:
+                        self.key = False
+            deadline = await self._pace(deadline, period)
+
+    def _apply_input(self):
+        key = self.key
+        if key != self.machine.key:
+            self.machine.key_pressed(key)
+
+    async def _emulate(self, frames):
+        period = 1.0 / TIMER_FREQUENCY
+        deadline = self.clock()
+        scheduler = self.scheduler
+        last_frame = None if frames is None else scheduler.frames + frames
+        while self.running and scheduler.frames != last_frame:
+            self._run_frame(deadline, period)
+            deadline = await self._pace(deadline, period, self.realtime)
+        self._deadline = None
+        self.running = False
+
+    def _emulate_thread(self, frames):
+        """_emulate, for a thread of its own."""
+        period = 1.0 / TIMER_FREQUENCY
+        deadline = self.clock()
+        scheduler = self.scheduler
+        last_frame = None if frames is None else scheduler.frames + frames
+        while self.running and scheduler.frames != last_frame:
+            self._run_frame(deadline, period)
+            deadline, delay = self._next_deadline(deadline, period,
+                                                  self.realtime)
+            if delay:
+                time.sleep(delay)
+        self._deadline = None
+        self.running = False
+
+    def _run_frame(self, deadline, period):
+        self.scheduler.run_frame()
+        self._publish()
+        if self.realtime:
+            self.lag = max(self.clock() - deadline - period, 0.0)
+            # Renders from now on must leave time for the next frame.
+            self._deadline = deadline + 2 * period
+
+    def _publish(self):
+        frame = tuple(self.machine.framebuffer)
+        if frame != self.frame:
+            if self.frame is not self._rendered:
+                self.dropped_frames += 1
+            self.frame = frame
+
+    async def _present(self, executor):
+        period = 1.0 / self.refresh_rate
+        deadline = self.clock()
+        scheduler = self.scheduler
+        while True:
+            frame = self.frame
+            if frame is not self._rendered:
+                if not (self.running and scheduler.skip_present(
+                        self.clock(), self._deadline)):
+                    await self._render(frame, self._rendered, executor)
+                    self._rendered = frame
+                    scheduler.present_time = self.render_time
+            if not self.running:
+                return
+            deadline = await self._pace(deadline, period)
+
+    async def _render(self, frame, previous, executor):
+        start = self.clock()
+        machine = self.machine
+        display = self.display
+        if machine.mode != CHIP8 and (
+                previous is None or len(frame) != len(previous)):
+            # The resolution changed, or this is the first frame.
+            height = len(frame) // machine.planes
+            width = HIRES_WIDTH if height == HIRES_HEIGHT else DISPLAY_WIDTH
+            display.resize(width, height, machine.planes)
+            previous = None
+        if executor is None:
+            ys = self._prepare(frame, previous)
+        else:
+            ys = await asyncio.get_running_loop().run_in_executor(
+                executor, self._prepare, frame, previous)
+        for y in ys:
+            display.draw(frame, y, 1)
+        display.present()
+        self.presented += 1
+        self.render_time = self.clock() - start
+
+    def _prepare(self, frame, previous):
+        """Return the rows of ``frame`` that differ from ``previous``, once
+        the display has prepared them."""
+        ys = [y for y, row in enumerate(frame)
+              if previous is None or row != previous[y]]
+        prepare = getattr(self.display, 'prepare', None)
+        if ys and prepare is not None:
+            prepare(frame, ys)
+        return ys
@@ -0,0 +1,385 @@
+"""Coverage-guided fuzzing of the emulator.
+
+A Fuzzer mutates ROM images and key sequences, runs them headless and keeps
+a corpus of the cases that execute a PC or an opcode no earlier case did.
+Cases that crash the emulator with an exception, or leave the stack pointer
+below the bottom of the stack, are shrunk to a smaller case crashing the
+same way and kept by crash signature.
+
+Cases run in batches across a process pool. Workers return the PCs and
+opcodes each case executed; the corpus and the coverage bitmaps live in the
+parent, which also shrinks crashes.
+
+Usage: python -m chip8.fuzz [options] [SEED_ROM_OR_DIRECTORY...]"""
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+
+from chip8.batch import find_roms, is_halted
+from chip8.core import (CHIP8, MEMORY_SIZES, MODES, PC_START_ADDRESS, Chip8,
+                        decode)
+from chip8.headless_display import HeadlessDisplay
+from chip8.scheduler import DEFAULT_SPEED, TIMER_FREQUENCY
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_CYCLES = 5000
+# Seed of every machine run, so that CXNN and with it crashes reproduce.
+MACHINE_SEED = 0
+# Cases handed to each worker process per batch.
+BATCH_PER_JOB = 32
+MAX_KEY_EVENTS = 32
+# Runs spent shrinking each new crash at most.
+MAX_SHRINK_EXECS = 1000
+# Seconds between progress reports.
+REPORT_INTERVAL = 5.0
+# Corpus used when no seed ROMs are given: clear the screen and loop.
+DEFAULT_SEED = b'\x00\xe0\x12\x02'
+
+# A ROM image and the key changes made while it runs, as (frame, key)
+# pairs with key False for a release.
+Case = collections.namedtuple('Case', 'rom keys')
+
+# How a case ran: its crash signature, or None, the PCs and opcodes it
+# executed and the number of instructions executed.
+Result = collections.namedtuple('Result', 'crash pcs opcodes cycles')
+
+
+def _hits(bitmap):
+    """Return the indices of the set bytes of a bitmap."""
+    hits = []
+    index = bitmap.find(1)
+    while index != -1:
+        hits.append(index)
+        index = bitmap.find(1, index + 1)
+    return hits
+
+
+def signature(machine, pc, error):
+    """Return what identifies a crash: the exception and the handler of the
+    instruction at ``pc`` that raised it."""
+    memory = machine.memory
+    name = None
+    if pc + 1 < len(memory):
+        decoded = decode(memory[pc] << 8 | memory[pc + 1], machine.mode)
+        name = decoded and decoded[0]
+    return type(error).__name__, str(error), name
+
+
+def execute(case, cycles=DEFAULT_CYCLES, speed=DEFAULT_SPEED, mode=CHIP8):
+    """Run a case headless for up to ``cycles`` instructions, or until it
+    halts, and return its Result.
+
+    Keys change and the timers tick every ``speed / 60`` instructions, as
+    they would when running in real time."""
+    machine = Chip8(HeadlessDisplay(), seed=MACHINE_SEED, mode=mode)
+    machine.load_rom(case.rom)
+    memory = machine.memory
+    execute_cycle = machine.execute_cycle
+    pcs = bytearray(len(memory))
+    opcodes = bytearray(0x10000)
+    keys = dict(case.keys)
+    per_frame = max(1, speed // TIMER_FREQUENCY)
+    crash = None
+    frame = 0
+    pc = machine.pc
+    try:
+        while machine.cycles < cycles and not is_halted(machine):
+            if frame in keys:
+                machine.key_pressed(keys[frame])
+            for _ in range(min(per_frame, cycles - machine.cycles)):
+                pc = machine.pc
+                pcs[pc] = 1
+                opcodes[memory[pc] << 8 | memory[pc + 1]] = 1
+                execute_cycle()
+                if machine.stack_ptr < 0:
+                    raise RuntimeError('Stack underflow')
+            machine.tick_timers()
+            frame += 1
+    except Exception as e:  # Finding these is the point
+        crash = signature(machine, pc, e)
+    return Result(crash, _hits(pcs), _hits(opcodes), machine.cycles)
+
+
+def _execute(job):
+    return execute(*job)
+
+
+class Fuzzer(object):
+    """Grow a corpus of cases by coverage and collect the crashes found.
+
+    ``seeds`` are the ROM images to start from. ``seed`` seeds the
+    mutations, so a fuzzing run given the same seeds reproduces."""
+
+    def __init__(self, seeds=(), cycles=DEFAULT_CYCLES, speed=DEFAULT_SPEED,
+                 mode=CHIP8, seed=None):
+        self.cycles = cycles
+        self.speed = speed
+        self.mode = mode
+        self.random = random.Random(seed)
+        self.max_rom_size = MEMORY_SIZES[mode] - PC_START_ADDRESS
+        self.frames = cycles // max(1, speed // TIMER_FREQUENCY) + 1
+        self.seeds = [Case(bytes(rom[:self.max_rom_size]), ())
+                      for rom in seeds] or [Case(DEFAULT_SEED, ())]
+        self.corpus = []
+        # Shrunk crashing cases by crash signature.
+        self.crashes = {}
+        self.pcs = bytearray(MEMORY_SIZES[mode])
+        self.opcodes = bytearray(0x10000)
+        self.execs = 0
+        self.shrink_execs = 0
+        self.elapsed = 0.0
+        self._mutations = (
+            self._flip_bit,
+            self._set_byte,
+            self._set_instruction,
+            self._insert_instruction,
+            self._delete_instruction,
+            self._splice,
+            self._add_key,
+            self._drop_key,
+        )
+
+    def run(self, execs=None, seconds=None, executor=None, jobs=1,
+            report=None):
+        """Fuzz until ``execs`` cases have run or ``seconds`` have passed.
+
+        Cases run through ``executor`` if given, which should have ``jobs``
+        workers, and in this process otherwise. ``report`` is called with
+        the fuzzer after every batch."""
+        start = time.perf_counter()
+        batch = list(self.seeds) if not self.execs else self._batch(jobs)
+        while True:
+            if execs is not None:
+                batch = batch[:execs - self.execs]
+            if not batch:
+                break
+            work = [(case, self.cycles, self.speed, self.mode)
+                    for case in batch]
+            # Only running the cases counts towards the rate, not the
+            # bookkeeping here.
+            batch_start = time.perf_counter()
+            if executor is None:
+                results = list(map(_execute, work))
+            else:
+                results = list(executor.map(
+                    _execute, work,
+                    chunksize=max(1, len(batch) // (jobs * 4))))
+            self.elapsed += time.perf_counter() - batch_start
+            for case, result in zip(batch, results):
+                self.execs += 1
+                self._add(case, result)
+            if report is not None:
+                report(self)
+            if seconds is not None and time.perf_counter() - start >= seconds:
+                break
+            batch = self._batch(jobs)
+
+    def _batch(self, jobs):
+        parents = self.corpus or self.seeds
+        return [self.mutate(self.random.choice(parents))
+                for _ in range(BATCH_PER_JOB * jobs)]
+
+    def _add(self, case, result):
+        new = False
+        for bitmap, hits in ((self.pcs, result.pcs),
+                             (self.opcodes, result.opcodes)):
+            for index in hits:
+                if not bitmap[index]:
+                    bitmap[index] = 1
+                    new = True
+        if result.crash is not None:
+            if result.crash not in self.crashes:
+                LOG.info('New crash %s', result.crash)
+                self.crashes[result.crash] = self.shrink(case, result.crash)
+        elif new:
+            self.corpus.append(case)
+
+    def shrink(self, case, crash):
+        """Return a smaller case crashing with the same signature.
+
+        Key events are dropped one at a time, then runs of instructions
+        removed from the ROM in halving chunk sizes."""
+        budget = [MAX_SHRINK_EXECS]
+
+        def crashes(candidate):
+            if not budget[0]:
+                return False
+            budget[0] -= 1
+            self.shrink_execs += 1
+            return execute(candidate, self.cycles, self.speed,
+                           self.mode).crash == crash
+
+        keys = list(case.keys)
+        for event in list(keys):
+            trial = [other for other in keys if other != event]
+            if crashes(Case(case.rom, tuple(trial))):
+                keys = trial
+        keys = tuple(keys)
+        rom = case.rom
+        chunk = len(rom) // 2 & ~1 or 2
+        while chunk >= 2:
+            start = 0
+            while start < len(rom):
+                trial = rom[:start] + rom[start + chunk:]
+                if trial and crashes(Case(trial, keys)):
+                    rom = trial
+                else:
+                    start += chunk
+            chunk = chunk // 2 & ~1
+        return Case(rom, keys)
+
+    # MUTATIONS
+
+    def mutate(self, case):
+        """Return a case derived from ``case`` by a few random mutations."""
+        rom = bytearray(case.rom or DEFAULT_SEED)
+        keys = list(case.keys)
+        for _ in range(1 << self.random.randrange(4)):
+            self.random.choice(self._mutations)(rom, keys)
+        keys.sort(key=lambda event: event[0])
+        return Case(bytes(rom[:self.max_rom_size] or DEFAULT_SEED),
+                    tuple(keys[:MAX_KEY_EVENTS]))
+
+    def _instruction_offset(self, rom):
+        return self.random.randrange(0, len(rom), 2) if rom else 0
+
+    def _flip_bit(self, rom, keys):
+        if rom:
+            index = self.random.randrange(len(rom))
+            rom[index] ^= 1 << self.random.randrange(8)
+
+    def _set_byte(self, rom, keys):
+        if rom:
+            rom[self.random.randrange(len(rom))] = self.random.randrange(256)
+
+    def _set_instruction(self, rom, keys):
+        offset = self._instruction_offset(rom)
+        instruction = self.random.randrange(0x10000)
+        rom[offset:offset + 2] = instruction.to_bytes(2, 'big')
+
+    def _insert_instruction(self, rom, keys):
+        offset = self._instruction_offset(rom)
+        rom[offset:offset] = self.random.randrange(0x10000).to_bytes(2, 'big')
+
+    def _delete_instruction(self, rom, keys):
+        offset = self._instruction_offset(rom)
+        del rom[offset:offset + 2]
+
+    def _splice(self, rom, keys):
+        """Copy a run of instructions from another corpus case."""
+        other = self.random.choice(self.corpus or self.seeds).rom
+        start = self._instruction_offset(other)
+        length = self.random.randrange(2, 34, 2)
+        offset = self._instruction_offset(rom)
+        rom[offset:offset + length] = other[start:start + length]
+
+    def _add_key(self, rom, keys):
+        key = self.random.randrange(17)
+        keys.append((self.random.randrange(self.frames),
+                     key if key < 16 else False))
+
+    def _drop_key(self, rom, keys):
+        if keys:
+            del keys[self.random.randrange(len(keys))]
+
+    def stats(self):
+        elapsed = self.elapsed or float('inf')
+        return {
+            'execs': self.execs,
+            'execs_per_second': self.execs / elapsed,
+            'shrink_execs': self.shrink_execs,
+            'corpus': len(self.corpus),
+            'pcs': sum(self.pcs),
+            'opcodes': sum(self.opcodes),
+            'crashes': len(self.crashes),
+        }
+
+    def save(self, directory):
+        """Write the corpus and the crashes to ``corpus`` and ``crashes``
+        below ``directory``, one JSON file per case named by its hash."""
+        for name, cases in (('corpus', [(case, None) for case in self.corpus]),
+                            ('crashes', [(case, crash) for crash, case
+                                         in self.crashes.items()])):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+            for case, crash in cases:
+                fields = {'rom': case.rom.hex(), 'keys': case.keys}
+                if crash is not None:
+                    fields['crash'] = crash
+                digest = hashlib.sha1(json.dumps(fields).encode()).hexdigest()
+                with open(os.path.join(directory, name, digest + '.json'),
+                          'w') as case_file:
+                    json.dump(fields, case_file)
+
+
+def load_case(path):
+    with open(path) as case_file:
+        fields = json.load(case_file)
+    return Case(bytes.fromhex(fields['rom']),
+                tuple(tuple(event) for event in fields['keys']))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Fuzz the emulator with mutated ROMs and input.')
+    parser.add_argument('seeds', nargs='*', metavar='ROM',
+                        help='seed ROM files or directories of ROMs')
+    parser.add_argument('--execs', type=int, help='cases to run')
+    parser.add_argument('--time', type=float, default=60.0,
+                        help='seconds to fuzz for')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='worker processes')
+    parser.add_argument('--cycles', type=int, default=DEFAULT_CYCLES,
+                        help='instructions to run per case')
+    parser.add_argument('--speed', type=int, default=DEFAULT_SPEED,
+                        help='instructions per emulated second')
+    parser.add_argument('--mode', choices=MODES, default=CHIP8)
+    parser.add_argument('--seed', type=int, help='seed the mutations')
+    parser.add_argument('--output', '-o', default='fuzz',
+                        help='directory to write the corpus and crashes to')
+    options = parser.parse_args(args)
+
+    seeds = []
+    for path in find_roms(options.seeds):
+        with open(path, 'rb') as rom_file:
+            seeds.append(rom_file.read())
+    fuzzer = Fuzzer(seeds, options.cycles, options.speed, options.mode,
+                    options.seed)
+    last_report = time.perf_counter()
+
+    def report(fuzzer):
+        nonlocal last_report
+        if time.perf_counter() - last_report < REPORT_INTERVAL:
+            return
+        last_report = time.perf_counter()
+        stats = fuzzer.stats()
+        LOG.info('%d execs, %.0f/s per core, corpus %d, %d PCs, %d opcodes, '
+                 '%d crashes', stats['execs'],
+                 stats['execs_per_second'] / options.jobs, stats['corpus'],
+                 stats['pcs'], stats['opcodes'], stats['crashes'])
+
+    with concurrent.futures.ProcessPoolExecutor(options.jobs) as executor:
+        fuzzer.run(options.execs, options.time, executor, options.jobs,
+                   report)
+    fuzzer.save(options.output)
+
+    stats = fuzzer.stats()
+    print(f'{stats["execs"]} execs in {fuzzer.elapsed:.1f}s: '
+          f'{stats["execs_per_second"] / options.jobs:.0f} execs/s per core '
+          f'on {options.jobs} cores')
+    print(f'Corpus of {stats["corpus"]} cases covering {stats["pcs"]} PCs and '
+          f'{stats["opcodes"]} opcodes')
+    for crash, case in sorted(fuzzer.crashes.items()):
+        print(f'Crash {crash[0]}: {crash[1]} in {crash[2]} '
+              f'({len(case.rom)} byte ROM, {len(case.keys)} key events)')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,30 @@
+import logging
+
+LOG = logging.getLogger(__name__)
+
+
+class HeadlessDisplay(object):
+    """Display without any output, for headless runs.
+
+    Keeps a reference to the framebuffer last drawn and counts clears,
+    draws and presented frames."""
+
+    def __init__(self):
+        self.size = None
+        self.framebuffer = None
+        self.clears = 0
+        self.draws = 0
+        self.frames = 0
+
+    def resize(self, width, height, planes):
+        self.size = (width, height, planes)
+
+    def clear(self):
+        self.clears += 1
+
+    def draw(self, framebuffer, y, n):
+        self.framebuffer = framebuffer
+        self.draws += 1
+
+    def present(self):
+        self.frames += 1
@@ -0,0 +1,110 @@
+"""Per-handler and per-PC profiling of a running Chip8.
+
+While a Profiler runs, every handler in the machine's dispatch table is
+wrapped to count its calls and time them, keyed by the PC of the
+instruction. Jumps that go backwards are counted as loop iterations. Once
+stopped, the machine dispatches to the plain handlers again."""
+import collections
+import time
+
+from chip8.core import HANDLER_NAMES
+
+# Handlers whose backward jumps close a loop.
+JUMPS = ('jump', 'jump_to_v0_plus_nnn')
+
+
+def _profiled(name):
+    clock = time.perf_counter
+
+    def wrap(handler):
+        def profiled(self, *args):
+            pc = self.pc - 2
+            start = clock()
+            handler(self, *args)
+            elapsed = clock() - start
+            site = self.profiler.sites[pc, name]
+            site[0] += 1
+            site[1] += elapsed
+            if name in JUMPS and self.pc <= pc:
+                self.profiler.loops[self.pc, pc] += 1
+        return profiled
+    return wrap
+
+
+_PROFILED = tuple((name, _profiled(name)) for name in HANDLER_NAMES)
+
+
+class Profiler(object):
+    """Profile the instructions a machine executes.
+
+    ``sites`` maps ``(pc, handler name)`` to ``[calls, seconds]`` and
+    ``loops`` maps ``(loop start, jump pc)`` to the number of iterations."""
+
+    def __init__(self, machine):
+        self.machine = machine
+        self.sites = collections.defaultdict(lambda: [0, 0.0])
+        self.loops = collections.Counter()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self.machine.profiler = self
+        self.machine.set_overrides('profiler', _PROFILED)
+
+    def stop(self):
+        self.machine.set_overrides('profiler', None)
+        self.machine.profiler = None
+
+    def handlers(self):
+        """Return ``{handler name: [calls, seconds]}``."""
+        totals = collections.defaultdict(lambda: [0, 0.0])
+        for (pc, name), (calls, seconds) in self.sites.items():
+            total = totals[name]
+            total[0] += calls
+            total[1] += seconds
+        return dict(totals)
+
+    def hot_pcs(self, top=10):
+        """Return the ``top`` most executed ``(pc, handler name, calls)``."""
+        sites = sorted(self.sites.items(), key=lambda item: -item[1][0])
+        return [(pc, name, calls) for (pc, name), (calls, _) in sites[:top]]
+
+    def hot_loops(self, top=10):
+        """Return the ``top`` most iterated ``(start, end, iterations)``."""
+        return [(start, end, iterations)
+                for (start, end), iterations in self.loops.most_common(top)]
+
+    def report(self, top=10):
+        """Return a text report of the top handlers, PCs and loops."""
+        handlers = sorted(self.handlers().items(), key=lambda item: -item[1][1])
+        total = sum(seconds for _, seconds in self.handlers().values()) or 1.0
+        lines = ['{:<28} {:>10} {:>10} {:>8} {:>6}'.format(
+            'handler', 'calls', 'ms', 'ns/call', '%')]
+        for name, (calls, seconds) in handlers[:top]:
+            lines.append('{:<28} {:>10} {:>10.2f} {:>8.0f} {:>6.1f}'.format(
+                name, calls, seconds * 1e3, seconds * 1e9 / calls,
+                seconds * 100 / total))
+        lines.append('')
+        lines.append('{:<8} {:<28} {:>10}'.format('pc', 'handler', 'calls'))
+        for pc, name, calls in self.hot_pcs(top):
+            lines.append('{:<8} {:<28} {:>10}'.format(hex(pc), name, calls))
+        lines.append('')
+        lines.append('{:<17} {:>10}'.format('loop', 'iterations'))
+        for start, end, iterations in self.hot_loops(top):
+            lines.append('{:<17} {:>10}'.format(
+                '{}-{}'.format(hex(start), hex(end)), iterations))
+        return '\n'.join(lines)
+
+    def write_collapsed(self, stream, weight='time'):
+        """Write the profile in the collapsed stack format read by flame
+        graph tools, one ``pc;handler value`` line per site.
+
+        Values are microseconds for ``weight='time'``, calls otherwise."""
+        for (pc, name), (calls, seconds) in sorted(self.sites.items()):
+            value = int(seconds * 1e6) if weight == 'time' else calls
+            stream.write('{};{} {}\n'.format(hex(pc), name, value))
@@ -0,0 +1,119 @@
+"""Recording and replaying input sessions.
+
+An InputRecorder logs every key change of a seeded machine with the cycle
+it happened at. Together with the seed, the quirk profile, the speed and
+the ROM this pins a run down completely, so ``replay`` can reproduce it
+headless and unthrottled, far faster than it was played.
+
+Usage: python -m chip8.replay ROM SESSION"""
+import argparse
+import collections
+import hashlib
+import json
+import time
+
+from chip8.core import Chip8
+from chip8.headless_display import HeadlessDisplay
+from chip8.scheduler import DEFAULT_SPEED, Scheduler
+from chip8.translator import TranslationCache
+
+SESSION_VERSION = 1
+
+# Sessions recorded before quirk profiles ran with the default ones.
+Session = collections.namedtuple(
+    'Session', 'rom_sha1 seed speed cycles events quirks', defaults=[None])
+
+
+class InputRecorder(object):
+    """Record the key changes of a machine for ``replay``.
+
+    The machine has to be seeded and run by a Scheduler at ``speed``, with
+    keys changed from its poll callback."""
+
+    def __init__(self, machine, speed=DEFAULT_SPEED):
+        if machine.seed is None:
+            raise ValueError('Only seeded machines can be replayed')
+        self.machine = machine
+        self.speed = speed
+        self.events = []
+        machine.add_hook('key', self._record)
+
+    def _record(self, machine, key):
+        self.events.append((machine.cycles, key))
+
+    def session(self, rom):
+        return Session(hashlib.sha1(rom).hexdigest(), self.machine.seed,
+                       self.speed, self.machine.cycles, list(self.events),
+                       self.machine.quirks)
+
+    def save(self, path, rom):
+        """Write the session so far to a file."""
+        save(self.session(rom), path)
+
+    def close(self):
+        self.machine.remove_hook('key', self._record)
+
+
+def save(session, path):
+    with open(path, 'w') as session_file:
+        json.dump(dict(session._asdict(), version=SESSION_VERSION),
+                  session_file)
+
+
+def load(path):
+    with open(path) as session_file:
+        fields = json.load(session_file)
+    version = fields.pop('version', None)
+    if version != SESSION_VERSION:
+        raise ValueError('Unsupported session version {}'.format(version))
+    fields['events'] = [tuple(event) for event in fields['events']]
+    return Session(**fields)
+
+
+def replay(session, rom, display=None, translate=False):
+    """Replay a session unthrottled and return the machine at its end."""
+    if hashlib.sha1(rom).hexdigest() != session.rom_sha1:
+        raise ValueError('Session was recorded with another ROM')
+    machine = Chip8(display or HeadlessDisplay(), seed=session.seed,
+                    quirks=session.quirks)
+    machine.load_rom(rom)
+    events = iter(session.events)
+    pending = [next(events, None)]
+
+    def poll():
+        event = pending[0]
+        while event is not None and event[0] <= machine.cycles:
+            machine.key_pressed(event[1])
+            event = next(events, None)
+        pending[0] = event
+
+    engine = TranslationCache(machine) if translate else None
+    scheduler = Scheduler(machine, session.speed, realtime=False,
+                          engine=engine, poll=poll)
+    while machine.cycles < session.cycles:
+        scheduler.run_frame()
+    return machine
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Replay a Chip8 session.')
+    parser.add_argument('rom')
+    parser.add_argument('session')
+    parser.add_argument('--translate', action='store_true')
+    options = parser.parse_args(args)
+
+    with open(options.rom, 'rb') as rom_file:
+        rom = rom_file.read()
+    session = load(options.session)
+    start = time.perf_counter()
+    machine = replay(session, rom, translate=options.translate)
+    elapsed = time.perf_counter() - start
+    played = session.cycles / session.speed
+    print(f'Replayed {machine.cycles} cycles ({played:.1f}s of play) '
+          f'in {elapsed:.2f}s, PC {machine.pc:#05x}')
+    print(f'Framebuffer SHA-1: '
+          f'{hashlib.sha1(machine.framebuffer_bytes()).hexdigest()}')
+
+
+if __name__ == '__main__':
+    main()
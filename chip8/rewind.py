@@ -0,0 +1,123 @@
+"""Rewind buffer recording the state of a Chip8 every frame.
+
+Every ``keyframe_interval`` frames a full save state is kept. The frames in
+between are stored as the runs of bytes that changed since the previous
+frame, XORed against it, so that a frame that only touched a few registers
+and framebuffer rows costs a few dozen bytes. Seeking back applies at most
+``keyframe_interval - 1`` deltas to one keyframe."""
+import time
+
+from chip8 import state
+
+DEFAULT_CAPACITY = 60 * 60 * 5
+DEFAULT_KEYFRAME_INTERVAL = 60
+
+# Deltas are made of the chunks of this many bytes that changed, found by
+# first comparing whole regions of the state.
+CHUNK_SIZE = 32
+_REGIONS = (
+    (0, state.MEMORY_OFFSET),
+    (state.MEMORY_OFFSET, state.FRAMEBUFFER_OFFSET),
+    (state.FRAMEBUFFER_OFFSET, state.STATE_SIZE),
+)
+
+
+def _xor(a, b):
+    return (int.from_bytes(a, 'little') ^ int.from_bytes(b, 'little')).to_bytes(
+        len(a), 'little')
+
+
+def _delta(previous, current):
+    delta = []
+    with memoryview(previous) as old, memoryview(current) as new:
+        for start, end in _REGIONS:
+            if old[start:end] == new[start:end]:
+                continue
+            for offset in range(start, end, CHUNK_SIZE):
+                chunk = slice(offset, min(offset + CHUNK_SIZE, end))
+                if old[chunk] != new[chunk]:
+                    delta.append((offset, _xor(old[chunk], new[chunk])))
+    return tuple(delta)
+
+
+def _apply(blob, delta):
+    for offset, changes in delta:
+        end = offset + len(changes)
+        blob[offset:end] = _xor(blob[offset:end], changes)
+
+
+class RewindBuffer(object):
+    """Ring buffer of the last ``capacity`` frames of a machine.
+
+    Call ``record`` once per frame. Frames are numbered from 0 in recording
+    order; ``seek`` restores any frame from ``oldest`` up to the last one
+    recorded."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY,
+                 keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+        # Whole keyframe intervals, at least two so that a complete interval
+        # survives while the oldest one is being overwritten.
+        intervals = max(2, -(-capacity // keyframe_interval))
+        self.capacity = intervals * keyframe_interval
+        self.keyframe_interval = keyframe_interval
+        self.frames = 0
+        self.record_time = 0.0
+        # The oldest frame not yet overwritten.
+        self._first = 0
+        self._entries = [None] * self.capacity
+        self._previous = bytearray(state.STATE_SIZE)
+        self._current = bytearray(state.STATE_SIZE)
+
+    @property
+    def oldest(self):
+        """The oldest frame that can still be restored."""
+        interval = self.keyframe_interval
+        return -(-self._first // interval) * interval
+
+    def record(self, machine):
+        """Record the state of the machine as the next frame."""
+        start = time.perf_counter()
+        current = state.save(machine, self._current)
+        if self.frames % self.keyframe_interval == 0:
+            entry = bytes(current)
+        else:
+            entry = _delta(self._previous, current)
+        self._entries[self.frames % self.capacity] = entry
+        self._first = max(self._first, self.frames - self.capacity + 1)
+        self._previous, self._current = current, self._previous
+        self.frames += 1
+        self.record_time += time.perf_counter() - start
+
+    def seek(self, machine, frame):
+        """Restore a recorded frame.
+
+        Recording carries on from the restored frame, discarding the ones
+        after it. Code translated by an execution engine has to be flushed
+        by the caller."""
+        if not self.oldest <= frame < self.frames:
+            raise IndexError('Frame {} is not in the rewind buffer'.format(frame))
+        keyframe = frame - frame % self.keyframe_interval
+        blob = bytearray(self._entries[keyframe % self.capacity])
+        for delta_frame in range(keyframe + 1, frame + 1):
+            _apply(blob, self._entries[delta_frame % self.capacity])
+        state.restore(machine, blob)
+        self._previous[:] = blob
+        self.frames = frame + 1
+
+    def rewind(self, machine, frames=1):
+        """Step back ``frames`` frames from the last one recorded."""
+        self.seek(machine, self.frames - 1 - frames)
+
+    def record_overhead(self):
+        """Average time spent in ``record``, in seconds per frame."""
+        return self.record_time / self.frames if self.frames else 0.0
+
+    def size(self):
+        """Approximate number of bytes held by recorded frames."""
+        total = 0
+        for entry in self._entries:
+            if isinstance(entry, bytes):
+                total += len(entry)
+            elif entry is not None:
+                total += sum(16 + len(changes) for _, changes in entry)
+        return total
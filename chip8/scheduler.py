@@ -0,0 +1,127 @@
+import logging
+import time
+
+LOG = logging.getLogger(__name__)
+
+TIMER_FREQUENCY = 60
+DEFAULT_SPEED = 700
+# How far behind real time the scheduler may fall before it gives up on
+# catching up and restarts pacing from the current time.
+MAX_LAG = 0.25
+# Most frames in a row that may go unpresented to catch up with real time.
+MAX_FRAMESKIP = 5
+
+
+class Scheduler(object):
+    """Run a Chip8 at a fixed number of instructions per second.
+
+    Emulation advances one 60 Hz frame at a time: the instructions due in the
+    frame are executed in one batch, then the timers tick once. Timers
+    therefore run at 60 Hz of emulated time whatever the CPU speed.
+
+    In realtime mode frames are paced against absolute deadlines, so the
+    scheduler sleeps at most once per frame and oversleeping in one frame is
+    made up in the next. Otherwise frames run back to back as fast as the
+    host allows.
+
+    ``engine`` is anything with a ``run(cycles)`` method, the machine itself
+    by default. ``poll`` is called at the start of every frame and
+    ``present`` at the end of it.
+
+    When a realtime scheduler falls behind, it skips presenting frames whose
+    emulation would not leave time to present them, up to ``max_frameskip``
+    in a row, so the CPU and timers stay on schedule on an overloaded host.
+    Frontends presenting frames themselves make the same call through
+    ``skip_present``.
+    ``emulation_time`` and ``present_time`` hold how long the last frame
+    took to emulate and present, ``lag`` how far behind its deadline the
+    last frame finished emulating and ``dropped_frames`` how many frames
+    went unpresented."""
+
+    def __init__(self, machine, speed=DEFAULT_SPEED, realtime=True,
+                 engine=None, poll=None, present=None,
+                 clock=time.perf_counter, sleep=time.sleep,
+                 max_frameskip=MAX_FRAMESKIP):
+        self.machine = machine
+        self.engine = engine if engine is not None else machine
+        self.speed = speed
+        self.realtime = realtime
+        self.poll = poll
+        self.present = present
+        self.clock = clock
+        self.sleep = sleep
+        self.max_frameskip = max_frameskip
+        self.frames = 0
+        self.running = False
+        self.dropped_frames = 0
+        self.lag = 0.0
+        self.emulation_time = 0.0
+        self.present_time = 0.0
+        # Deadline of the frame being run, None when not pacing.
+        self._deadline = None
+        self._skipped = 0
+        # Fraction of an instruction carried over between frames, for speeds
+        # that are not a multiple of the timer frequency.
+        self._budget = 0.0
+
+    def run_frame(self):
+        """Emulate one frame and return the number of instructions run."""
+        self._budget += self.speed / TIMER_FREQUENCY
+        cycles = int(self._budget)
+        self._budget -= cycles
+        if self.poll is not None:
+            self.poll()
+        start = self.clock()
+        executed = self.engine.run(cycles)
+        self.machine.tick_timers()
+        end = self.clock()
+        self.emulation_time = end - start
+        if self._deadline is not None:
+            self.lag = max(end - self._deadline, 0.0)
+        if self.present is not None:
+            if self.skip_present(end, self._deadline):
+                self.dropped_frames += 1
+            else:
+                self.present()
+                self.present_time = self.clock() - end
+        self.frames += 1
+        return executed
+
+    def skip_present(self, now, deadline):
+        """Return whether to skip presenting a frame at ``now``, as taking
+        ``present_time`` to present it would miss ``deadline``.
+
+        Without a deadline frames are always presented."""
+        if (deadline is not None and self._skipped < self.max_frameskip and
+                now + self.present_time > deadline):
+            self._skipped += 1
+            return True
+        self._skipped = 0
+        return False
+
+    def run(self, frames=None):
+        """Run until ``stop`` is called or ``frames`` frames have run."""
+        period = 1.0 / TIMER_FREQUENCY
+        deadline = self.clock()
+        last_frame = None if frames is None else self.frames + frames
+        self.running = True
+        try:
+            while self.running and self.frames != last_frame:
+                if not self.realtime:
+                    self.run_frame()
+                    continue
+                deadline += period
+                self._deadline = deadline
+                self.run_frame()
+                delay = deadline - self.clock()
+                if delay > 0:
+                    self.sleep(delay)
+                elif delay < -MAX_LAG:
+                    LOG.info('Running %.3fs behind, resynchronising', -delay)
+                    deadline = self.clock()
+        finally:
+            self._deadline = None
+            self.running = False
+
+    def stop(self):
+        self.running = False
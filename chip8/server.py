@@ -0,0 +1,204 @@
+"""Headless server streaming the display of a Chip8 over a socket.
+
+Clients connect over a Unix domain socket or localhost TCP. Every message
+is a type byte and a little-endian 16-bit payload length, then the payload.
+
+The server sends FRAME messages: a 32-bit frame number, a row count and
+then, for each row that changed, its index, a mask byte with one bit per
+byte of the row (most significant bit first) and the non-zero bytes of the
+row XOR the previous frame. A client's first frame is relative to a blank
+screen, so bandwidth and encoding cost follow the pixels that change.
+
+Clients send KEY messages, one byte per key change: the key in the low
+nibble and bit 7 set when it was pressed.
+
+Usage: python -m chip8.server ROM (--socket PATH | --port PORT)"""
+import argparse
+import asyncio
+import logging
+import struct
+
+from chip8.core import Chip8, DISPLAY_HEIGHT
+from chip8.frontend import Frontend
+from chip8.headless_display import HeadlessDisplay
+from chip8.scheduler import DEFAULT_SPEED
+
+LOG = logging.getLogger(__name__)
+
+MESSAGE = struct.Struct('<BH')
+FRAME_MESSAGE = ord('F')
+KEY_MESSAGE = ord('K')
+FRAME_HEADER = struct.Struct('<IB')
+KEY_PRESSED = 0x80
+
+# Clients further behind than this many bytes are disconnected.
+MAX_BACKLOG = 1 << 20
+
+
+def encode_rows(rows, previous, ys):
+    """Return the row count and encoding of rows ``ys`` of ``rows`` against
+    ``previous``, skipping rows that did not change."""
+    count = 0
+    encoded = bytearray()
+    for y in ys:
+        delta = rows[y] ^ previous[y]
+        if not delta:
+            continue
+        mask = 0
+        changes = bytearray()
+        for index, byte in enumerate(delta.to_bytes(8, 'big')):
+            if byte:
+                mask |= 0x80 >> index
+                changes.append(byte)
+        encoded.append(y)
+        encoded.append(mask)
+        encoded += changes
+        count += 1
+    return count, encoded
+
+
+def decode_rows(payload, framebuffer):
+    """Apply the rows of a FRAME payload to a framebuffer and return the
+    frame number."""
+    frame, count = FRAME_HEADER.unpack_from(payload)
+    offset = FRAME_HEADER.size
+    for _ in range(count):
+        y, mask = payload[offset], payload[offset + 1]
+        offset += 2
+        delta = 0
+        for index in range(8):
+            delta <<= 8
+            if mask & 0x80 >> index:
+                delta |= payload[offset]
+                offset += 1
+        framebuffer[y] ^= delta
+    return frame
+
+
+def frame_message(frame, rows, previous, ys):
+    count, encoded = encode_rows(rows, previous, ys)
+    payload = FRAME_HEADER.pack(frame, count) + encoded
+    return MESSAGE.pack(FRAME_MESSAGE, len(payload)) + payload
+
+
+def key_message(key, pressed):
+    return MESSAGE.pack(KEY_MESSAGE, 1) + bytes(
+        [key | (KEY_PRESSED if pressed else 0)])
+
+
+async def read_message(reader):
+    """Return the next ``(type, payload)`` from a stream."""
+    kind, length = MESSAGE.unpack(await reader.readexactly(MESSAGE.size))
+    return kind, await reader.readexactly(length)
+
+
+class Server(object):
+    """Run a machine headless and stream its display to clients.
+
+    The server acts as the display of a Frontend, which hands it the rows
+    that changed since the last frame."""
+
+    def __init__(self, machine, speed=DEFAULT_SPEED, engine=None,
+                 realtime=True):
+        self.frontend = Frontend(machine, self, speed, engine=engine,
+                                 poll_input=self._poll_input,
+                                 realtime=realtime, threaded=False)
+        self.clients = []
+        self.frames = 0
+        self.bytes_sent = 0
+        # Rows as last sent to the clients.
+        self.rows = [0] * DISPLAY_HEIGHT
+        self._frame = None
+        self._changed = set()
+        self._keys = []
+
+    def resize(self, width, height, planes):
+        raise ValueError('Only the CHIP-8 display can be streamed')
+
+    def draw(self, frame, y, n):
+        self._frame = frame
+        self._changed.update(range(y, y + n))
+
+    def present(self):
+        if not self._changed:
+            return
+        message = frame_message(self.frames, self._frame, self.rows,
+                                sorted(self._changed))
+        for y in self._changed:
+            self.rows[y] = self._frame[y]
+        self._changed.clear()
+        self.frames += 1
+        for writer in list(self.clients):
+            if writer.transport.get_write_buffer_size() > MAX_BACKLOG:
+                LOG.warning('Dropping client too far behind')
+                self._disconnect(writer)
+            else:
+                writer.write(message)
+                self.bytes_sent += len(message)
+
+    def _poll_input(self):
+        keys, self._keys = self._keys, []
+        return keys
+
+    def _disconnect(self, writer):
+        if writer in self.clients:
+            self.clients.remove(writer)
+        writer.close()
+
+    async def _serve_client(self, reader, writer):
+        # Bring the client up to date before it joins the broadcast.
+        writer.write(frame_message(self.frames, self.rows,
+                                   [0] * DISPLAY_HEIGHT, range(DISPLAY_HEIGHT)))
+        self.clients.append(writer)
+        try:
+            while True:
+                kind, payload = await read_message(reader)
+                if kind == KEY_MESSAGE:
+                    self._keys.extend((byte & 0xf, bool(byte & KEY_PRESSED))
+                                      for byte in payload)
+                else:
+                    LOG.warning('Ignoring message of type %d', kind)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._disconnect(writer)
+
+    async def serve(self, path=None, port=None, frames=None):
+        """Listen on a Unix socket at ``path`` or on localhost ``port`` and
+        run the machine until stopped or ``frames`` frames have run."""
+        if path is not None:
+            server = await asyncio.start_unix_server(self._serve_client, path)
+        else:
+            server = await asyncio.start_server(
+                self._serve_client, '127.0.0.1', port)
+        try:
+            await self.frontend.run_async(frames)
+        finally:
+            server.close()
+            for writer in list(self.clients):
+                self._disconnect(writer)
+            await server.wait_closed()
+
+    def stop(self):
+        self.frontend.stop()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Serve a headless Chip8.')
+    parser.add_argument('rom')
+    listen = parser.add_mutually_exclusive_group(required=True)
+    listen.add_argument('--socket', help='Unix domain socket path')
+    listen.add_argument('--port', type=int, help='localhost TCP port')
+    parser.add_argument('--speed', type=int, default=DEFAULT_SPEED)
+    parser.add_argument('--seed', type=int)
+    options = parser.parse_args(args)
+
+    machine = Chip8(HeadlessDisplay(), seed=options.seed)
+    machine.load_rom_file(options.rom)
+    server = Server(machine, options.speed)
+    asyncio.run(server.serve(options.socket, options.port))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
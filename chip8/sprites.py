@@ -1,4 +1,3 @@
-# TODO convert these to bytes https://stackoverflow.com/a/7380493/1259307
 SPRITES = [
     b"\xF0\x90\x90\x90\xF0",
     b"\x20\x60\x20\x20\x70",
@@ -17,3 +16,28 @@ SPRITES = [
     b"\xF0\x80\xF0\x80\xF0",
     b"\xF0\x80\xF0\x80\x80"
 ]
+
+# All the sprites back to back, as loaded into memory.
+FONT = b''.join(SPRITES)
+
+# 8x10 sprites of the digits, for FX30 in SUPER-CHIP and XO-CHIP modes.
+BIG_SPRITES = [
+    b"\x3C\x7E\xE7\xC3\xC3\xC3\xC3\xE7\x7E\x3C",
+    b"\x18\x38\x58\x18\x18\x18\x18\x18\x18\x3C",
+    b"\x3E\x7F\xC3\x06\x0C\x18\x30\x60\xFF\xFF",
+    b"\x3C\x7E\xC3\x03\x0E\x0E\x03\xC3\x7E\x3C",
+    b"\x06\x0E\x1E\x36\x66\xC6\xFF\xFF\x06\x06",
+    b"\xFF\xFF\xC0\xC0\xFC\xFE\x03\xC3\x7E\x3C",
+    b"\x3E\x7C\xC0\xC0\xFC\xFE\xC3\xC3\x7E\x3C",
+    b"\xFF\xFF\x03\x06\x0C\x18\x30\x60\x60\x60",
+    b"\x3C\x7E\xC3\xC3\x7E\x7E\xC3\xC3\x7E\x3C",
+    b"\x3C\x7E\xC3\xC3\x7F\x3F\x03\x03\x3E\x7C",
+    b"\x7E\xFF\xC3\xC3\xC3\xFF\xFF\xC3\xC3\xC3",
+    b"\xFC\xFC\xC3\xC3\xFC\xFC\xC3\xC3\xFC\xFC",
+    b"\x3C\xFF\xC3\xC0\xC0\xC0\xC0\xC3\xFF\x3C",
+    b"\xFC\xFE\xC3\xC3\xC3\xC3\xC3\xC3\xFE\xFC",
+    b"\xFF\xFF\xC0\xC0\xFF\xFF\xC0\xC0\xFF\xFF",
+    b"\xFF\xFF\xC0\xC0\xFF\xFF\xC0\xC0\xC0\xC0"
+]
+
+BIG_FONT = b''.join(BIG_SPRITES)
@@ -0,0 +1,95 @@
+"""Save states for Chip8.
+
+A save state is a fixed-layout, versioned binary blob of STATE_SIZE bytes:
+
+    header     magic, version, PC, I, stack pointer, timers, key, cycles,
+               random number generator, stack and V registers
+    memory     4096 bytes
+    framebuffer  32 little-endian 64-bit rows
+
+Saving writes straight into a caller supplied buffer and restoring reads
+straight out of any buffer, including an mmap of a save file, so neither
+makes intermediate copies of memory."""
+import mmap
+import struct
+
+from chip8.core import CHIP8, DISPLAY_HEIGHT
+
+MAGIC = b'C8SS'
+STATE_VERSION = 2
+
+# magic, version, pc, I, stack pointer, delay timer, sound timer, key
+# (0 for none), cycles, xorshift state of a seeded machine (0 for none),
+# stack, V registers.
+HEADER = struct.Struct('<4sHHIbBBBQI16H16s')
+MEMORY_SIZE = 4096
+FRAMEBUFFER = struct.Struct('<{}Q'.format(DISPLAY_HEIGHT))
+
+MEMORY_OFFSET = HEADER.size
+FRAMEBUFFER_OFFSET = MEMORY_OFFSET + MEMORY_SIZE
+STATE_SIZE = FRAMEBUFFER_OFFSET + FRAMEBUFFER.size
+
+
+def save(machine, buffer=None, offset=0):
+    """Write the state of a machine into a buffer and return the buffer.
+
+    A new bytearray is allocated if no buffer is given, otherwise STATE_SIZE
+    bytes are written to the writable buffer at ``offset``. Only CHIP-8
+    machines can be saved."""
+    if machine.mode != CHIP8:
+        raise ValueError('Save states only hold CHIP-8 machines')
+    if buffer is None:
+        buffer = bytearray(STATE_SIZE)
+    HEADER.pack_into(
+        buffer, offset, MAGIC, STATE_VERSION,
+        machine.pc, machine.register_i, machine.stack_ptr,
+        machine.dt, machine.st, machine.key or 0, machine.cycles,
+        getattr(machine, 'rng_state', 0), *machine.stack, machine.v)
+    with memoryview(buffer) as view:
+        start = offset + MEMORY_OFFSET
+        view[start:start + MEMORY_SIZE] = machine.memory
+    FRAMEBUFFER.pack_into(buffer, offset + FRAMEBUFFER_OFFSET,
+                          *machine.framebuffer)
+    return buffer
+
+
+def restore(machine, buffer, offset=0):
+    """Load the state of a machine from a buffer written by ``save``.
+
+    The display is redrawn from the restored framebuffer. Translated code
+    held by an execution engine has to be flushed by the caller. Only CHIP-8
+    machines can be restored, and the random number generator only into
+    seeded ones."""
+    if machine.mode != CHIP8:
+        raise ValueError('Save states only hold CHIP-8 machines')
+    fields = HEADER.unpack_from(buffer, offset)
+    magic, version = fields[:2]
+    if magic != MAGIC:
+        raise ValueError('Not a Chip8 save state')
+    if version != STATE_VERSION:
+        raise ValueError('Unsupported save state version {}'.format(version))
+    (machine.pc, machine.register_i, machine.stack_ptr,
+     machine.dt, machine.st, key, machine.cycles, rng_state) = fields[2:10]
+    machine.key = key or False
+    if rng_state and machine.seed is not None:
+        machine.rng_state = rng_state
+    machine.stack[:] = fields[10:26]
+    machine.v[:] = fields[26]
+    with memoryview(buffer) as view:
+        start = offset + MEMORY_OFFSET
+        machine.memory[:] = view[start:start + MEMORY_SIZE]
+    machine.framebuffer[:] = FRAMEBUFFER.unpack_from(
+        buffer, offset + FRAMEBUFFER_OFFSET)
+    machine.display.draw(machine.framebuffer, 0, DISPLAY_HEIGHT)
+
+
+def save_file(machine, path):
+    with open(path, 'wb') as state_file:
+        state_file.write(save(machine))
+
+
+def restore_file(machine, path):
+    """Restore a machine from a save file, reading it through an mmap."""
+    with open(path, 'rb') as state_file:
+        with mmap.mmap(state_file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            restore(machine, view)
@@ -0,0 +1,197 @@
+"""Binary execution traces.
+
+A trace file starts with a header and holds chunks of records. Each record
+describes one executed instruction: the cycle, the PC and opcode, I after
+the instruction and the first V register it changed, if any. Chunks store
+their records column by column as little-endian arrays, which keeps
+recording cheap and lets readers go through a trace one chunk at a time.
+
+Usage: python -m chip8.trace summary|dump [options] TRACE"""
+import argparse
+import collections
+import struct
+import sys
+from array import array
+
+from chip8.core import decode
+
+MAGIC = b'C8TR'
+TRACE_VERSION = 1
+FILE_HEADER = struct.Struct('<4sH')
+CHUNK_MAGIC = b'C8TC'
+CHUNK_HEADER = struct.Struct('<4sI')
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+# Record columns and their array type codes.
+FIELDS = (
+    ('cycle', 'Q'),
+    ('pc', 'H'),
+    ('opcode', 'H'),
+    ('register_i', 'I'),
+    ('register', 'B'),
+    ('value', 'B'),
+)
+
+# Value of the register column when no V register changed.
+NO_REGISTER = 0xff
+
+Record = collections.namedtuple('Record', [name for name, _ in FIELDS])
+
+
+class TraceRecorder(object):
+    """Record every instruction a machine executes to a trace file.
+
+    Records accumulate in arrays and are written out ``chunk_size`` at a
+    time. Use as a context manager, or call ``close`` to write the last
+    chunk and detach from the machine."""
+
+    def __init__(self, machine, trace_file, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.machine = machine
+        self.chunk_size = chunk_size
+        self.records = 0
+        if isinstance(trace_file, str):
+            trace_file = open(trace_file, 'wb')
+            self._owns_file = True
+        else:
+            self._owns_file = False
+        self.trace_file = trace_file
+        trace_file.write(FILE_HEADER.pack(MAGIC, TRACE_VERSION))
+        self._columns = [array(typecode) for _, typecode in FIELDS]
+        # V registers after the last recorded instruction. Changes made
+        # between instructions are attributed to the next one.
+        self._registers = bytes(machine.v)
+        machine.add_hook('post_instruction', self._record)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _record(self, machine, pc, instruction):
+        cycle, pcs, opcodes, registers_i, registers, values = self._columns
+        cycle.append(machine.cycles - 1)
+        pcs.append(pc)
+        opcodes.append(instruction)
+        registers_i.append(machine.register_i & 0xffffffff)
+        v = machine.v
+        before = self._registers
+        if v == before:
+            registers.append(NO_REGISTER)
+            values.append(0)
+        else:
+            for index in range(16):
+                if v[index] != before[index]:
+                    registers.append(index)
+                    values.append(v[index])
+                    break
+            self._registers = bytes(v)
+        if len(cycle) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write the records collected so far as a chunk."""
+        count = len(self._columns[0])
+        if not count:
+            return
+        self.trace_file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, count))
+        for column in self._columns:
+            if sys.byteorder == 'big':
+                column.byteswap()
+            column.tofile(self.trace_file)
+        self.records += count
+        self._columns = [array(typecode) for _, typecode in FIELDS]
+
+    def close(self):
+        if self.trace_file is None:
+            return
+        self.machine.remove_hook('post_instruction', self._record)
+        self.flush()
+        if self._owns_file:
+            self.trace_file.close()
+        self.trace_file = None
+
+
+def read_chunks(path):
+    """Yield each chunk of a trace file as a Record of column arrays.
+
+    Only one chunk is held in memory at a time."""
+    with open(path, 'rb') as trace_file:
+        magic, version = FILE_HEADER.unpack(trace_file.read(FILE_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('Not a Chip8 trace')
+        if version != TRACE_VERSION:
+            raise ValueError('Unsupported trace version {}'.format(version))
+        while True:
+            header = trace_file.read(CHUNK_HEADER.size)
+            if not header:
+                return
+            magic, count = CHUNK_HEADER.unpack(header)
+            if magic != CHUNK_MAGIC:
+                raise ValueError('Corrupt trace chunk')
+            columns = []
+            for _, typecode in FIELDS:
+                column = array(typecode)
+                column.fromfile(trace_file, count)
+                if sys.byteorder == 'big':
+                    column.byteswap()
+                columns.append(column)
+            yield Record(*columns)
+
+
+def read_records(path, predicate=None):
+    """Replay the records of a trace in order, optionally filtered."""
+    for chunk in read_chunks(path):
+        for record in map(Record, *chunk):
+            if predicate is None or predicate(record):
+                yield record
+
+
+def summarise(path, top=20):
+    """Return instruction counts by handler and by PC, most frequent first."""
+    handlers = collections.Counter()
+    pcs = collections.Counter()
+    for chunk in read_chunks(path):
+        handlers.update(chunk.opcode)
+        pcs.update(chunk.pc)
+    by_handler = collections.Counter()
+    for opcode, count in handlers.items():
+        decoded = decode(opcode)
+        by_handler[decoded[0] if decoded else 'unknown'] += count
+    return by_handler.most_common(top), pcs.most_common(top)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Analyse Chip8 traces.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    summary = subparsers.add_parser('summary', help='hot handlers and PCs')
+    summary.add_argument('trace')
+    summary.add_argument('--top', type=int, default=20)
+    dump = subparsers.add_parser('dump', help='print records')
+    dump.add_argument('trace')
+    dump.add_argument('--pc', type=lambda value: int(value, 16))
+    dump.add_argument('--opcode', type=lambda value: int(value, 16))
+    options = parser.parse_args(args)
+
+    if options.command == 'summary':
+        handlers, pcs = summarise(options.trace, options.top)
+        print('Instructions by handler:')
+        for name, count in handlers:
+            print(f'{count:>12}  {name}')
+        print('Instructions by PC:')
+        for pc, count in pcs:
+            print(f'{count:>12}  {pc:#05x}')
+    else:
+        def matches(record):
+            return ((options.pc is None or record.pc == options.pc) and
+                    (options.opcode is None or record.opcode == options.opcode))
+
+        for record in read_records(options.trace, matches):
+            register = ('-' if record.register == NO_REGISTER
+                        else f'V{record.register:X}={record.value:#04x}')
+            print(f'{record.cycle:>12}  {record.pc:#05x}  {record.opcode:04x}  '
+                  f'I={record.register_i:#05x}  {register}')
+
+
+if __name__ == '__main__':
+    main()
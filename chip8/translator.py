@@ -0,0 +1,220 @@
+import logging
+
+from chip8.core import Chip8, decode
+
+LOG = logging.getLogger(__name__)
+
+MAX_BLOCK_LENGTH = 64
+
+# Handlers that transfer control, so a block ends after them.
+BRANCHES = frozenset([
+    'call_rca',
+    'ret',
+    'jump',
+    'call',
+    'skipinst_vx_eq_nn',
+    'skipinst_vx_neq_nn',
+    'skipinst_vx_eq_vy',
+    'skip_inst_if_vx_neq_vy',
+    'jump_to_v0_plus_nnn',
+    'skip_inst_if_vx_pressed',
+    'skip_inst_if_vx_not_pressed',
+    'wait_key_store_vx',
+    'exit_interpreter',
+    'load_i_long',
+])
+
+# Handlers that write to memory, mapped to the number of bytes written
+# starting at I. A block ends after them because they may rewrite code.
+MEMORY_WRITES = {
+    'set_i_to_bcd': lambda x: 3,
+    'reg_dump_to_mem': lambda x: x + 1,
+    'save_vx_to_vy': lambda x, y: abs(x - y) + 1,
+}
+
+# Handlers simple enough to be emitted as Python statements, used when the
+# machine dispatches to the stock Chip8 implementation.
+INLINE = {
+    'set_vx_to_nn': 'v[{0}] = {1}',
+    'add_nn_to_vx': 'v[{0}] = (v[{0}] + {1}) & 0xff',
+    'set_vx_to_vy': 'v[{0}] = v[{1}]',
+    'set_vx_to_vx_or_vy': 'v[{0}] = v[{0}] | v[{1}]',
+    'set_vx_to_vx_and_vy': 'v[{0}] = v[{0}] & v[{1}]',
+    'set_vx_to_vx_xor_vy': 'v[{0}] = v[{0}] ^ v[{1}]',
+    'set_i_to_nnn': 'm.register_i = {0}',
+}
+
+
+class TranslationCache(object):
+    """Execution engine running a Chip8 one basic block at a time.
+
+    A block is a straight-line run of instructions starting at some PC. It is
+    translated into a single Python function the first time execution reaches
+    that PC and cached by address. Blocks covering memory written by FX33 or
+    FX55 are dropped, so self-modifying programs are retranslated. While the
+    machine is tracing instructions are interpreted, and as their writes go
+    unseen every block is dropped once tracing stops."""
+
+    def __init__(self, machine, max_block_length=MAX_BLOCK_LENGTH):
+        self.machine = machine
+        self.max_block_length = max_block_length
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        size = len(machine.memory)
+        # Dispatch table the blocks were translated against.
+        self._dispatch = machine._dispatch
+        # Set when instructions were interpreted while tracing.
+        self._interpreted = False
+        # Translated (function, instruction count) pairs by start address.
+        self._blocks = [None] * size
+        # Start addresses of the blocks covering each memory address.
+        self._covering = [None] * size
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'blocks': sum(1 for block in self._blocks if block is not None),
+        }
+
+    def step(self):
+        """Execute the block at PC and return the number of instructions run."""
+        machine = self.machine
+        block = self._block_at(machine.pc)
+        if block is None:
+            machine.execute_cycle()
+            return 1
+        return block[0](machine)
+
+    def run(self, cycles):
+        """Execute exactly ``cycles`` instructions.
+
+        Blocks longer than the remaining budget are interpreted instead."""
+        machine = self.machine
+        executed = machine.skip_idle(cycles)
+        while executed < cycles:
+            block = self._block_at(machine.pc)
+            if block is not None and block[1] <= cycles - executed:
+                executed += block[0](machine)
+            else:
+                machine.execute_cycle()
+                executed += 1
+        return executed
+
+    def _block_at(self, pc):
+        machine = self.machine
+        if machine.tracing:
+            self._interpreted = True
+            return None
+        if self._interpreted or machine._dispatch is not self._dispatch:
+            # Handler overrides changed, so blocks call stale handlers, or
+            # interpreted instructions may have rewritten blocks.
+            self.flush()
+            self._dispatch = machine._dispatch
+        block = self._blocks[pc]
+        if block is None:
+            self.misses += 1
+            return self.translate(pc)
+        self.hits += 1
+        return block
+
+    def invalidate(self, address, length):
+        """Drop every block overlapping ``length`` bytes at ``address``."""
+        covering = self._covering
+        for addr in range(address, min(address + length, len(covering))):
+            starts = covering[addr]
+            if starts:
+                for start in list(starts):
+                    self._drop(start)
+
+    def flush(self):
+        """Drop every translated block, e.g. after loading a new ROM."""
+        self._blocks = [None] * len(self._blocks)
+        self._covering = [None] * len(self._covering)
+        self._interpreted = False
+
+    def _drop(self, start):
+        function, count = self._blocks[start]
+        self._blocks[start] = None
+        for addr in range(start, start + count * 2):
+            self._covering[addr].discard(start)
+        self.invalidations += 1
+        LOG.debug('Invalidated block at %s', hex(start))
+
+    def translate(self, start):
+        """Translate and cache the block at ``start``.
+
+        Returns None if the first instruction cannot be translated, in which
+        case it has to be interpreted."""
+        machine = self.machine
+        memory = machine.memory
+        table = machine._dispatch
+        namespace = {'invalidate': self.invalidate}
+        lines = ['def block_{:03x}(m):'.format(start), '    v = m.v']
+        # Program counter and cycle count of the machine as last written out
+        # by the generated code.
+        state = {'pc': start, 'cycles': 0}
+
+        def sync(pc, cycles):
+            if pc != state['pc']:
+                lines.append('    m.pc = {}'.format(pc))
+                state['pc'] = pc
+            if cycles != state['cycles']:
+                lines.append('    m.cycles += {}'.format(cycles - state['cycles']))
+                state['cycles'] = cycles
+
+        pc = start
+        count = 0
+        while count < self.max_block_length and pc + 1 < len(memory):
+            instruction = memory[pc] << 8 | memory[pc + 1]
+            decoded = decode(instruction, machine.mode)
+            if decoded is None:
+                break
+            name, args = decoded
+            handler = table[instruction][0]
+            pc += 2
+            count += 1
+            if name in INLINE and handler is getattr(Chip8, name):
+                lines.append('    ' + INLINE[name].format(*args))
+                continue
+
+            sync(pc, count - 1)
+            handler_name = 'h{}'.format(count)
+            namespace[handler_name] = handler
+            call = '    {}(m{})'.format(
+                handler_name, ''.join(', {}'.format(arg) for arg in args))
+            if name in MEMORY_WRITES:
+                # Invalidate even if the handler raises after writing.
+                lines.append('    address = m.register_i')
+                lines.append('    try:')
+                lines.append('    ' + call)
+                lines.append('    finally:')
+                lines.append('        invalidate(address, {})'.format(
+                    MEMORY_WRITES[name](*args)))
+            else:
+                lines.append(call)
+            if name in BRANCHES or name in MEMORY_WRITES:
+                # PC has been written out already and branches update it
+                # themselves.
+                pc = state['pc'] = None
+                break
+
+        if count == 0:
+            return None
+
+        sync(pc, count)
+        lines.append('    return {}'.format(count))
+        source = '\n'.join(lines)
+        exec(compile(source, '<block {}>'.format(hex(start)), 'exec'), namespace)
+        block = (namespace['block_{:03x}'.format(start)], count)
+
+        self._blocks[start] = block
+        for addr in range(start, start + count * 2):
+            starts = self._covering[addr]
+            if starts is None:
+                starts = self._covering[addr] = set()
+            starts.add(start)
+        LOG.debug('Translated %d instructions at %s', count, hex(start))
+        return block
@@ -0,0 +1,360 @@
+"""Lockstep execution of many independent Chip8 machines with NumPy.
+
+The state of every machine is held in struct-of-arrays buffers with one row
+(or element) per machine, called a lane. Each cycle fetches the opcode of
+every lane, groups lanes by handler and applies each handler to its group
+with vectorised array operations that follow the handlers of
+``chip8.core.Chip8``.
+
+Instead of raising, a lane that hits an error is marked as faulted and
+stops executing; ``fault`` holds the reason."""
+import logging
+
+import numpy as np
+
+from chip8.core import (Chip8, DISPLAY_HEIGHT, DISPLAY_WIDTH, PC_START_ADDRESS,
+                        decode)
+from chip8.sprites import FONT
+
+LOG = logging.getLogger(__name__)
+
+MEMORY_SIZE = 4096
+STACK_SIZE = 16
+
+# Fault codes.
+OK = 0
+DECODE_ERROR = 1
+STACK_ERROR = 2
+MEMORY_ERROR = 3
+BCD_ERROR = 4
+NOT_IMPLEMENTED = 5
+VALUE_ERROR = 6
+
+FAULTS = {
+    DECODE_ERROR: 'Failed to decode instruction',
+    STACK_ERROR: 'Stack index out of range',
+    MEMORY_ERROR: 'Memory index out of range',
+    BCD_ERROR: 'BCD of a value below 100',
+    NOT_IMPLEMENTED: 'call_rca - Not implemented',
+    VALUE_ERROR: 'Register value out of range',
+}
+
+HANDLERS = ('unknown',) + tuple(sorted(set(
+    decoded[0] for decoded in map(decode, range(0x10000)) if decoded)))
+
+# Handler index of every opcode, 0 for opcodes that do not decode.
+HANDLER_IDS = np.array(
+    [HANDLERS.index(decoded[0]) if decoded else 0
+     for decoded in map(decode, range(0x10000))], dtype=np.uint8)
+
+_FONT = np.frombuffer(FONT, dtype=np.uint8)
+_SIXTY_FOUR = np.uint64(DISPLAY_WIDTH)
+_SPRITE_SHIFT = np.uint64(DISPLAY_WIDTH - 8)
+
+
+class VectorChip8(object):
+    """``lanes`` Chip8 machines executed in lockstep."""
+
+    def __init__(self, lanes, seed=None):
+        self.lanes = lanes
+        self.memory = np.zeros((lanes, MEMORY_SIZE), dtype=np.uint8)
+        self.memory[:, :len(_FONT)] = _FONT
+        self.v = np.zeros((lanes, 16), dtype=np.uint8)
+        self.register_i = np.zeros(lanes, dtype=np.int64)
+        self.pc = np.full(lanes, PC_START_ADDRESS, dtype=np.int64)
+        self.stack = np.zeros((lanes, STACK_SIZE), dtype=np.int64)
+        self.stack_ptr = np.zeros(lanes, dtype=np.int64)
+        self.dt = np.zeros(lanes, dtype=np.int64)
+        self.st = np.zeros(lanes, dtype=np.int64)
+        # 0 when no key is pressed, as Chip8.key is falsy then.
+        self.key = np.zeros(lanes, dtype=np.int64)
+        self.framebuffer = np.zeros((lanes, DISPLAY_HEIGHT), dtype=np.uint64)
+        self.cycles = np.zeros(lanes, dtype=np.int64)
+        self.fault = np.zeros(lanes, dtype=np.uint8)
+        self.random = np.random.default_rng(seed)
+        self._handlers = [getattr(self, '_' + name) for name in HANDLERS]
+
+    def load_rom(self, rom_buffer, lanes=slice(None)):
+        """Load a ROM into some (by default all) lanes."""
+        rom = np.frombuffer(bytes(rom_buffer), dtype=np.uint8)
+        self.memory[lanes, PC_START_ADDRESS:PC_START_ADDRESS + len(rom)] = rom
+        self.pc[lanes] = PC_START_ADDRESS
+
+    def step(self):
+        """Execute one instruction on every lane that has not faulted."""
+        lanes = np.flatnonzero(self.fault == OK)
+        pc = self.pc[lanes]
+        overflow = pc + 1 >= MEMORY_SIZE
+        if overflow.any():
+            self.fault[lanes[overflow]] = MEMORY_ERROR
+            lanes = lanes[~overflow]
+            pc = pc[~overflow]
+        memory = self.memory
+        opcodes = (memory[lanes, pc].astype(np.int64) << 8) | memory[lanes, pc + 1]
+        self.pc[lanes] = pc + 2
+
+        handler_ids = HANDLER_IDS[opcodes]
+        for handler_id in np.unique(handler_ids):
+            group = handler_ids == handler_id
+            self._handlers[handler_id](lanes[group], opcodes[group])
+
+        lanes = lanes[self.fault[lanes] == OK]
+        self.cycles[lanes] += 1
+
+    def run(self, cycles):
+        for _ in range(cycles):
+            self.step()
+        return cycles
+
+    def tick_timers(self):
+        np.subtract(self.dt, 1, out=self.dt, where=self.dt > 0)
+        np.subtract(self.st, 1, out=self.st, where=self.st > 0)
+
+    def to_chip8(self, lane, display):
+        """Return a Chip8 with the state of one lane."""
+        machine = Chip8(display)
+        machine.memory[:] = self.memory[lane].tobytes()
+        machine.v[:] = self.v[lane].tobytes()
+        machine.register_i = int(self.register_i[lane])
+        machine.pc = int(self.pc[lane])
+        machine.stack = [int(address) for address in self.stack[lane]]
+        machine.stack_ptr = int(self.stack_ptr[lane])
+        machine.dt = int(self.dt[lane])
+        machine.st = int(self.st[lane])
+        machine.key = int(self.key[lane]) or False
+        machine.framebuffer[:] = [int(row) for row in self.framebuffer[lane]]
+        machine.cycles = int(self.cycles[lane])
+        return machine
+
+    def from_chip8(self, lane, machine):
+        """Copy the state of a Chip8 into one lane."""
+        self.memory[lane] = np.frombuffer(machine.memory, dtype=np.uint8)
+        self.v[lane] = np.frombuffer(machine.v, dtype=np.uint8)
+        self.register_i[lane] = machine.register_i
+        self.pc[lane] = machine.pc
+        self.stack[lane] = machine.stack
+        self.stack_ptr[lane] = machine.stack_ptr
+        self.dt[lane] = machine.dt
+        self.st[lane] = machine.st
+        self.key[lane] = machine.key or 0
+        self.framebuffer[lane] = machine.framebuffer
+        self.cycles[lane] = machine.cycles
+        self.fault[lane] = OK
+
+    # INSTRUCTIONS
+    #
+    # Each handler takes the lanes executing it and their opcodes.
+
+    def _unknown(self, lanes, opcodes):
+        self.fault[lanes] = DECODE_ERROR
+
+    def _call_rca(self, lanes, opcodes):
+        self.fault[lanes] = NOT_IMPLEMENTED
+
+    def _cls(self, lanes, opcodes):
+        self.framebuffer[lanes] = 0
+
+    def _ret(self, lanes, opcodes):
+        # Chip8.stack is a list, so negative stack pointers index from its end.
+        sp = self.stack_ptr[lanes]
+        bad = sp < -STACK_SIZE
+        self.fault[lanes[bad]] = STACK_ERROR
+        lanes = lanes[~bad]
+        sp = sp[~bad]
+        self.pc[lanes] = self.stack[lanes, sp % STACK_SIZE]
+        self.stack_ptr[lanes] = sp - 1
+
+    def _jump(self, lanes, opcodes):
+        self.pc[lanes] = opcodes & 0xfff
+
+    def _call(self, lanes, opcodes):
+        sp = self.stack_ptr[lanes] + 1
+        self.stack_ptr[lanes] = sp
+        bad = sp >= STACK_SIZE
+        self.fault[lanes[bad]] = STACK_ERROR
+        lanes = lanes[~bad]
+        self.stack[lanes, sp[~bad] % STACK_SIZE] = self.pc[lanes]
+        self.pc[lanes] = opcodes[~bad] & 0xfff
+
+    def _skip_if(self, lanes, condition):
+        self.pc[lanes[condition]] += 2
+
+    def _skipinst_vx_eq_nn(self, lanes, opcodes):
+        self._skip_if(lanes, self.v[lanes, opcodes >> 8 & 0xf] == opcodes & 0xff)
+
+    def _skipinst_vx_neq_nn(self, lanes, opcodes):
+        self._skip_if(lanes, self.v[lanes, opcodes >> 8 & 0xf] != opcodes & 0xff)
+
+    def _skipinst_vx_eq_vy(self, lanes, opcodes):
+        v = self.v
+        self._skip_if(lanes, v[lanes, opcodes >> 8 & 0xf] == v[lanes, opcodes >> 4 & 0xf])
+
+    def _skip_inst_if_vx_neq_vy(self, lanes, opcodes):
+        v = self.v
+        self._skip_if(lanes, v[lanes, opcodes >> 8 & 0xf] != v[lanes, opcodes >> 4 & 0xf])
+
+    def _set_vx_to_nn(self, lanes, opcodes):
+        self.v[lanes, opcodes >> 8 & 0xf] = opcodes & 0xff
+
+    def _add_nn_to_vx(self, lanes, opcodes):
+        x = opcodes >> 8 & 0xf
+        self.v[lanes, x] = (self.v[lanes, x] + (opcodes & 0xff)) & 0xff
+
+    # The 8XYN handlers read and write the registers in the same order as
+    # their Chip8 counterparts, which matters when X or Y is F.
+
+    def _set_vx_to_vy(self, lanes, opcodes):
+        self.v[lanes, opcodes >> 8 & 0xf] = self.v[lanes, opcodes >> 4 & 0xf]
+
+    def _set_vx_to_vx_or_vy(self, lanes, opcodes):
+        x, y = opcodes >> 8 & 0xf, opcodes >> 4 & 0xf
+        self.v[lanes, x] = self.v[lanes, x] | self.v[lanes, y]
+
+    def _set_vx_to_vx_and_vy(self, lanes, opcodes):
+        x, y = opcodes >> 8 & 0xf, opcodes >> 4 & 0xf
+        self.v[lanes, x] = self.v[lanes, x] & self.v[lanes, y]
+
+    def _set_vx_to_vx_xor_vy(self, lanes, opcodes):
+        x, y = opcodes >> 8 & 0xf, opcodes >> 4 & 0xf
+        self.v[lanes, x] = self.v[lanes, x] ^ self.v[lanes, y]
+
+    def _add_vy_to_vx(self, lanes, opcodes):
+        x, y = opcodes >> 8 & 0xf, opcodes >> 4 & 0xf
+        v = self.v
+        result = v[lanes, x].astype(np.int64) + v[lanes, y]
+        v[lanes, 0xf] = result > 0xff
+        v[lanes, x] = result & 0xff
+
+    def _subtract(self, lanes, x, minuend, subtrahend):
+        # VF is written before the operands are read again, and Chip8 fails
+        # to store a difference that the new VF has pushed out of range.
+        v = self.v
+        borrow = v[lanes, minuend] < v[lanes, subtrahend]
+        v[lanes, 0xf] = ~borrow
+        result = v[lanes, minuend].astype(np.int64) - v[lanes, subtrahend] + borrow * 0x100
+        bad = (result < 0) | (result > 0xff)
+        self.fault[lanes[bad]] = VALUE_ERROR
+        v[lanes[~bad], x[~bad]] = result[~bad]
+
+    def _sub_vy_from_vx(self, lanes, opcodes):
+        x, y = opcodes >> 8 & 0xf, opcodes >> 4 & 0xf
+        self._subtract(lanes, x, x, y)
+
+    def _shift_r_vy_to_vx(self, lanes, opcodes):
+        x, y = opcodes >> 8 & 0xf, opcodes >> 4 & 0xf
+        v = self.v
+        v[lanes, 0xf] = v[lanes, y] & 1
+        v[lanes, x] = v[lanes, y] >> 1
+
+    def _set_vx_to_vy_min_vx(self, lanes, opcodes):
+        x, y = opcodes >> 8 & 0xf, opcodes >> 4 & 0xf
+        self._subtract(lanes, x, y, x)
+
+    def _shift_l_vy_to_vx(self, lanes, opcodes):
+        x, y = opcodes >> 8 & 0xf, opcodes >> 4 & 0xf
+        v = self.v
+        v[lanes, 0xf] = v[lanes, y] >> 7
+        v[lanes, x] = (v[lanes, y].astype(np.int64) << 1) & 0xff
+
+    def _set_i_to_nnn(self, lanes, opcodes):
+        self.register_i[lanes] = opcodes & 0xfff
+
+    def _jump_to_v0_plus_nnn(self, lanes, opcodes):
+        self.pc[lanes] = (opcodes & 0xfff) + self.v[lanes, 0]
+
+    def _set_vx_rand_and_nn(self, lanes, opcodes):
+        # random.randrange(0, 255) in Chip8, so 255 is never drawn.
+        rnd = self.random.integers(0, 255, size=len(lanes))
+        self.v[lanes, opcodes >> 8 & 0xf] = rnd & opcodes & 0xff
+
+    def _draw_sprite(self, lanes, opcodes):
+        v = self.v
+        x_start = (v[lanes, opcodes >> 8 & 0xf] % DISPLAY_WIDTH).astype(np.uint64)
+        y_start = v[lanes, opcodes >> 4 & 0xf].astype(np.int64) % DISPLAY_HEIGHT
+        heights = opcodes & 0xf
+        register_i = self.register_i[lanes]
+        framebuffer = self.framebuffer
+        collision = np.zeros(len(lanes), dtype=bool)
+        for row in range(int(heights.max(initial=0))):
+            # Chip8 slices the sprite out of memory, so rows past the end of
+            # memory are silently dropped.
+            address = register_i + row
+            drawing = (heights > row) & (address < MEMORY_SIZE)
+            if not drawing.any():
+                continue
+            rows = lanes[drawing]
+            x = x_start[drawing]
+            sprite = self.memory[rows, address[drawing]].astype(np.uint64) << _SPRITE_SHIFT
+            # Shifting a uint64 by 64 is undefined, so x == 0 is special cased.
+            wrapped = np.where(x == 0, np.uint64(0), sprite << (_SIXTY_FOUR - x) % _SIXTY_FOUR)
+            sprite = (sprite >> x) | wrapped
+            y = (y_start[drawing] + row) % DISPLAY_HEIGHT
+            collision[drawing] |= (framebuffer[rows, y] & sprite) != 0
+            framebuffer[rows, y] ^= sprite
+        v[lanes, 0xf] = collision
+
+    def _skip_inst_if_vx_pressed(self, lanes, opcodes):
+        key = self.key[lanes]
+        self._skip_if(lanes, (key != 0) & (key == self.v[lanes, opcodes >> 8 & 0xf]))
+
+    def _skip_inst_if_vx_not_pressed(self, lanes, opcodes):
+        key = self.key[lanes]
+        self._skip_if(lanes, (key == 0) | (key != self.v[lanes, opcodes >> 8 & 0xf]))
+
+    def _set_vx_to_delay_timer(self, lanes, opcodes):
+        self.v[lanes, opcodes >> 8 & 0xf] = self.dt[lanes]
+
+    def _wait_key_store_vx(self, lanes, opcodes):
+        pass
+
+    def _set_delay_timer_to_vx(self, lanes, opcodes):
+        self.dt[lanes] = self.v[lanes, opcodes >> 8 & 0xf]
+
+    def _set_sound_timer_to_vx(self, lanes, opcodes):
+        self.st[lanes] = self.v[lanes, opcodes >> 8 & 0xf]
+
+    def _add_vx_to_i(self, lanes, opcodes):
+        self.register_i[lanes] += self.v[lanes, opcodes >> 8 & 0xf]
+
+    def _set_i_to_sprite_in_vx(self, lanes, opcodes):
+        self.register_i[lanes] = self.v[lanes, opcodes >> 8 & 0xf].astype(np.int64) * 5
+
+    def _set_i_to_bcd(self, lanes, opcodes):
+        # Chip8 indexes the decimal string of the value, so values below 100
+        # fail, and stores the digits least significant first.
+        value = self.v[lanes, opcodes >> 8 & 0xf].astype(np.int64)
+        address = self.register_i[lanes]
+        bad = (value < 100) | (address + 2 >= MEMORY_SIZE)
+        self.fault[lanes[bad & (value < 100)]] = BCD_ERROR
+        self.fault[lanes[bad & (value >= 100)]] = MEMORY_ERROR
+        lanes, value, address = lanes[~bad], value[~bad], address[~bad]
+        memory = self.memory
+        memory[lanes, address] = value % 10
+        memory[lanes, address + 1] = value // 10 % 10
+        memory[lanes, address + 2] = value // 100
+
+    def _reg_dump_to_mem(self, lanes, opcodes):
+        x = opcodes >> 8 & 0xf
+        register_i = self.register_i[lanes]
+        bad = register_i + x >= MEMORY_SIZE
+        self.fault[lanes[bad]] = MEMORY_ERROR
+        for index in range(16):
+            storing = (x >= index) & (register_i + index < MEMORY_SIZE)
+            if not storing.any():
+                break
+            rows = lanes[storing]
+            self.memory[rows, register_i[storing] + index] = self.v[rows, index]
+        self.register_i[lanes[~bad]] += x[~bad] + 1
+
+    def _reg_load_from_mem(self, lanes, opcodes):
+        x = opcodes >> 8 & 0xf
+        register_i = self.register_i[lanes]
+        bad = register_i + x >= MEMORY_SIZE
+        self.fault[lanes[bad]] = MEMORY_ERROR
+        for index in range(16):
+            loading = (x >= index) & (register_i + index < MEMORY_SIZE)
+            if not loading.any():
+                break
+            rows = lanes[loading]
+            self.v[rows, index] = self.memory[rows, register_i[loading] + index]
+        self.register_i[lanes[~bad]] += x[~bad] + 1
@@ -1,38 +1,149 @@
-import io
+import argparse
 import logging
 import sys
+import time
 
-import pygame
+from chip8 import analysis
+from chip8.core import CHIP8, MODES, QUIRK_PROFILES, Chip8
+from chip8.frontend import Frontend
+from chip8.headless_display import HeadlessDisplay
+from chip8.replay import InputRecorder
+from chip8.scheduler import DEFAULT_SPEED, MAX_FRAMESKIP
 
-from chip8.core import Chip8
-from chip8.display import GraphicsDisplay
+LOG = logging.getLogger(__name__)
 
-TIMER = pygame.USEREVENT + 1
+# Keyboard keys of the hex keypad, laid out as
+#   1 2 3 C        1 2 3 4
+#   4 5 6 D        q w e r
+#   7 8 9 E        a s d f
+#   A 0 B F        z x c v
+KEYMAP = dict(zip('1234qwerasdfzxcv', (0x1, 0x2, 0x3, 0xc, 0x4, 0x5, 0x6, 0xd,
+                                      0x7, 0x8, 0x9, 0xe, 0xa, 0x0, 0xb, 0xf)))
 
-LOG = logging.getLogger(__name__)
+# Seconds a key stays pressed in the terminal after its last repeat.
+CONSOLE_KEY_HOLD = 0.1
 
 
-def main(args):
-    rom = args[1]
-    display = GraphicsDisplay()
-    chip8 = Chip8(display)
+# Display backends are imported when chosen, so that only the one in use is
+# loaded: pygame alone takes longer to import than the emulator.
 
-    pygame.time.set_timer(TIMER, 17)
+def pygame_frontend():
+    """Return a pygame display and an input poller calling ``stop`` on
+    quit."""
+    import pygame
 
-    with open(rom, 'rb') as rom_buf:
-        chip8.load_rom(rom_buf.read())
+    from chip8.display import GraphicsDisplay
 
-    while True:
-        pygame.time.wait(17)
-        chip8.execute_cycle()
+    display = GraphicsDisplay()
 
+    def poll_input(stop):
         for event in pygame.event.get():
-            if event.type == TIMER:
-                pass  # FIXME
-            elif event.type == pygame.QUIT:
-                sys.exit(0)
-            elif event.type == pygame.KEYDOWN:
-                LOG.debug("Key pressed: %s", pygame.key.get_pressed())
+            if event.type == pygame.QUIT:
+                stop()
+            elif event.type in (pygame.KEYDOWN, pygame.KEYUP):
+                key = KEYMAP.get(pygame.key.name(event.key))
+                if key is not None:
+                    yield key, event.type == pygame.KEYDOWN
+
+    return display, poll_input
+
+
+def console_frontend():
+    """Return a curses display and an input poller."""
+    from chip8.console_display import ConsoleDisplay
+
+    display = ConsoleDisplay()
+    display.win.nodelay(True)
+    held = {}
+
+    def poll_input(stop):
+        # Terminals only report key presses, repeated while a key is held,
+        # so a key counts as released once it has not repeated for a while.
+        changes = []
+        now = time.monotonic()
+        char = display.win.getch()
+        while char != -1:
+            key = KEYMAP.get(chr(char)) if char < 256 else None
+            if key is not None:
+                if key not in held:
+                    changes.append((key, True))
+                held[key] = now
+            char = display.win.getch()
+        for key, pressed_at in list(held.items()):
+            if now - pressed_at > CONSOLE_KEY_HOLD:
+                changes.append((key, False))
+                del held[key]
+        return changes
+
+    return display, poll_input
+
+
+def main(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('rom')
+    parser.add_argument('--mode', choices=MODES, default=CHIP8,
+                        help='instruction set of the ROM')
+    parser.add_argument('--quirks', choices=sorted(QUIRK_PROFILES),
+                        help='compatibility quirks, by default those usual '
+                             'for the mode')
+    parser.add_argument('--speed', type=int, default=DEFAULT_SPEED,
+                        help='instructions per second')
+    parser.add_argument('--unthrottled', action='store_true',
+                        help='run as fast as possible')
+    parser.add_argument('--max-frameskip', type=int, default=MAX_FRAMESKIP,
+                        help='most frames in a row left unrendered when the '
+                             'host cannot keep up')
+    parser.add_argument('--console', action='store_true',
+                        help='draw in the terminal')
+    parser.add_argument('--predecode', action='store_true',
+                        help='run from an analysis of the ROM, cached on disk')
+    parser.add_argument('--seed', type=int,
+                        help='seed the random number generator')
+    parser.add_argument('--record', metavar='SESSION',
+                        help='record input for replay, requires --seed')
+    options = parser.parse_args(args[1:])
+    if options.record and options.seed is None:
+        parser.error('--record requires --seed')
+    if options.record and options.mode != CHIP8:
+        parser.error('--record only supports CHIP-8 ROMs')
+
+    if options.console:
+        display, poll = console_frontend()
+    else:
+        display, poll = pygame_frontend()
+    chip8 = Chip8(HeadlessDisplay(), seed=options.seed, mode=options.mode,
+                  quirks=options.quirks)
+
+    with open(options.rom, 'rb') as rom_buf:
+        rom = rom_buf.read()
+    chip8.load_rom(rom)
+
+    engine = None
+    if options.predecode:
+        engine = analysis.PredecodedEngine(chip8, analysis.load(rom))
+
+    recorder = None
+    if options.record:
+        recorder = InputRecorder(chip8, options.speed)
+
+    def poll_input():
+        return poll(frontend.stop)
+
+    frontend = Frontend(chip8, display, speed=options.speed, engine=engine,
+                        poll_input=poll_input,
+                        realtime=not options.unthrottled,
+                        threaded=not options.console,
+                        max_frameskip=options.max_frameskip)
+    try:
+        frontend.run()
+    finally:
+        if options.console:
+            display.close()
+        LOG.info('Ran %d frames, rendered %d, dropped %d',
+                 frontend.scheduler.frames, frontend.presented,
+                 frontend.dropped_frames)
+    if recorder is not None:
+        recorder.save(options.record, rom)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,132 @@
+import json
+import os
+
+import pytest
+from mock import Mock
+
+from chip8 import analysis
+from chip8.core import Chip8
+from chip8.debugger import Debugger, WatchpointHit
+
+# 200: V0 = 0
+# 202: call 20a
+# 204: skip if V0 == 4
+# 206: goto 202
+# 208: goto 208
+# 20a: V0 += 1
+# 20c: return
+# 20e: data
+ROM = bytes.fromhex('6000' '220a' '3004' '1202' '1208' '7001' '00ee' 'ffff')
+
+
+class TestAnalyse:
+
+    def setup_method(self):
+        self.analysis = analysis.analyse(ROM)
+
+    def test_instructions(self):
+        assert sorted(self.analysis.instructions) == [
+            0x200, 0x202, 0x204, 0x206, 0x208, 0x20a, 0x20c]
+        assert self.analysis.instructions[0x20a] == (0x7001, 'add_nn_to_vx', (0, 1))
+
+    def test_targets(self):
+        assert self.analysis.jump_targets == {0x202, 0x208}
+        assert self.analysis.call_targets == {0x20a}
+
+    def test_blocks(self):
+        assert self.analysis.blocks == {
+            0x200: (0x202, [0x202]),
+            0x202: (0x204, [0x20a, 0x204]),
+            0x204: (0x206, [0x206, 0x208]),
+            0x206: (0x208, [0x202]),
+            0x208: (0x20a, [0x208]),
+            0x20a: (0x20e, []),
+        }
+
+    def test_regions(self):
+        assert self.analysis.code_regions() == [(0x200, 0x20e)]
+        assert self.analysis.data_regions() == [(0x20e, 0x210)]
+
+    def test_round_trip(self):
+        loaded = analysis.Analysis.from_dict(self.analysis.to_dict())
+        assert loaded.instructions == self.analysis.instructions
+        assert loaded.blocks == self.analysis.blocks
+
+
+class TestLoad:
+
+    def test_cache(self, tmpdir):
+        cache_dir = str(tmpdir)
+        first = analysis.load(ROM, cache_dir)
+        path = os.path.join(cache_dir, first.sha256 + '.json')
+        assert os.listdir(cache_dir) == [os.path.basename(path)]
+        with open(path) as cache_file:
+            fields = json.load(cache_file)
+        fields['blocks'] = []
+        with open(path, 'w') as cache_file:
+            json.dump(fields, cache_file)
+        assert analysis.load(ROM, cache_dir).blocks == {}
+
+    def test_corrupt_cache(self, tmpdir):
+        first = analysis.load(ROM, str(tmpdir))
+        tmpdir.join(first.sha256 + '.json').write('{')
+        assert analysis.load(ROM, str(tmpdir)).blocks == first.blocks
+
+
+class TestPredecodedEngine:
+
+    def setup_method(self):
+        self.machine = Chip8(Mock())
+        self.machine.load_rom(ROM)
+        self.engine = analysis.PredecodedEngine(
+            self.machine, analysis.analyse(ROM))
+
+    def test_run(self):
+        assert self.engine.run(100) == 100
+        assert self.machine.cycles == 100
+        assert self.machine.v[0] == 4
+        assert self.machine.pc == 0x208
+        assert self.engine.misses == 0
+
+    def test_self_modifying(self):
+        # 200: I = 206; 202: dump V0-V1 at I; 204: V0 = 0x12 (rewritten)
+        rom = bytes.fromhex('a206' 'f155' '6099' '0000')
+        self.machine.load_rom(rom)
+        self.machine.v[0], self.machine.v[1] = 0x12, 0x06
+        engine = analysis.PredecodedEngine(self.machine, analysis.analyse(rom))
+        engine.run(5)
+        # 206 became "goto 206"
+        assert self.machine.pc == 0x206
+        assert self.machine.v[0] == 0x99
+
+    def test_error_counts_cycles(self):
+        self.machine.load_rom(bytes.fromhex('6000' '8008'))
+        engine = analysis.PredecodedEngine(self.machine)
+        try:
+            engine.run(10)
+        except RuntimeError:
+            pass
+        assert self.machine.cycles == 1
+
+    def test_write_while_tracing(self):
+        # 200: V2 = 1; 202: I = 200; V0, V1 = 0x62, 0x07; dump V0-V1 at I,
+        # rewriting 200 to V2 = 7; 20a: goto 200
+        rom = bytes.fromhex('6201' 'a200' '6062' '6107' 'f155' '1200')
+        self.machine.load_rom(rom)
+        engine = analysis.PredecodedEngine(self.machine, analysis.analyse(rom))
+        engine.run(1)
+        hook = Mock()
+        self.machine.add_hook('post_instruction', hook)
+        engine.run(4)
+        self.machine.remove_hook('post_instruction', hook)
+        engine.run(2)
+        assert self.machine.v[2] == 7
+
+    def test_write_raising(self):
+        rom = bytes.fromhex('6201' 'a200' '6062' '6107' 'f155' '1200')
+        self.machine.load_rom(rom)
+        engine = analysis.PredecodedEngine(self.machine, analysis.analyse(rom))
+        Debugger(self.machine).watch(0x200)
+        with pytest.raises(WatchpointHit):
+            engine.run(5)
+        assert engine._table[0x200] is None
@@ -0,0 +1,63 @@
+import hashlib
+import json
+
+from chip8.batch import main, run_rom
+
+
+def write_rom(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+class TestBatch:
+
+    def test_halts_on_self_jump(self, tmp_path):
+        # I = sprite 0; draw it at V0, V0; goto 0x204
+        rom = write_rom(tmp_path, 'halt.ch8', b'\xa0\x00\xd0\x05\x12\x04')
+        result = run_rom(rom, cycles=1000)
+        assert result['status'] == 'halted'
+        assert result['cycles'] < 1000
+        assert result['pc'] == 0x204
+        sprite = b'\xf0\x90\x90\x90\xf0'
+        framebuffer = b''.join(bytes([row]) + b'\x00' * 7 for row in sprite)
+        framebuffer += b'\x00' * 8 * 27
+        assert result['framebuffer_sha1'] == hashlib.sha1(framebuffer).hexdigest()
+
+    def test_runs_requested_cycles(self, tmp_path):
+        rom = write_rom(tmp_path, 'loop.ch8', b'\x70\x01\x12\x00')
+        result = run_rom(rom, cycles=1001, translate=True)
+        assert result['status'] == 'completed'
+        assert result['cycles'] == 1001
+
+    def test_reports_errors(self, tmp_path):
+        rom = write_rom(tmp_path, 'bad.ch8', b'\x80\x0f')
+        result = run_rom(rom, cycles=10)
+        assert result['status'] == 'error'
+        assert 'Failed to decode instruction' in result['error']
+
+    def test_reports_load_errors(self, tmp_path):
+        rom = write_rom(tmp_path, 'big.ch8', bytes(0x1000))
+        result = run_rom(rom, cycles=10)
+        assert result['status'] == 'error'
+        assert 'ROM too large' in result['error']
+        assert result['cycles'] == 0
+
+    def test_random_numbers_are_seeded(self, tmp_path):
+        # Draw sprite 0 at random positions, forever.
+        rom = write_rom(tmp_path, 'random.ch8',
+                        bytes.fromhex('a000' 'c03f' 'c11f' 'd015' '1202'))
+        first = run_rom(rom, cycles=1000)
+        second = run_rom(rom, cycles=1000)
+        assert first['framebuffer_sha1'] == second['framebuffer_sha1']
+        other = run_rom(rom, cycles=1000, seed=1)
+        assert other['framebuffer_sha1'] != first['framebuffer_sha1']
+
+    def test_main(self, tmp_path):
+        write_rom(tmp_path, 'a.ch8', b'\x12\x00')
+        write_rom(tmp_path, 'b.ch8', b'\x70\x01\x12\x00')
+        output = tmp_path / 'results.jsonl'
+        main([str(tmp_path / 'a.ch8'), str(tmp_path / 'b.ch8'),
+              '--cycles', '50', '--jobs', '2', '--output', str(output)])
+        results = [json.loads(line) for line in output.read_text().splitlines()]
+        assert [r['status'] for r in results] == ['halted', 'completed']
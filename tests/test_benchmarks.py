@@ -0,0 +1,53 @@
+from benchmarks import startup, suite
+
+
+class TestSuite:
+
+    def test_roms_run(self):
+        for name, rom in suite.ROMS.items():
+            machine, elapsed = suite.run_rom(
+                rom, 1000, mode=suite.ROM_MODES.get(name, suite.CHIP8))
+            assert machine.cycles == 1000, name
+
+    def test_sprites_draw(self):
+        machine, _ = suite.run_rom(suite.ROMS['sprites'], 1000)
+        assert machine.display.draws > 100
+
+    def test_call_recurses(self):
+        machine, _ = suite.run_rom(suite.ROMS['call'], 23)
+        assert machine.stack_ptr == 8
+
+    def test_timers_wait(self):
+        machine, _ = suite.run_rom(suite.ROMS['timers'], 3 * suite.FRAME_CYCLES)
+        assert machine.pc in (0x204, 0x206, 0x208)
+
+    def test_timers_interpreted(self):
+        machine, _ = suite.run_rom(suite.ROMS['timers'], 1000,
+                                   skip_idle_loops=False)
+        assert machine.idle_cycles == 0
+        machine, _ = suite.run_rom(suite.ROMS['idle'], 1000)
+        assert machine.idle_cycles > 0
+
+    def test_compare(self):
+        baseline = {'alu': 100.0, 'call': 100.0, 'gone': 1.0}
+        results = {'alu': 90.0, 'call': 80.0}
+        assert suite.compare(results, baseline, 0.15) == [
+            ('call', 80.0, 100.0), ('gone', None, 1.0)]
+
+    def test_missing_baseline_fails(self, tmpdir, capsys):
+        baseline = str(tmpdir.join('baseline.json'))
+        args = ['--cycles', '1000', '--repeat', '1', '--baseline', baseline]
+        assert suite.main(args) == 1
+        assert 'no baseline' in capsys.readouterr().err
+        assert suite.main(args + ['--save-baseline']) == 0
+        assert suite.main(args + ['--tolerance', '1']) == 0
+
+
+class TestStartup:
+
+    def test_headless_imports(self, tmpdir):
+        rom = tmpdir.join('rom.ch8')
+        rom.write_binary(b'\x12\x00')
+        seconds, modules = startup.measure(str(rom))
+        assert seconds > 0
+        assert modules == []
@@ -0,0 +1,49 @@
+from mock import Mock, call
+
+from chip8.console_display import ConsoleDisplay
+from chip8.core import DISPLAY_HEIGHT
+
+
+class TestConsoleDisplay:
+
+    def setup_method(self):
+        self.window = Mock()
+        self.display = ConsoleDisplay(self.window)
+        self.framebuffer = [0] * DISPLAY_HEIGHT
+
+    def test_half_blocks(self):
+        self.framebuffer[2] = 0b11 << 62     # pixels (0, 2) and (1, 2)
+        self.framebuffer[3] = 0b01 << 62     # pixel (1, 3)
+        self.framebuffer[31] = 1             # pixel (63, 31)
+        self.display.draw(self.framebuffer, 0, DISPLAY_HEIGHT)
+        self.display.present()
+        assert sorted(self.window.addstr.call_args_list) == sorted([
+            call(1, 0, '▀'),
+            call(1, 1, '█'),
+            call(15, 63, '▄'),
+        ])
+        assert self.window.refresh.call_count == 1
+
+    def test_writes_only_changes(self):
+        self.framebuffer[0] = 1 << 63
+        self.display.draw(self.framebuffer, 0, 1)
+        self.display.present()
+        self.window.reset_mock()
+        self.framebuffer[1] = 1 << 63 | 1 << 40
+        self.display.draw(self.framebuffer, 1, 1)
+        self.display.present()
+        assert sorted(self.window.addstr.call_args_list) == [
+            call(0, 0, '█'), call(0, 23, '▄')]
+
+    def test_present_without_draws(self):
+        self.display.present()
+        assert not self.window.refresh.called
+
+    def test_resize_and_planes(self):
+        self.display.resize(128, 64, 2)
+        self.window.resize.assert_called_with(32, 129)
+        framebuffer = [0] * 128
+        framebuffer[64 + 63] = 1             # pixel (127, 63) of plane 2
+        self.display.draw(framebuffer, 64, 64)
+        self.display.present()
+        assert self.window.addstr.call_args_list == [call(31, 127, '▄')]
@@ -1,8 +1,12 @@
+import io
+
 from mock import Mock, patch
 
 import pytest
 
-from chip8.core import Chip8, PC_START_ADDRESS
+from chip8.core import (BIG_FONT_ADDRESS, Chip8, PC_START_ADDRESS, SCHIP,
+                        XOCHIP, decode, dispatch_table)
+from chip8.headless_display import HeadlessDisplay
 
 
 class TestChip8:
@@ -202,11 +206,48 @@ class TestChip8:
         self.machine.decode_instruction(0xc005)  # set V0 to random number & 0x10
         assert self.machine.v[0] == 1
 
-    @pytest.mark.skip
     def test_DRW(self):
         # Display sprite starting at memory location in I to V0, V1 coordinates. Set
         # VF to 1 if there is a collission
+        self.machine.register_i = 0  # sprite for 0
+        self.machine.v[0] = 8
+        self.machine.v[1] = 2
+        self.machine.decode_instruction(0xd015)
+        assert self.machine.framebuffer[2] == 0xf0 << 48
+        assert self.machine.framebuffer[3] == 0x90 << 48
+        assert self.machine.framebuffer[6] == 0xf0 << 48
+        assert self.machine.v[0xf] == 0
+        self.display.draw.assert_called_once_with(self.machine.framebuffer, 2, 5)
+
+    def test_DRW_collision(self):
+        self.machine.register_i = 0
+        self.machine.decode_instruction(0xd015)
         self.machine.decode_instruction(0xd015)
+        assert self.machine.framebuffer == [0] * 32
+        assert self.machine.v[0xf] == 1
+
+    def test_DRW_no_collision_on_unset_pixels(self):
+        self.machine.register_i = 5  # sprite for 1
+        self.machine.decode_instruction(0xd015)
+        self.machine.register_i = 0x300
+        self.machine.memory[0x300] = 0x0f
+        self.machine.decode_instruction(0xd011)
+        assert self.machine.v[0xf] == 0
+
+    def test_DRW_wrap(self):
+        self.machine.register_i = 0x300
+        self.machine.memory[0x300] = 0xff
+        self.machine.memory[0x301] = 0x81
+        self.machine.v[0] = 60
+        self.machine.v[1] = 31
+        self.machine.decode_instruction(0xd012)
+        assert self.machine.framebuffer[31] == 0xf000_0000_0000_000f
+        assert self.machine.framebuffer[0] == 0x1000_0000_0000_0008
+
+    def test_CLS_framebuffer(self):
+        self.machine.framebuffer[0] = 1
+        self.machine.decode_instruction(0x00e0)
+        assert self.machine.framebuffer == [0] * 32
 
     @pytest.mark.skip
     def test_SKP(self):
@@ -270,4 +311,399 @@ class TestChip8:
         for index in range(0xf):
             assert self.machine.v[index] == index
 
+    def test_load_rom_file(self, tmpdir):
+        rom = tmpdir.join('rom.ch8')
+        rom.write_binary(b'\x60\x2a\x12\x02')
+        self.machine.load_rom_file(str(rom))
+        assert self.machine.memory[0x200:0x204] == b'\x60\x2a\x12\x02'
+        empty = tmpdir.join('empty.ch8')
+        empty.write_binary(b'')
+        self.machine.load_rom_file(str(empty))
+        assert len(self.machine.memory) == 4096
+
+    def test_load_rom_too_large(self):
+        with pytest.raises(ValueError):
+            self.machine.load_rom(bytes(4096 - 0x200 + 1))
+        assert len(self.machine.memory) == 4096
+
+    def test_unknown_opcode(self):
+        with pytest.raises(RuntimeError, match='Failed to decode instruction'):
+            self.machine.decode_instruction(0x800f)
+
+    def test_execute_cycle_dispatch(self):
+        self.machine.load_rom(b'\x60\x2a\x70\x01')
+        self.machine.execute_cycle()
+        self.machine.execute_cycle()
+        assert self.machine.v[0] == 0x2b
+        assert self.machine.pc == PC_START_ADDRESS + 4
+        assert self.machine.cycles == 2
+
+    def test_tick_timers(self):
+        self.machine.dt = 2
+        self.machine.st = 1
+        self.machine.tick_timers()
+        assert (self.machine.dt, self.machine.st) == (1, 0)
+        self.machine.tick_timers()
+        assert (self.machine.dt, self.machine.st) == (0, 0)
+
+    def test_execute_cycle_leaves_timers(self):
+        self.machine.load_rom(b'\x60\x01')
+        self.machine.dt = 5
+        self.machine.execute_cycle()
+        assert self.machine.dt == 5
+
+    def test_instruction_hooks(self):
+        calls = []
+        pre = lambda machine, pc, instruction: calls.append(('pre', pc, instruction))
+        post = lambda machine, pc, instruction: calls.append(('post', pc, machine.v[0]))
+        self.machine.add_hook('pre_instruction', pre)
+        self.machine.add_hook('post_instruction', post)
+        self.machine.load_rom(b'\x60\x2a')
+        self.machine.execute_cycle()
+        assert calls == [('pre', 0x200, 0x602a), ('post', 0x200, 0x2a)]
+
+        self.machine.remove_hook('pre_instruction', pre)
+        self.machine.remove_hook('post_instruction', post)
+        assert not self.machine.tracing
+        assert 'execute_cycle' not in vars(self.machine)
+
+    def test_memory_write_hook(self):
+        writes = []
+        self.machine.add_hook('memory_write', lambda machine, address, length: writes.append((address, length)))
+        self.machine.register_i = 0x300
+        self.machine.v[0] = 123
+        self.machine.decode_instruction(0xf033)
+        self.machine.decode_instruction(0xf255)
+        assert writes == [(0x300, 3), (0x300, 3)]
+        assert self.machine.register_i == 0x303
+
+    def test_draw_hook(self):
+        draws = []
+        self.machine.add_hook('draw', lambda *args: draws.append(args[1:]))
+        self.machine.register_i = 0
+        self.machine.v[1] = 4
+        self.machine.decode_instruction(0xd015)
+        self.machine.decode_instruction(0xd015)
+        assert draws == [(0, 4, 5, 0), (0, 4, 5, 1)]
+
+    def test_hooks_unregistered(self):
+        hook = lambda *args: None
+        table = self.machine._dispatch
+        self.machine.add_hook('draw', hook)
+        assert self.machine._dispatch is not table
+        self.machine.remove_hook('draw', hook)
+        assert self.machine._dispatch is table
+
+    def test_debug_stream(self):
+        stream = io.StringIO()
+        machine = Chip8(self.display, debug_stream=stream)
+        machine.load_rom(b'\x60\x2a')
+        machine.execute_cycle()
+        assert stream.getvalue().startswith('[0] Opcode: 0x602a\tI: 0x0\tPC: 0x200\n')
+
+
+class TestSeeded:
+
+    def run_rnd(self, seed):
+        machine = Chip8(Mock(), seed=seed)
+        values = []
+        for _ in range(8):
+            machine.decode_instruction(0xc0ff)
+            values.append(machine.v[0])
+        return values
+
+    def test_reproducible(self):
+        assert self.run_rnd(42) == self.run_rnd(42)
+        assert self.run_rnd(42) != self.run_rnd(43)
+        assert len(set(self.run_rnd(0))) > 1
+
+    def test_mask(self):
+        machine = Chip8(Mock(), seed=7)
+        for _ in range(16):
+            machine.decode_instruction(0xc00f)
+            assert machine.v[0] <= 0xf
+
+
+class TestIdleLoops:
+
+    def run_frames(self, rom, skip, frames=12, cycles=11, keys=(),
+                   offset=0, engine=None):
+        """Run ``rom`` a frame at a time and return the state after each."""
+        machine = Chip8(Mock())
+        machine.skip_idle_loops = skip
+        machine.load_rom(rom)
+        machine.run(offset)
+        run = machine.run if engine is None else engine(machine).run
+        states = []
+        for frame in range(frames):
+            if frame in keys:
+                machine.key_pressed(keys[frame])
+            run(cycles)
+            machine.tick_timers()
+            states.append((machine.pc, list(machine.v), machine.dt,
+                           machine.cycles))
+        return machine, states
+
+    def check(self, rom, **kwargs):
+        skipped, states = self.run_frames(rom, True, **kwargs)
+        _, expected = self.run_frames(rom, False, **kwargs)
+        assert states == expected
+        return skipped
+
+    def test_self_jump(self):
+        machine = self.check(b'\x12\x00')
+        assert machine.idle_cycles == 12 * 11
+
+    def test_delay_timer_loop(self):
+        # LD V0, 5; LD DT, V0; LD V1, DT; SE V1, 0; JP 0x204; LD V2, 1; JP self
+        rom = b'\x60\x05\xf0\x15\xf1\x07\x31\x00\x12\x04\x62\x01\x12\x0c'
+        for offset in range(6):
+            machine = self.check(rom, offset=offset)
+            assert machine.v[2] == 1
+            assert machine.idle_cycles > 0
+
+    def test_key_loops(self):
+        # LD V0, 4; SKP V0; JP 0x202; SKNP V0; JP 0x206; JP self
+        rom = b'\x60\x04\xe0\x9e\x12\x02\xe0\xa1\x12\x06\x12\x0a'
+        machine = self.check(rom, keys={3: 4, 7: False})
+        assert machine.pc == 0x20a
+        assert machine.idle_cycles > 0
+
+    def test_wrong_key(self):
+        rom = b'\x60\x04\xe0\x9e\x12\x02\x12\x06'
+        machine = self.check(rom, keys={2: 5})
+        assert machine.pc in (0x202, 0x204)
+
+    def test_engines(self):
+        from chip8.analysis import PredecodedEngine
+        from chip8.translator import TranslationCache
+        rom = b'\x60\x05\xf0\x15\xf1\x07\x31\x00\x12\x04\x62\x01\x12\x0c'
+        for engine in (PredecodedEngine, TranslationCache):
+            machine = self.check(rom, offset=3, engine=engine)
+            assert machine.idle_cycles > 0
+
+    def test_not_skipped_when_traced(self):
+        machine = Chip8(Mock())
+        machine.load_rom(b'\x12\x00')
+        instructions = []
+        machine.add_hook('pre_instruction',
+                         lambda m, pc, instruction: instructions.append(pc))
+        machine.run(5)
+        assert instructions == [0x200] * 5
+        assert machine.idle_cycles == 0
+
+    def test_not_skipped_with_overrides(self):
+        machine = Chip8(Mock())
+        machine.load_rom(b'\x12\x00')
+        jumps = []
+
+        def wrap(handler):
+            def jump(machine, nnn):
+                jumps.append(nnn)
+                handler(machine, nnn)
+            return jump
+        machine.set_overrides('test', [('jump', wrap)])
+        machine.run(5)
+        assert len(jumps) == 5
+        assert machine.idle_cycles == 0
+
+
+class TestSuperChip:
 
+    def setup_method(self):
+        self.display = HeadlessDisplay()
+        self.machine = Chip8(self.display, mode=SCHIP)
+
+    def test_unknown_mode(self):
+        with pytest.raises(ValueError):
+            Chip8(self.display, mode='chip48')
+
+    def test_decode(self):
+        assert decode(0x00c4) == ('call_rca', (0xc4,))
+        assert decode(0x00c4, SCHIP) == ('scroll_down', (4,))
+        assert decode(0xd120, SCHIP) == ('draw_extended_sprite', (1, 2, 0))
+        assert decode(0x5122, SCHIP) == ('skipinst_vx_eq_vy', (1, 2))
+
+    def test_resolution(self):
+        assert self.display.size == (64, 32, 1)
+        self.machine.framebuffer[0] = 1
+        self.machine.decode_instruction(0x00ff)
+        assert self.machine.hires
+        assert self.display.size == (128, 64, 1)
+        assert self.machine.framebuffer == [0] * 64
+        assert len(self.machine.framebuffer_bytes()) == 128 * 64 // 8
+        self.machine.decode_instruction(0x00fe)
+        assert self.display.size == (64, 32, 1)
+        assert len(self.machine.framebuffer) == 32
+
+    def test_large_sprite_wraps(self):
+        machine = self.machine
+        machine.decode_instruction(0x00ff)
+        machine.memory[0x300:0x320] = b'\xff\xff' * 16
+        machine.register_i = 0x300
+        machine.v[0], machine.v[1] = 120, 60
+        machine.decode_instruction(0xd010)
+        row = 0xff << 120 | 0xff
+        assert machine.framebuffer[60:64] == [row] * 4
+        assert machine.framebuffer[0:12] == [row] * 12
+        assert machine.framebuffer[12] == 0
+        assert machine.v[0xf] == 0
+        machine.decode_instruction(0xd010)
+        assert machine.v[0xf] == 1
+        assert not any(machine.framebuffer)
+
+    def test_low_resolution_sprite(self):
+        self.machine.memory[0x300] = 0x81
+        self.machine.register_i = 0x300
+        self.machine.v[0], self.machine.v[1] = 60, 31
+        self.machine.decode_instruction(0xd011)
+        assert self.machine.framebuffer[31] == 0b1000 | 1 << 60
+
+    def test_scroll(self):
+        machine = self.machine
+        machine.decode_instruction(0x00ff)
+        machine.framebuffer[0] = 1 << 127 | 1
+        machine.decode_instruction(0x00c3)
+        assert machine.framebuffer[3] == 1 << 127 | 1
+        assert machine.framebuffer[0] == 0
+        machine.decode_instruction(0x00fb)
+        assert machine.framebuffer[3] == 1 << 123
+        machine.decode_instruction(0x00fc)
+        assert machine.framebuffer[3] == 1 << 127
+        machine.decode_instruction(0x00c8)
+        assert machine.framebuffer[3] == 0
+        assert machine.framebuffer[11] == 1 << 127
+
+    def test_big_font(self):
+        self.machine.v[3] = 8
+        self.machine.decode_instruction(0xf330)
+        assert self.machine.register_i == BIG_FONT_ADDRESS + 80
+        assert self.machine.memory[BIG_FONT_ADDRESS + 80] == 0x3c
+
+    def test_flags(self):
+        self.machine.v[:4] = b'\x01\x02\x03\x04'
+        self.machine.decode_instruction(0xf275)
+        self.machine.v[:4] = bytes(4)
+        self.machine.decode_instruction(0xf385)
+        assert self.machine.v[:4] == b'\x01\x02\x03\x00'
+
+    def test_exit(self):
+        self.machine.load_rom(b'\x00\xfd')
+        self.machine.run(3)
+        assert self.machine.pc == 0x200
+
+
+class TestXOChip:
+
+    def setup_method(self):
+        self.display = HeadlessDisplay()
+        self.machine = Chip8(self.display, mode=XOCHIP)
+
+    def test_memory(self):
+        assert len(self.machine.memory) == 0x10000
+        self.machine.load_rom(bytes(0x8000))
+
+    def test_long_load_skipped_whole(self):
+        # SE V0, 0; I = 0xabcd; V1 = 1
+        self.machine.load_rom(bytes.fromhex('3000' 'f000abcd' '6101'))
+        self.machine.execute_cycle()
+        assert self.machine.pc == 0x206
+        self.machine.pc = 0x202
+        self.machine.execute_cycle()
+        assert self.machine.register_i == 0xabcd
+        assert self.machine.pc == 0x206
+
+    def test_planes(self):
+        machine = self.machine
+        assert self.display.size == (64, 32, 2)
+        machine.memory[0x300:0x302] = b'\x80\x40'
+        machine.register_i = 0x300
+        machine.decode_instruction(0xf301)
+        machine.decode_instruction(0xd011)
+        assert machine.framebuffer[0] == 1 << 63
+        assert machine.framebuffer[32] == 1 << 62
+        machine.decode_instruction(0xf201)
+        machine.decode_instruction(0x00e0)
+        assert machine.framebuffer[0] == 1 << 63
+        assert machine.framebuffer[32] == 0
+        machine.decode_instruction(0xf101)
+        machine.decode_instruction(0x00c1)
+        assert machine.framebuffer[1] == 1 << 63
+
+    def test_register_ranges(self):
+        machine = self.machine
+        machine.v[2:5] = b'\x0a\x0b\x0c'
+        machine.register_i = 0x300
+        machine.decode_instruction(0x5242)
+        assert machine.memory[0x300:0x303] == b'\x0a\x0b\x0c'
+        machine.decode_instruction(0x5423)
+        assert machine.v[2:5] == b'\x0a\x0b\x0c'[::-1]
+        assert machine.register_i == 0x300
+
+    def test_sound(self):
+        self.machine.memory[0x300:0x310] = bytes(range(16))
+        self.machine.register_i = 0x300
+        self.machine.decode_instruction(0xf002)
+        assert self.machine.audio_pattern == bytes(range(16))
+        self.machine.v[4] = 100
+        self.machine.decode_instruction(0xf43a)
+        assert self.machine.pitch == 100
+
+
+class TestQuirks:
+
+    def machine(self, quirks):
+        machine = Chip8(Mock(), quirks=quirks)
+        machine.v[1], machine.v[2] = 0x81, 0x02
+        machine.register_i = 0x300
+        return machine
+
+    def test_defaults(self):
+        assert Chip8(Mock()).quirks == 'vip'
+        assert Chip8(HeadlessDisplay(), mode=SCHIP).quirks == 'schip'
+        with pytest.raises(ValueError):
+            Chip8(Mock(), quirks='eti660')
+
+    def test_shift(self):
+        machine = self.machine('vip')
+        machine.decode_instruction(0x8126)
+        assert (machine.v[1], machine.v[0xf]) == (0x01, 0)
+        for quirks in ('chip48', 'schip', 'modern'):
+            machine = self.machine(quirks)
+            machine.decode_instruction(0x8126)
+            assert (machine.v[1], machine.v[0xf]) == (0x40, 1)
+            machine.decode_instruction(0x812e)
+            assert (machine.v[1], machine.v[0xf]) == (0x80, 0)
+
+    def test_load_store(self):
+        for quirks, register_i in (('vip', 0x303), ('chip48', 0x302),
+                                   ('schip', 0x300), ('modern', 0x300)):
+            machine = self.machine(quirks)
+            machine.decode_instruction(0xf255)
+            assert machine.memory[0x300:0x303] == b'\x00\x81\x02'
+            assert machine.register_i == register_i, quirks
+            machine.register_i = 0x301
+            machine.decode_instruction(0xf165)
+            assert machine.v[:2] == b'\x81\x02'
+
+    def test_jump(self):
+        machine = self.machine('vip')
+        machine.decode_instruction(0xb210)
+        assert machine.pc == 0x210
+        machine = self.machine('schip')
+        machine.decode_instruction(0xb210)
+        assert machine.pc == 0x212
+
+    def test_bound_once(self):
+        machine = Chip8(Mock(), quirks='modern', seed=1)
+        assert list(machine._overrides) == ['quirks', 'seed']
+        assert Chip8(Mock(), quirks='modern')._dispatch is \
+            Chip8(Mock(), quirks='modern')._dispatch
+        assert Chip8(Mock())._dispatch is dispatch_table(Chip8)
+
+    def test_overrides_only_rebuild_their_families(self):
+        plain = dispatch_table(Chip8)
+        seeded = Chip8(Mock(), seed=1)._dispatch
+        assert seeded[0xc0ff] is not plain[0xc0ff]
+        assert seeded[0x6012] is plain[0x6012]
+        assert seeded[0xf033] is plain[0xf033]
@@ -0,0 +1,70 @@
+import pytest
+from mock import Mock
+
+from chip8.core import Chip8
+from chip8.debugger import BreakpointHit, Debugger, WatchpointHit
+from chip8.translator import TranslationCache
+
+# 200: V0 += 1; 202: I = 0x300; 204: dump V0 at I; 206: goto 200
+ROM = bytes.fromhex('7001' 'a300' 'f055' '1200')
+
+
+class TestDebugger:
+
+    def setup_method(self):
+        self.machine = Chip8(Mock())
+        self.machine.load_rom(ROM)
+        self.debugger = Debugger(self.machine)
+
+    def test_breakpoint(self):
+        self.debugger.add_breakpoint(0x204)
+        with pytest.raises(BreakpointHit) as hit:
+            self.machine.run(100)
+        assert hit.value.pc == 0x204
+        assert self.machine.pc == 0x204
+        assert self.machine.cycles == 2
+
+    def test_resume(self):
+        self.debugger.add_breakpoint(0x204)
+        with pytest.raises(BreakpointHit):
+            self.machine.run(100)
+        self.debugger.resume()
+        with pytest.raises(BreakpointHit):
+            self.machine.run(100)
+        assert self.machine.cycles == 6
+        assert self.machine.v[0] == 2
+
+    def test_conditional_breakpoint(self):
+        self.debugger.add_breakpoint(0x202, 'v[0] == 3 and i == 0x301')
+        with pytest.raises(BreakpointHit):
+            self.machine.run(100)
+        assert self.machine.v[0] == 3
+
+    def test_watchpoint(self):
+        self.debugger.watch(0x300)
+        with pytest.raises(WatchpointHit) as hit:
+            self.machine.run(100)
+        assert (hit.value.address, hit.value.pc) == (0x300, 0x204)
+        assert self.machine.memory[0x300] == 1
+
+    def test_watchpoint_other_page(self):
+        self.debugger.watch(0x400, 16)
+        self.machine.run(100)
+        assert self.machine.cycles == 100
+
+    def test_watchpoint_translated(self):
+        engine = TranslationCache(self.machine)
+        engine.run(8)
+        self.debugger.watch(0x300)
+        with pytest.raises(WatchpointHit):
+            engine.run(100)
+
+    def test_unarmed_costs_nothing(self):
+        table = self.machine._dispatch
+        self.debugger.add_breakpoint(0x204, 'v[0] > 1')
+        self.debugger.watch(0x300)
+        assert self.machine.tracing
+        self.debugger.clear()
+        assert not self.machine.tracing
+        assert self.machine._dispatch is table
+        assert 'execute_cycle' not in vars(self.machine)
@@ -0,0 +1,149 @@
+import threading
+import time
+
+from mock import Mock, call
+
+from chip8.core import SCHIP, Chip8
+from chip8.frontend import Frontend
+from chip8.headless_display import HeadlessDisplay
+
+
+class FakeClock(object):
+    """Clock moving on by ``step`` every time it is read."""
+
+    def __init__(self, step):
+        self.now = 0.0
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+class SlowDisplay(HeadlessDisplay):
+    """Display taking until emulation has run on to present a frame."""
+
+    def __init__(self, frames):
+        super(SlowDisplay, self).__init__()
+        self.frames_per_present = frames
+        self.frontend = None
+        # Emulated frames when each present started and finished.
+        self.presented = []
+        self.prepare_threads = set()
+        self.present_threads = set()
+
+    def prepare(self, framebuffer, ys):
+        self.prepare_threads.add(threading.current_thread())
+
+    def present(self):
+        self.present_threads.add(threading.current_thread())
+        scheduler = self.frontend.scheduler
+        start = scheduler.frames
+        # Real time only bounds the wait, in case emulation has stalled.
+        timeout = time.monotonic() + 5
+        while (scheduler.frames < start + self.frames_per_present and
+               self.frontend.running and time.monotonic() < timeout):
+            time.sleep(0.001)
+        self.presented.append((start, scheduler.frames))
+        super(SlowDisplay, self).present()
+
+
+class TestFrontend:
+
+    def setup_method(self):
+        self.machine = Chip8(HeadlessDisplay())
+        self.machine.load_rom(b'\x70\x01\x12\x00')  # V0 += 1; goto 200
+        self.display = Mock()
+
+    def test_runs_frames(self):
+        frontend = Frontend(self.machine, self.display, speed=600,
+                            realtime=False, threaded=False)
+        frontend.run(frames=5)
+        assert self.machine.cycles == 50
+        assert frontend.scheduler.frames == 5
+        assert self.display.present.called
+
+    def test_input(self):
+        events = [[(5, True)], [], [(5, False)]]
+
+        def poll_input():
+            return events.pop(0) if events else []
+
+        keys = []
+        self.machine.add_hook('key', lambda machine, key: keys.append(key))
+        frontend = Frontend(self.machine, self.display, poll_input=poll_input,
+                            input_rate=1000, threaded=False)
+        frontend.run(frames=3)
+        assert keys == [5, False]
+
+    def test_presents_latest_frame(self):
+        self.machine.framebuffer[3] = 1
+        frontend = Frontend(self.machine, self.display, realtime=False,
+                            threaded=False)
+        frontend.run(frames=1)
+        assert call(frontend.frame, 3, 1) in self.display.draw.call_args_list
+        assert frontend.frame[3] == 1
+
+    def test_slow_render_does_not_stall_emulation(self):
+        display = SlowDisplay(frames=3)
+        self.machine.load_rom(bytes.fromhex('6000' 'f029' 'd005' '7001' '1202'))
+        frontend = Frontend(self.machine, display, speed=600)
+        display.frontend = frontend
+        frontend.run(frames=12)
+        assert frontend.scheduler.frames == 12
+        # Emulation ran on while the first frame was being presented.
+        start, end = display.presented[0]
+        assert end >= start + 3
+        assert 0 < display.frames < 12
+        assert frontend.dropped_frames > 0
+        assert frontend.render_time > 0
+        # Only preparation leaves the event loop thread.
+        loop_thread = threading.current_thread()
+        assert display.present_threads == {loop_thread}
+        assert loop_thread not in display.prepare_threads
+
+    def test_skips_renders_when_emulation_behind(self):
+        machine = self.machine
+        machine.load_rom(bytes.fromhex('6000' 'f029' 'd005' '7001' '1202'))
+        clock = FakeClock(0)
+
+        class SlowEngine(object):
+            def run(self, cycles):
+                clock.now += 0.025
+                return machine.run(cycles)
+
+        frontend = Frontend(machine, self.display, speed=600,
+                            engine=SlowEngine(), threaded=False,
+                            clock=clock, max_frameskip=3)
+        frontend.run(frames=12)
+        assert frontend.scheduler.frames == 12
+        assert frontend.lag > 0
+        assert frontend.dropped_frames > 0
+        assert frontend.presented < 12
+
+    def test_skips_renders_that_would_miss_deadline(self):
+        # Emulation alone keeps up, but rendering takes longer than a frame.
+        machine = self.machine
+        machine.load_rom(bytes.fromhex('6000' 'f029' 'd005' '7001' '1202'))
+        clock = FakeClock(0)
+
+        def present():
+            clock.now += 0.03
+
+        self.display.present.side_effect = present
+        frontend = Frontend(machine, self.display, speed=600,
+                            threaded=False, clock=clock, max_frameskip=2)
+        frontend.run(frames=12)
+        assert frontend.scheduler.frames == 12
+        assert frontend.scheduler.present_time >= 0.03
+        assert frontend.dropped_frames > 0
+        assert frontend.presented < 12
+
+    def test_resizes_display(self):
+        machine = Chip8(HeadlessDisplay(), mode=SCHIP)
+        machine.load_rom(b'\x00\xff\x12\x02')  # high resolution; goto 202
+        display = HeadlessDisplay()
+        frontend = Frontend(machine, display, realtime=False, threaded=False)
+        frontend.run(frames=2)
+        assert display.size == (128, 64, 1)
+        assert len(display.framebuffer) == 64
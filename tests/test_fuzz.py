@@ -0,0 +1,99 @@
+import os
+
+from chip8 import fuzz
+from chip8.fuzz import Case, Fuzzer, execute
+
+
+class TestExecute:
+
+    def test_clean(self):
+        result = execute(Case(bytes.fromhex('6001' '7001' '1202'), ()), 30)
+        assert result.crash is None
+        assert result.pcs == [0x200, 0x202, 0x204]
+        assert result.opcodes == [0x1202, 0x6001, 0x7001]
+        assert result.cycles == 30
+
+    def test_stops_when_halted(self):
+        result = execute(Case(bytes.fromhex('1200'), ()))
+        assert result.crash is None
+        assert result.cycles < fuzz.DEFAULT_CYCLES
+
+    def test_stack_underflow(self):
+        result = execute(Case(bytes.fromhex('00ee'), ()))
+        assert result.crash == ('RuntimeError', 'Stack underflow', 'ret')
+
+    def test_stack_overflow(self):
+        crash = execute(Case(bytes.fromhex('2200'), ())).crash
+        assert crash[0] == 'IndexError'
+        assert crash[2] == 'call'
+
+    def test_decode_failure(self):
+        crash = execute(Case(bytes.fromhex('800f'), ())).crash
+        assert crash == ('RuntimeError', 'Failed to decode instruction', None)
+
+    def test_keys(self):
+        # Skip the self-jump only while key 5 is held.
+        rom = bytes.fromhex('6005' 'e09e' '1202' '00ee')
+        assert execute(Case(rom, ()), 100).crash is None
+        crash = execute(Case(rom, ((2, 5),)), 100).crash
+        assert crash == ('RuntimeError', 'Stack underflow', 'ret')
+
+
+class TestFuzzer:
+
+    def setup_method(self):
+        self.fuzzer = Fuzzer(cycles=500, seed=1)
+
+    def test_run(self):
+        self.fuzzer.run(execs=300)
+        stats = self.fuzzer.stats()
+        assert stats['execs'] == 300
+        assert stats['corpus'] > 1
+        assert stats['pcs'] > 2
+        assert stats['crashes'] > 0
+
+    def test_run_resumes(self):
+        self.fuzzer.run(execs=50)
+        self.fuzzer.run(execs=100)
+        assert self.fuzzer.execs == 100
+
+    def test_reproducible(self):
+        self.fuzzer.run(execs=100)
+        other = Fuzzer(cycles=500, seed=1)
+        other.run(execs=100)
+        assert other.corpus == self.fuzzer.corpus
+
+    def test_shrink(self):
+        rom = bytes.fromhex('6001' '7001' '6202' '00ee' '1200')
+        keys = ((1, 3), (2, False))
+        crash = execute(Case(rom, keys), 500).crash
+        shrunk = self.fuzzer.shrink(Case(rom, keys), crash)
+        assert shrunk == Case(bytes.fromhex('00ee'), ())
+
+    def test_mutate_stays_in_memory(self):
+        case = Case(bytes(fuzz.MEMORY_SIZES[fuzz.CHIP8] -
+                          fuzz.PC_START_ADDRESS), ())
+        for _ in range(100):
+            mutant = self.fuzzer.mutate(case)
+            assert 0 < len(mutant.rom) <= len(case.rom)
+            assert len(mutant.keys) <= fuzz.MAX_KEY_EVENTS
+
+    def test_save(self, tmp_path):
+        self.fuzzer.run(execs=300)
+        self.fuzzer.save(str(tmp_path))
+        corpus = [fuzz.load_case(str(path))
+                  for path in (tmp_path / 'corpus').iterdir()]
+        assert sorted(corpus) == sorted(self.fuzzer.corpus)
+        crashes = [fuzz.load_case(str(path))
+                   for path in (tmp_path / 'crashes').iterdir()]
+        assert sorted(crashes) == sorted(self.fuzzer.crashes.values())
+
+
+def test_main(tmp_path, capsys):
+    rom = tmp_path / 'seed.ch8'
+    rom.write_bytes(bytes.fromhex('6001' '7001' '1202'))
+    output = tmp_path / 'out'
+    fuzz.main([str(rom), '--execs', '64', '--jobs', '1', '--cycles', '200',
+               '--seed', '1', '--output', str(output)])
+    assert 'execs/s per core' in capsys.readouterr().out
+    assert os.listdir(str(output / 'corpus'))
@@ -0,0 +1,44 @@
+import io
+
+from mock import Mock
+
+from chip8.core import Chip8
+from chip8.profiler import Profiler
+
+
+class TestProfiler:
+
+    def setup_method(self):
+        self.machine = Chip8(Mock())
+        # V0 = 0; loop: V0 += 1; goto loop
+        self.machine.load_rom(b'\x60\x00\x70\x01\x12\x02')
+
+    def test_counts(self):
+        with Profiler(self.machine) as profiler:
+            self.machine.run(21)
+        assert self.machine.v[0] == 10
+        handlers = profiler.handlers()
+        assert handlers['set_vx_to_nn'][0] == 1
+        assert handlers['add_nn_to_vx'][0] == 10
+        assert handlers['jump'][0] == 10
+        assert profiler.hot_pcs(2) == [(0x202, 'add_nn_to_vx', 10), (0x204, 'jump', 10)]
+        assert profiler.hot_loops() == [(0x202, 0x204, 10)]
+
+    def test_stop_restores_dispatch(self):
+        table = self.machine._dispatch
+        profiler = Profiler(self.machine)
+        profiler.start()
+        assert self.machine._dispatch is not table
+        profiler.stop()
+        assert self.machine._dispatch is table
+        self.machine.run(3)
+        assert profiler.handlers() == {}
+
+    def test_reports(self):
+        with Profiler(self.machine) as profiler:
+            self.machine.run(5)
+        assert 'add_nn_to_vx' in profiler.report()
+        collapsed = io.StringIO()
+        profiler.write_collapsed(collapsed, weight='calls')
+        assert collapsed.getvalue().splitlines() == [
+            '0x200;set_vx_to_nn 1', '0x202;add_nn_to_vx 2', '0x204;jump 2']
@@ -0,0 +1,61 @@
+import pytest
+from mock import Mock
+
+from chip8 import replay
+from chip8.core import Chip8
+from chip8.scheduler import Scheduler
+
+# Count cycles with key 5 held in V2 and sum random numbers in V3.
+ROM = bytes.fromhex('6005' 'e09e' '1208' '7201' 'c1ff' '8314' '1202')
+
+
+class TestReplay:
+
+    def setup_method(self):
+        self.machine = Chip8(Mock(), seed=1234)
+        self.machine.load_rom(ROM)
+        self.recorder = replay.InputRecorder(self.machine, speed=600)
+
+    def play(self, frames):
+        machine = self.machine
+        presses = {3: 5, 7: False}
+        scheduler = Scheduler(machine, 600, realtime=False)
+        scheduler.poll = lambda: (scheduler.frames in presses and
+                                  machine.key_pressed(presses[scheduler.frames]))
+        scheduler.run(frames)
+
+    def test_record(self):
+        self.play(10)
+        assert self.recorder.events == [(30, 5), (70, False)]
+        session = self.recorder.session(ROM)
+        assert session.seed == 1234
+        assert session.cycles == 100
+        assert session.quirks == 'vip'
+
+    def test_old_session(self, tmpdir):
+        path = tmpdir.join('session.json')
+        path.write('{"version": 1, "rom_sha1": "", "seed": 1, "speed": 600, '
+                   '"cycles": 0, "events": []}')
+        assert replay.load(str(path)).quirks is None
+
+    def test_replay(self, tmpdir):
+        self.play(10)
+        path = str(tmpdir.join('session.json'))
+        self.recorder.save(path, ROM)
+        machine = replay.replay(replay.load(path), ROM)
+        assert machine.cycles == self.machine.cycles
+        assert machine.v == self.machine.v
+        assert machine.v[2] > 0
+
+    def test_replay_translated(self):
+        self.play(10)
+        machine = replay.replay(self.recorder.session(ROM), ROM, translate=True)
+        assert machine.v == self.machine.v
+
+    def test_other_rom(self):
+        with pytest.raises(ValueError):
+            replay.replay(self.recorder.session(ROM), b'\x12\x00')
+
+    def test_unseeded(self):
+        with pytest.raises(ValueError):
+            replay.InputRecorder(Chip8(Mock()))
@@ -0,0 +1,68 @@
+from mock import Mock
+
+import pytest
+
+from chip8 import state
+from chip8.core import Chip8
+from chip8.rewind import RewindBuffer
+
+
+class TestRewindBuffer:
+
+    def setup_method(self):
+        self.machine = Chip8(Mock())
+        # Draw sprite 0 at V0, V0 and increment V0, forever.
+        self.machine.load_rom(b'\xa0\x00\xd0\x05\x70\x01\x12\x02')
+        self.rewind = RewindBuffer(capacity=40, keyframe_interval=10)
+
+    def run_frames(self, frames):
+        snapshots = []
+        for _ in range(frames):
+            self.machine.run(7)
+            self.machine.tick_timers()
+            self.rewind.record(self.machine)
+            snapshots.append(bytes(state.save(self.machine)))
+        return snapshots
+
+    def test_seek(self):
+        snapshots = self.run_frames(25)
+        for frame in (24, 20, 13, 0):
+            self.rewind.seek(self.machine, frame)
+            assert bytes(state.save(self.machine)) == snapshots[frame]
+
+    def test_record_after_seek(self):
+        snapshots = self.run_frames(25)
+        self.rewind.seek(self.machine, 12)
+        more = self.run_frames(3)
+        assert self.rewind.frames == 16
+        self.rewind.seek(self.machine, 14)
+        assert bytes(state.save(self.machine)) == more[1]
+        self.rewind.seek(self.machine, 5)
+        assert bytes(state.save(self.machine)) == snapshots[5]
+
+    def test_ring_overwrites_oldest(self):
+        snapshots = self.run_frames(95)
+        assert self.rewind.oldest == 60
+        with pytest.raises(IndexError):
+            self.rewind.seek(self.machine, 59)
+        self.rewind.seek(self.machine, 61)
+        assert bytes(state.save(self.machine)) == snapshots[61]
+
+    def test_deltas_are_small(self):
+        self.run_frames(10)
+        # One keyframe and nine deltas that together are smaller than it.
+        assert self.rewind.size() < 2 * state.STATE_SIZE
+        assert self.rewind.record_overhead() > 0
+
+    def test_rewind_replays_random_numbers(self):
+        machine = Chip8(Mock(), seed=1234)
+        # Add random numbers to V1, forever.
+        machine.load_rom(b'\xc0\xff\x81\x04\x12\x00')
+        for _ in range(5):
+            machine.run(6)
+            self.rewind.record(machine)
+        machine.run(6)
+        expected = bytes(machine.v)
+        self.rewind.rewind(machine, 0)
+        machine.run(6)
+        assert bytes(machine.v) == expected
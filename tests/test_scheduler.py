@@ -0,0 +1,125 @@
+from mock import Mock
+
+from chip8.core import Chip8
+from chip8.scheduler import Scheduler
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class SlowEngine(object):
+    """Engine taking ``seconds`` of the fake clock per frame."""
+
+    def __init__(self, machine, clock, seconds):
+        self.machine = machine
+        self.clock = clock
+        self.seconds = seconds
+
+    def run(self, cycles):
+        self.clock.now += self.seconds
+        return self.machine.run(cycles)
+
+
+class TestScheduler:
+
+    def setup_method(self):
+        self.machine = Chip8(Mock())
+        self.machine.load_rom(b'\x12\x00')  # goto 0x200
+        self.clock = FakeClock()
+
+    def test_instructions_per_frame(self):
+        scheduler = Scheduler(self.machine, speed=90, realtime=False)
+        executed = [scheduler.run_frame() for _ in range(4)]
+        assert executed == [1, 2, 1, 2]
+        assert self.machine.cycles == 6
+
+    def test_timers_tick_once_per_frame(self):
+        self.machine.dt = 10
+        scheduler = Scheduler(self.machine, speed=6000, realtime=False)
+        scheduler.run(frames=3)
+        assert self.machine.dt == 7
+        assert self.machine.cycles == 300
+
+    def test_sleeps_once_per_frame(self):
+        scheduler = Scheduler(self.machine, clock=self.clock,
+                              sleep=self.clock.sleep)
+        scheduler.run(frames=60)
+        assert len(self.clock.sleeps) == 60
+        assert abs(self.clock.now - 1.0) < 1e-9
+
+    def test_unthrottled_never_sleeps(self):
+        scheduler = Scheduler(self.machine, realtime=False, clock=self.clock,
+                              sleep=self.clock.sleep)
+        scheduler.run(frames=60)
+        assert self.clock.sleeps == []
+
+    def test_stop(self):
+        scheduler = Scheduler(self.machine, realtime=False)
+        scheduler.poll = scheduler.stop
+        scheduler.run()
+        assert scheduler.frames == 1
+
+    def test_presents_every_frame_on_time(self):
+        presents = []
+        scheduler = Scheduler(self.machine, clock=self.clock,
+                              sleep=self.clock.sleep,
+                              engine=SlowEngine(self.machine, self.clock, 0.005),
+                              present=lambda: presents.append(scheduler.frames))
+        scheduler.run(frames=10)
+        assert presents == list(range(10))
+        assert scheduler.dropped_frames == 0
+        assert scheduler.lag == 0.0
+        assert abs(scheduler.emulation_time - 0.005) < 1e-9
+
+    def test_skips_presents_when_behind(self):
+        presents = []
+
+        def present():
+            presents.append(scheduler.frames)
+            self.clock.now += 0.01
+
+        self.machine.dt = 60
+        scheduler = Scheduler(self.machine, speed=600, clock=self.clock,
+                              sleep=self.clock.sleep, max_frameskip=2,
+                              engine=SlowEngine(self.machine, self.clock, 0.012),
+                              present=present)
+        scheduler.run(frames=30)
+        assert scheduler.dropped_frames > 0
+        assert len(presents) + scheduler.dropped_frames == 30
+        assert all(b - a <= 3 for a, b in zip(presents, presents[1:]))
+        # Timers and the CPU keep to every frame.
+        assert self.machine.dt == 30
+        assert self.machine.cycles == 300
+        # Skipping presents lets emulation keep up with real time.
+        assert self.clock.now < 30 / 60.0 + 0.03
+
+    def test_unthrottled_presents_every_frame(self):
+        presents = []
+        scheduler = Scheduler(self.machine, realtime=False, clock=self.clock,
+                              engine=SlowEngine(self.machine, self.clock, 0.1),
+                              present=lambda: presents.append(scheduler.frames))
+        scheduler.run(frames=5)
+        assert len(presents) == 5
+        assert scheduler.dropped_frames == 0
+
+    def test_skip_present(self):
+        scheduler = Scheduler(self.machine, max_frameskip=2)
+        scheduler.present_time = 0.01
+        assert not scheduler.skip_present(1.0, None)
+        assert not scheduler.skip_present(1.0, 1.02)
+        assert scheduler.skip_present(1.0, 1.005)
+        assert scheduler.skip_present(1.0, 1.005)
+        # At most max_frameskip in a row.
+        assert not scheduler.skip_present(1.0, 1.005)
+        assert scheduler.skip_present(1.0, 1.005)
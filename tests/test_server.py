@@ -0,0 +1,65 @@
+import asyncio
+
+from chip8 import server
+from chip8.core import Chip8, DISPLAY_HEIGHT
+from chip8.headless_display import HeadlessDisplay
+
+# Draw font sprites across the screen, one per loop.
+ROM = bytes.fromhex('6000' 'f029' 'd115' '7105' '7001' '1202')
+
+
+class TestEncoding:
+
+    def test_round_trip(self):
+        previous = [0] * DISPLAY_HEIGHT
+        rows = list(previous)
+        rows[3] = 0xff << 56
+        rows[7] = 0x0100000000000080
+        message = server.frame_message(9, rows, previous, range(DISPLAY_HEIGHT))
+        kind, length = server.MESSAGE.unpack_from(message)
+        assert kind == server.FRAME_MESSAGE
+        payload = message[server.MESSAGE.size:]
+        assert len(payload) == length
+        framebuffer = list(previous)
+        assert server.decode_rows(payload, framebuffer) == 9
+        assert framebuffer == rows
+
+    def test_size_follows_changes(self):
+        previous = [0x5555555555555555] * DISPLAY_HEIGHT
+        rows = list(previous)
+        rows[0] ^= 1
+        count, encoded = server.encode_rows(rows, previous, range(DISPLAY_HEIGHT))
+        assert count == 1
+        assert encoded == bytes([0, 0x01, 0x01])
+
+
+class TestServer:
+
+    def test_stream(self, tmpdir):
+        path = str(tmpdir.join('chip8.sock'))
+        machine = Chip8(HeadlessDisplay())
+        machine.load_rom(ROM)
+        chip8_server = server.Server(machine, speed=1200)
+        framebuffer = [0] * DISPLAY_HEIGHT
+        frames = []
+
+        async def client():
+            while not tmpdir.join('chip8.sock').exists():
+                await asyncio.sleep(0.001)
+            reader, writer = await asyncio.open_unix_connection(path)
+            writer.write(server.key_message(0xa, True))
+            try:
+                while True:
+                    kind, payload = await server.read_message(reader)
+                    frames.append(server.decode_rows(payload, framebuffer))
+            except asyncio.IncompleteReadError:
+                pass
+            writer.close()
+
+        async def run():
+            await asyncio.gather(chip8_server.serve(path, frames=10), client())
+
+        asyncio.run(run())
+        assert framebuffer == machine.framebuffer
+        assert len(frames) > 1
+        assert machine.key == 0xa
@@ -0,0 +1,58 @@
+from mock import Mock
+
+import pytest
+
+from chip8 import state
+from chip8.core import MEMORY_SIZES, SCHIP, Chip8
+
+
+class TestState:
+
+    def setup_method(self):
+        self.machine = Chip8(Mock())
+        self.machine.load_rom(b'\xa0\x00\xd0\x15\x60\x07\xf0\x15\x22\x10')
+        self.machine.run(5)
+        self.machine.key_pressed(3)
+
+    def assert_same(self, restored):
+        machine = self.machine
+        assert restored.memory == machine.memory
+        assert restored.v == machine.v
+        assert restored.framebuffer == machine.framebuffer
+        for name in ('pc', 'register_i', 'stack', 'stack_ptr', 'dt', 'st',
+                     'key', 'cycles'):
+            assert getattr(restored, name) == getattr(machine, name)
+
+    def test_round_trip(self):
+        blob = state.save(self.machine)
+        assert len(blob) == state.STATE_SIZE
+        restored = Chip8(Mock())
+        state.restore(restored, blob)
+        self.assert_same(restored)
+        restored.display.draw.assert_called_once_with(restored.framebuffer, 0, 32)
+
+    def test_save_into_buffer(self):
+        buffer = bytearray(state.STATE_SIZE + 8)
+        assert state.save(self.machine, buffer, offset=8) is buffer
+        restored = Chip8(Mock())
+        state.restore(restored, memoryview(buffer), offset=8)
+        self.assert_same(restored)
+
+    def test_file(self, tmp_path):
+        path = str(tmp_path / 'state.c8s')
+        state.save_file(self.machine, path)
+        restored = Chip8(Mock())
+        state.restore_file(restored, path)
+        self.assert_same(restored)
+
+    def test_bad_magic(self):
+        with pytest.raises(ValueError):
+            state.restore(Chip8(Mock()), bytes(state.STATE_SIZE))
+
+    def test_only_chip8(self):
+        machine = Chip8(Mock(), mode=SCHIP)
+        with pytest.raises(ValueError):
+            state.save(machine)
+        with pytest.raises(ValueError):
+            state.restore(machine, state.save(self.machine))
+        assert len(machine.memory) == MEMORY_SIZES[SCHIP]
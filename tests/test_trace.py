@@ -0,0 +1,46 @@
+from mock import Mock
+
+from chip8 import trace
+from chip8.core import Chip8
+
+
+class TestTrace:
+
+    def setup_method(self):
+        self.machine = Chip8(Mock())
+        # V0 = 1; I = 0x300; V0 += 1; goto 0x204
+        self.machine.load_rom(b'\x60\x01\xa3\x00\x70\x01\x12\x04')
+
+    def record(self, path, cycles):
+        with trace.TraceRecorder(self.machine, str(path), chunk_size=4) as recorder:
+            self.machine.run(cycles)
+        assert not self.machine.tracing
+        return recorder
+
+    def test_round_trip(self, tmp_path):
+        path = tmp_path / 'run.trace'
+        recorder = self.record(path, 6)
+        assert recorder.records == 6
+        assert len(list(trace.read_chunks(str(path)))) == 2
+        records = list(trace.read_records(str(path)))
+        assert records[:3] == [
+            trace.Record(0, 0x200, 0x6001, 0, 0, 1),
+            trace.Record(1, 0x202, 0xa300, 0x300, trace.NO_REGISTER, 0),
+            trace.Record(2, 0x204, 0x7001, 0x300, 0, 2),
+        ]
+        assert records[-1] == trace.Record(5, 0x206, 0x1204, 0x300, trace.NO_REGISTER, 0)
+
+    def test_filter(self, tmp_path):
+        path = tmp_path / 'run.trace'
+        self.record(path, 10)
+        records = trace.read_records(str(path), lambda record: record.pc == 0x204)
+        assert [record.value for record in records] == [2, 3, 4, 5]
+
+    def test_summary(self, tmp_path, capsys):
+        path = tmp_path / 'run.trace'
+        self.record(path, 10)
+        handlers, pcs = trace.summarise(str(path), top=2)
+        assert handlers == [('add_nn_to_vx', 4), ('jump', 4)]
+        assert pcs[0][1] == 4
+        trace.main(['summary', str(path)])
+        assert 'set_i_to_nnn' in capsys.readouterr().out
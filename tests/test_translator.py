@@ -0,0 +1,73 @@
+import pytest
+from mock import Mock
+
+from chip8.core import Chip8, PC_START_ADDRESS
+from chip8.debugger import Debugger, WatchpointHit
+from chip8.translator import TranslationCache
+
+
+class TestTranslationCache:
+
+    def setup_method(self):
+        self.machine = Chip8(Mock())
+        self.cache = TranslationCache(self.machine)
+
+    def test_block_matches_interpreter(self):
+        rom = b'\x60\x05\x61\x07\x80\x14\x70\x01\xa3\x00\xf0\x1e'
+        reference = Chip8(Mock())
+        reference.load_rom(rom)
+        self.machine.load_rom(rom)
+        for _ in range(6):
+            reference.execute_cycle()
+        assert self.cache.run(6) == 6
+        assert self.machine.v == reference.v
+        assert self.machine.register_i == reference.register_i
+        assert self.machine.pc == reference.pc
+        assert self.machine.cycles == reference.cycles
+
+    def test_cache_hit(self):
+        self.machine.load_rom(b'\x70\x01\x12\x00')  # add 1 to V0; goto 0x200
+        self.cache.run(10)
+        assert self.machine.v[0] == 5
+        assert self.cache.misses == 1
+        assert self.cache.hits == 4
+
+    def test_run_does_not_overshoot(self):
+        self.machine.load_rom(b'\x70\x01\x70\x01\x70\x01\x12\x00')
+        assert self.cache.run(2) == 2
+        assert self.machine.v[0] == 2
+        assert self.machine.pc == PC_START_ADDRESS + 4
+
+    def test_self_modifying_code(self):
+        # 0x200: V0 = 1
+        # 0x202: I = 0x200; V0 = 0x60, V1 = 0x07; store V0-V1 at I,
+        #        rewriting 0x200 to V0 = 7
+        # 0x20c: goto 0x200
+        self.machine.load_rom(
+            b'\x60\x01\xa2\x00\x60\x60\x61\x07\xf1\x55\x12\x00')
+        self.cache.run(6)
+        assert self.cache.invalidations == 1
+        self.cache.run(1)
+        assert self.machine.v[0] == 7
+
+    def test_write_while_tracing(self):
+        # As above, rewriting 0x200 to V2 = 7 while a hook forces the
+        # instructions to be interpreted.
+        self.machine.load_rom(
+            b'\x62\x01\xa2\x00\x60\x62\x61\x07\xf1\x55\x12\x00')
+        self.cache.run(1)
+        hook = Mock()
+        self.machine.add_hook('post_instruction', hook)
+        self.cache.run(4)
+        self.machine.remove_hook('post_instruction', hook)
+        self.cache.run(6)
+        assert self.machine.v[2] == 7
+
+    def test_invalidate_when_write_raises(self):
+        debugger = Debugger(self.machine)
+        debugger.watch(0x200)
+        self.machine.load_rom(
+            b'\x60\x01\xa2\x00\x60\x60\x61\x07\xf1\x55\x12\x00')
+        with pytest.raises(WatchpointHit):
+            self.cache.run(6)
+        assert self.cache.invalidations == 1
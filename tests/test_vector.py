@@ -0,0 +1,77 @@
+import random
+
+from mock import Mock
+
+from chip8.core import Chip8
+from chip8.vector import DECODE_ERROR, OK, STACK_ERROR, VectorChip8
+
+
+def random_rom(seed):
+    """A ROM of instructions that neither fault nor depend on randomness."""
+    rng = random.Random(seed)
+    opcodes = []
+    for _ in range(64):
+        x = rng.randrange(15)
+        y = rng.randrange(15)
+        opcodes.append(rng.choice([
+            0x6000 | x << 8 | rng.randrange(256),
+            0x7000 | x << 8 | rng.randrange(256),
+            0x8000 | x << 8 | y << 4 | rng.choice([0, 1, 2, 3, 4, 6, 0xe]),
+            0x3000 | x << 8 | rng.randrange(2),
+            0xa300 | rng.randrange(256),
+            0xd000 | x << 8 | y << 4 | rng.randrange(16),
+            0xf01e | x << 8,
+            0xf065 | x << 8,
+        ]))
+    opcodes += [0x1200, 0x1200]
+    return b''.join(opcode.to_bytes(2, 'big') for opcode in opcodes)
+
+
+def state(machine):
+    return (bytes(machine.memory), bytes(machine.v), machine.register_i,
+            machine.pc, machine.framebuffer, machine.cycles)
+
+
+class TestVectorChip8:
+
+    def test_lanes_match_chip8(self):
+        lanes = 8
+        vector = VectorChip8(lanes)
+        machines = []
+        for lane in range(lanes):
+            rom = random_rom(lane)
+            vector.load_rom(rom, lane)
+            machine = Chip8(Mock())
+            machine.load_rom(rom)
+            machines.append(machine)
+
+        vector.run(300)
+        for machine in machines:
+            machine.run(300)
+
+        assert (vector.fault == OK).all()
+        for lane, machine in enumerate(machines):
+            assert state(vector.to_chip8(lane, Mock())) == state(machine)
+
+    def test_faults(self):
+        vector = VectorChip8(3)
+        vector.load_rom(b'\x80\x0f', 0)
+        vector.load_rom(b'\x00\xee\x12\x00', 1)
+        vector.load_rom(b'\x22\x00', 2)
+        vector.stack_ptr[1] = -17
+        vector.run(20)
+        assert vector.fault.tolist() == [DECODE_ERROR, STACK_ERROR, STACK_ERROR]
+        assert vector.cycles.tolist() == [0, 0, 15]
+
+    def test_round_trip(self):
+        machine = Chip8(Mock())
+        machine.load_rom(b'\x60\x05\xf0\x15\x12\x02')
+        machine.register_i = 0x300
+        vector = VectorChip8(2)
+        vector.from_chip8(1, machine)
+        vector.run(2)
+        vector.tick_timers()
+        exported = vector.to_chip8(1, Mock())
+        assert exported.dt == 4
+        assert exported.v[0] == 5
+        assert exported.register_i == 0x300